@@ -0,0 +1,332 @@
+"""
+Benchmark Module
+Times the retrieval and adaptation entry points across case base sizes:
+- retrieve_most_similar, retrieve_top_k, run_query (both domains)
+- retrieve_top_k through prototype clusters (case_clusters.py), by an
+  early-termination scan and, for car, through posting lists (inverted_index.py)
+- adapt_classification (car) and adapt_regression (energy)
+- knn_predict and knn_predict_batch (k-NN prediction mode)
+- baseline and tuned weights, learning on/off for run_query
+
+Prediction ops also report their accuracy (car) or MAE (energy) on the
+benchmark queries.
+
+Case bases and queries come from synthetic_data (seeded), so any size works.
+
+Results are written as JSON; --compare flags regressions against a saved
+baseline file.
+
+Usage:
+    python benchmark.py --sizes 1000,10000 --output bench.json
+    python benchmark.py --sizes 1000,10000 --compare bench.json
+"""
+
+from typing import List, Dict, Optional, Callable, Tuple
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+from data_loader import Case
+from car_cbr import CarCBRSystem
+from energy_cbr import EnergyCBRSystem
+from evaluation import Evaluator
+from synthetic_data import make_generator, generate_cases, generate_queries
+
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+WEIGHT_MODES = ['baseline', 'tuned']
+
+
+def time_call(fn: Callable, queries: List[Case], repeats: int,
+              max_seconds: float) -> Dict[str, float]:
+    """
+    Time fn(query) over the query list.
+
+    Each query is timed individually; repetition stops early once
+    max_seconds is spent (at least one call is always made).
+
+    Returns:
+        Dictionary with call count and mean/median/min/max seconds per call
+    """
+    timings = []
+    budget_start = time.perf_counter()
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            fn(query)
+            timings.append(time.perf_counter() - start)
+            if time.perf_counter() - budget_start > max_seconds:
+                break
+        else:
+            continue
+        break
+
+    timings = np.array(timings)
+    return {
+        'calls': int(len(timings)),
+        'mean_s': float(np.mean(timings)),
+        'median_s': float(np.median(timings)),
+        'min_s': float(np.min(timings)),
+        'max_s': float(np.max(timings)),
+    }
+
+
+def time_batch(fn: Callable, queries: List[Case], repeats: int,
+               max_seconds: float) -> Dict[str, float]:
+    """
+    Time fn(queries) over the whole query list, reported per query.
+    
+    Returns:
+        Same keys as time_call (seconds per query)
+    """
+    timings = []
+    budget_start = time.perf_counter()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(queries)
+        timings.append((time.perf_counter() - start) / len(queries))
+        if time.perf_counter() - budget_start > max_seconds:
+            break
+    
+    timings = np.array(timings)
+    return {
+        'calls': int(len(timings) * len(queries)),
+        'mean_s': float(np.mean(timings)),
+        'median_s': float(np.median(timings)),
+        'min_s': float(np.min(timings)),
+        'max_s': float(np.max(timings)),
+    }
+
+
+def prediction_quality(domain: str, predictions: List, queries: List[Case]) -> Dict[str, float]:
+    """Accuracy (car) or MAE (energy) of predictions against the query solutions."""
+    actuals = [q.solution for q in queries]
+    if domain == 'car':
+        return {'accuracy': Evaluator.calculate_accuracy(predictions, actuals)}
+    return {'mae': Evaluator.calculate_mae(predictions, actuals)}
+
+
+def _domain_setup(domain: str) -> Tuple[Callable, Callable]:
+    """Return (system factory, adaptation function) for a domain."""
+    if domain == 'car':
+        return (CarCBRSystem,
+                lambda s, retrieved, query: s.adapt_classification(retrieved, query, use_voting=True))
+    if domain == 'energy':
+        return (EnergyCBRSystem,
+                lambda s, retrieved, query: s.adapt_regression(retrieved, query, use_multiple_rules=True))
+    raise ValueError(f"Unknown domain: {domain}")
+
+
+def benchmark_domain(domain: str, sizes: List[int], n_queries: int = 5, repeats: int = 3,
+                     max_seconds: float = 10.0, random_seed: int = 42) -> List[Dict]:
+    """
+    Benchmark one domain across case base sizes and weight modes.
+
+    Args:
+        domain: 'car' or 'energy'
+        sizes: Case base sizes to benchmark
+        n_queries: Number of distinct queries per measurement
+        repeats: Passes over the query list
+        max_seconds: Time budget per measurement
+        random_seed: Seed for case base and query sampling
+
+    Returns:
+        List of result records
+    """
+    factory, adapt = _domain_setup(domain)
+    adapt_name = 'adapt_classification' if domain == 'car' else 'adapt_regression'
+    generator = make_generator(domain)
+    queries = list(generate_queries(domain, n_queries, random_seed, generator=generator))
+    records = []
+
+    for size in sizes:
+        case_base = list(generate_cases(domain, size, random_seed, generator=generator))
+        system = factory()
+        system.set_case_base(case_base, verbose=False)
+
+        for mode in WEIGHT_MODES:
+            tuned = mode == 'tuned'
+            if tuned:
+                system.set_tuned_mode()
+            else:
+                system.set_baseline_mode()
+
+            def record(op: str, fn: Callable, learning: Optional[bool] = None,
+                       predict: Optional[Callable] = None, batch: bool = False):
+                timer = time_batch if batch else time_call
+                stats = timer(fn, queries, repeats, max_seconds)
+                if predict is not None:
+                    stats.update(prediction_quality(domain, predict(), queries))
+                records.append({'domain': domain, 'op': op, 'size': size, 'weights': mode,
+                                'learning': learning, **stats})
+                quality = ''.join(f"  {name}={stats[name]:.4f}" for name in ('accuracy', 'mae')
+                                  if name in stats)
+                print(f"  {domain:<7} {op:<24} n={size:<9} {mode:<9} "
+                      f"learning={str(learning):<5} median={stats['median_s'] * 1000:10.3f} ms"
+                      f"{quality}")
+
+            record('retrieve_most_similar',
+                   lambda q: system.retrieve_most_similar(q, use_weights=tuned))
+            record('retrieve_top_k',
+                   lambda q: system.retrieve_top_k(q, k=3, use_weights=tuned))
+            system.enable_clustering()
+            system.case_clusters()  # build outside the timed calls
+            record('retrieve_top_k_clustered',
+                   lambda q: system.retrieve_top_k(q, k=3, use_weights=tuned))
+            system.disable_clustering()
+            system.set_scan_mode('early')
+            record('retrieve_top_k_early',
+                   lambda q: system.retrieve_top_k(q, k=3, use_weights=tuned))
+            system.set_scan_mode('full')
+            if domain == 'car':
+                system.enable_inverted_index()
+                system.inverted_index()  # build outside the timed calls
+                record('retrieve_top_k_inverted',
+                       lambda q: system.retrieve_top_k(q, k=3, use_weights=tuned))
+                system.disable_inverted_index()
+
+            retrieved = {id(q): system.retrieve_most_similar(q, use_weights=tuned)[0] for q in queries}
+            record(adapt_name, lambda q: adapt(system, retrieved[id(q)], q),
+                   predict=lambda: [adapt(system, retrieved[id(q)], q) for q in queries])
+            record('knn_predict', lambda q: system.knn_predict(q, use_weights=tuned),
+                   predict=lambda: [system.knn_predict(q, use_weights=tuned) for q in queries])
+            record('knn_predict_batch', lambda qs: system.knn_predict_batch(qs, use_weights=tuned),
+                   batch=True)
+
+            def adapt_fn(r, q, s):
+                return adapt(s, r, q)
+
+            for learning in (False, True):
+                def query_fn(q):
+                    result = system.run_query(system.case_base, q, tuned=tuned,
+                                              adapt_fn=adapt_fn if tuned else None,
+                                              learning=learning)
+                    return result[0]
+                record('run_query', query_fn, learning)
+                if learning:
+                    # Drop retained cases so later measurements see the same size
+                    system.case_base = system.case_base[:size]
+                    system.set_case_base(system.case_base, verbose=False)
+
+    return records
+
+
+def environment_info() -> Dict:
+    """Describe the machine and code version the benchmark ran on."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'git_commit': commit,
+    }
+
+
+def run_benchmarks(domains: List[str], sizes: List[int], **kwargs) -> Dict:
+    """
+    Run the benchmark suite.
+
+    Returns:
+        Dictionary with 'environment' and 'results'
+    """
+    results = []
+    for domain in domains:
+        print(f"\n=== Benchmarking {domain} ===")
+        results.extend(benchmark_domain(domain, sizes, **kwargs))
+    return {'environment': environment_info(), 'results': results}
+
+
+def _result_key(record: Dict) -> tuple:
+    return (record['domain'], record['op'], record['size'], record['weights'], record['learning'])
+
+
+def compare_results(current: Dict, baseline: Dict, threshold: float = 0.10) -> List[Dict]:
+    """
+    Compare median timings against a baseline run.
+
+    Args:
+        current: Results of this run
+        baseline: Previously saved results
+        threshold: Relative slowdown above which a result is a regression
+
+    Returns:
+        List of comparison records (ratio = current / baseline median)
+    """
+    baseline_by_key = {_result_key(r): r for r in baseline['results']}
+    comparisons = []
+    for record in current['results']:
+        old = baseline_by_key.get(_result_key(record))
+        if old is None or old['median_s'] <= 0:
+            continue
+        ratio = record['median_s'] / old['median_s']
+        comparisons.append({
+            'key': _result_key(record),
+            'baseline_s': old['median_s'],
+            'current_s': record['median_s'],
+            'ratio': ratio,
+            'regression': ratio > 1.0 + threshold,
+        })
+    return comparisons
+
+
+def print_comparison(comparisons: List[Dict], threshold: float):
+    """Print a comparison table, marking regressions."""
+    print("\n" + "="*90)
+    print(f"COMPARISON AGAINST BASELINE (regression threshold: +{threshold * 100:.0f}%)")
+    print("="*90)
+    for c in comparisons:
+        domain, op, size, weights, learning = c['key']
+        flag = "REGRESSION" if c['regression'] else ("faster" if c['ratio'] < 1.0 else "ok")
+        print(f"{domain:<7} {op:<24} n={size:<9} {weights:<9} learning={str(learning):<5} "
+              f"{c['baseline_s'] * 1000:10.3f} -> {c['current_s'] * 1000:10.3f} ms "
+              f"(x{c['ratio']:.2f}) {flag}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark CBR retrieval and adaptation")
+    parser.add_argument('--domains', default='car,energy', help="Comma-separated: car,energy")
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help="Comma-separated case base sizes")
+    parser.add_argument('--queries', type=int, default=5, help="Distinct queries per measurement")
+    parser.add_argument('--repeats', type=int, default=3, help="Passes over the query list")
+    parser.add_argument('--max-seconds', type=float, default=10.0,
+                        help="Time budget per measurement")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Write results JSON to this file")
+    parser.add_argument('--compare', help="Baseline results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Relative slowdown flagged as a regression")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        [d.strip() for d in args.domains.split(',') if d.strip()],
+        [int(s) for s in args.sizes.split(',') if s.strip()],
+        n_queries=args.queries, repeats=args.repeats,
+        max_seconds=args.max_seconds, random_seed=args.seed)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        comparisons = compare_results(results, baseline, args.threshold)
+        print_comparison(comparisons, args.threshold)
+        if any(c['regression'] for c in comparisons):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""
+Bulk Scoring Module
+Scores query files against a case base without editing any source:
+- Reads queries in car.data / ENB2012 column layout, CSV with a header row,
+  or JSONL, one chunk at a time
+- Each chunk goes through the batch retrieval and adaptation path
+  (CBRSystem.solve_batch)
+- Streams the prediction, top-k neighbour ids (case base row numbers) and
+  their similarities for every query to a CSV or JSONL output file
+- With --explain, also each neighbour's per-feature similarity
+  contributions, kept from the same scoring pass
+
+Memory stays constant in the number of queries: only one chunk of queries
+and its scores are held at a time.
+
+Usage:
+    python bulk_score.py car queries.data --output predictions.csv
+    python bulk_score.py energy queries.csv --output predictions.jsonl --adapt knn --k 5
+"""
+
+from typing import List, Dict, Iterator, Optional, Any, Tuple
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+import numpy as np
+from data_loader import Case, DataLoader
+from car_cbr import CarCBRSystem
+from energy_cbr import EnergyCBRSystem
+
+
+CAR_FEATURES = ['buying', 'maint', 'doors', 'persons', 'lug_boot', 'safety']
+ENERGY_FEATURES = {
+    'X1': 'relative_compactness',
+    'X2': 'surface_area',
+    'X3': 'wall_area',
+    'X4': 'roof_area',
+    'X5': 'orientation',
+    'X6': 'glazing_area',
+    'X7': 'glazing_area_distribution',
+    'X8': 'glazing_type',
+}
+
+# Column layout of headerless files (car.data / ENB2012), solution column last
+LAYOUTS = {
+    'car': CAR_FEATURES + ['class'],
+    'energy': list(ENERGY_FEATURES) + ['Y1', 'Y2'],
+}
+SOLUTION_COLUMNS = {'car': ('class', 'solution'), 'energy': ('Y1', 'heating_load', 'solution')}
+
+DEFAULT_CASE_BASES = {'car': 'car.data', 'energy': 'ENB2012_data.xlsx'}
+DEFAULT_CHUNK_SIZE = 4096
+
+
+def detect_format(filepath: str) -> str:
+    """'jsonl', 'csv' (header row) or 'data' (headerless column layout) from the extension."""
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension in ('.jsonl', '.json'):
+        return 'jsonl'
+    if extension == '.csv':
+        return 'csv'
+    if extension == '.xlsx':
+        raise ValueError(f"{filepath}: Excel files cannot be streamed; save the sheet as .csv")
+    return 'data'
+
+
+def _query_from_record(domain: str, record: Dict[str, Any]) -> Case:
+    """Build a query from a column -> value record (feature names or ENB2012 X names)."""
+    if domain == 'car':
+        features = {name: str(record[name]) for name in CAR_FEATURES}
+    else:
+        features = {long: float(record[long] if long in record else record[short])
+                    for short, long in ENERGY_FEATURES.items()}
+    solution = None
+    for column in SOLUTION_COLUMNS[domain]:
+        if record.get(column) not in (None, ''):
+            solution = record[column] if domain == 'car' else float(record[column])
+            break
+    return Case(features=features, solution=solution)
+
+
+def iter_queries(domain: str, filepath: str, input_format: str = 'auto') -> Iterator[Case]:
+    """
+    Stream queries from a file, one line at a time.
+
+    Args:
+        domain: 'car' or 'energy'
+        filepath: Query file
+        input_format: 'data', 'csv', 'jsonl' or 'auto' (by extension)
+
+    Yields:
+        Query cases (solution set when the file has a solution column)
+    """
+    input_format = detect_format(filepath) if input_format == 'auto' else input_format
+    with open(filepath, newline='') as f:
+        if input_format == 'jsonl':
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if 'features' in record:
+                        record = {**record['features'], 'solution': record.get('solution')}
+                    yield _query_from_record(domain, record)
+            return
+
+        reader = csv.reader(f)
+        columns = LAYOUTS[domain]
+        if input_format == 'csv':
+            columns = [name.strip() for name in next(reader)]
+        for row in reader:
+            if row:
+                yield _query_from_record(domain, dict(zip(columns, (v.strip() for v in row))))
+
+
+def _chunked(queries: Iterator[Case], size: int) -> Iterator[List[Case]]:
+    chunk = []
+    for query in queries:
+        chunk.append(query)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def load_case_base(domain: str, filepath: Optional[str] = None
+                   ) -> Tuple[List[Case], Optional[Dict[str, Tuple[float, float]]]]:
+    """
+    Load a case base file.
+
+    Returns:
+        Tuple of (cases, z-score parameters per energy feature, or None for car)
+    """
+    filepath = filepath or DEFAULT_CASE_BASES[domain]
+    if domain == 'car':
+        return DataLoader.load_car_data(filepath), None
+    cases = DataLoader.energy_cases_from_table(DataLoader.read_energy_table(filepath))
+    names = list(cases[0].features.keys())
+    return DataLoader.normalize_features(cases, names, method='zscore')
+
+
+def normalize_query(query: Case, params: Dict[str, Tuple[float, float]]) -> Case:
+    """Z-score a raw energy query with the case base's parameters (as normalize_features)."""
+    features = dict(query.features)
+    for name, (mean, std) in params.items():
+        if std > 0:
+            features[name] = (features[name] - mean) / std
+    return Case(features=features, solution=query.solution)
+
+
+def make_system(domain: str, cases: List[Case], weights: str = 'tuned', k: int = 3):
+    """
+    Build a system over a case base.
+
+    Returns:
+        Tuple of (system, use_weights)
+    """
+    system = CarCBRSystem() if domain == 'car' else EnergyCBRSystem()
+    system.knn_k = k
+    system.set_case_base(cases, verbose=False)
+    if weights == 'tuned':
+        system.set_tuned_mode()
+    else:
+        system.set_baseline_mode()
+    return system, weights == 'tuned'
+
+
+def adapt_function(domain: str, adapt: str):
+    """solve_batch adapt_fn for 'none', 'rules' or 'knn'."""
+    if adapt == 'knn':
+        return lambda retrieved, query, s: s.adapt_knn(retrieved, query)
+    if adapt == 'rules':
+        if domain == 'car':
+            return lambda retrieved, query, s: s.adapt_classification(retrieved, query, use_voting=True)
+        return lambda retrieved, query, s: s.adapt_regression(retrieved, query, use_multiple_rules=True)
+    return None
+
+
+class _PredictionWriter:
+    """Writes one prediction per query as CSV or JSONL."""
+
+    def __init__(self, f, output_format: str, explain: bool = False):
+        self.f = f
+        self.output_format = output_format
+        self.explain = explain
+        if output_format == 'csv':
+            self.writer = csv.writer(f)
+            header = ['query', 'prediction', 'actual', 'neighbours', 'similarities']
+            self.writer.writerow(header + ['contributions'] if explain else header)
+
+    def write(self, number: int, query: Case, solution: Any, neighbours: np.ndarray,
+              similarities: np.ndarray, contributions: Optional[List[Dict[str, float]]] = None):
+        solution = solution if isinstance(solution, str) else float(solution)
+        if self.output_format == 'jsonl':
+            record = {'query': number, 'prediction': solution, 'actual': query.solution,
+                      'neighbours': neighbours.tolist(), 'similarities': similarities.tolist()}
+            if self.explain:
+                record['contributions'] = contributions
+            self.f.write(json.dumps(record) + '\n')
+        else:
+            row = [number, solution, '' if query.solution is None else query.solution,
+                   ';'.join(map(str, neighbours.tolist())),
+                   ';'.join(f'{s:.6f}' for s in similarities.tolist())]
+            if self.explain:
+                # One JSON object per neighbour, in neighbour order
+                row.append(json.dumps([{name: round(value, 6) for name, value in parts.items()}
+                                       for parts in contributions]))
+            self.writer.writerow(row)
+
+
+def score_file(domain: str, query_file: str, output_file: str, case_base_file: Optional[str] = None,
+               input_format: str = 'auto', weights: str = 'tuned', adapt: str = 'rules',
+               k: int = 3, chunk_size: int = DEFAULT_CHUNK_SIZE,
+               normalized: bool = False, explain: bool = False) -> Dict[str, Any]:
+    """
+    Score every query in a file and stream the predictions to output_file.
+
+    Args:
+        domain: 'car' or 'energy'
+        query_file: Queries (see iter_queries)
+        output_file: Predictions; JSONL for .jsonl/.json, otherwise CSV
+        case_base_file: Case base (default: the full dataset)
+        input_format: Query file format
+        weights: 'tuned' or 'baseline'
+        adapt: 'none', 'rules' or 'knn'
+        k: Neighbours reported per query (and used by 'knn')
+        chunk_size: Queries read and scored per chunk
+        normalized: Energy queries are already z-scored (as in query_test.py)
+        explain: Also write each neighbour's per-feature contributions
+
+    Returns:
+        Report dictionary with counts, timings, throughput and (when the
+        queries carry solutions) accuracy or MAE/RMSE
+    """
+    start = time.perf_counter()
+    cases, params = load_case_base(domain, case_base_file)
+    system, use_weights = make_system(domain, cases, weights, k)
+    adapt_fn = adapt_function(domain, adapt)
+    load_seconds = time.perf_counter() - start
+
+    n_queries = n_labelled = correct = 0
+    abs_error = sq_error = 0.0
+    start = time.perf_counter()
+    output_format = 'jsonl' if detect_format(output_file) == 'jsonl' else 'csv'
+    with open(output_file, 'w', newline='') as f:
+        writer = _PredictionWriter(f, output_format, explain)
+        for chunk in _chunked(iter_queries(domain, query_file, input_format), chunk_size):
+            if params is not None and not normalized:
+                chunk = [normalize_query(query, params) for query in chunk]
+            results = system.solve_batch(chunk, adapt_fn=adapt_fn, k=k, use_weights=use_weights,
+                                         with_contributions=explain)
+            for query, result in zip(chunk, results):
+                solution = result[0]
+                writer.write(n_queries, query, *result)
+                n_queries += 1
+                if query.solution is not None:
+                    n_labelled += 1
+                    if domain == 'car':
+                        correct += solution == query.solution
+                    else:
+                        abs_error += abs(solution - query.solution)
+                        sq_error += (solution - query.solution) ** 2
+    score_seconds = time.perf_counter() - start
+
+    report = {
+        'domain': domain, 'queries': n_queries, 'case_base_size': len(cases),
+        'weights': weights, 'adapt': adapt, 'k': k, 'output': output_file,
+        'load_seconds': load_seconds, 'score_seconds': score_seconds,
+        'queries_per_second': n_queries / score_seconds if score_seconds > 0 else float('inf'),
+        'labelled': n_labelled,
+    }
+    if n_labelled:
+        if domain == 'car':
+            report['accuracy'] = correct / n_labelled * 100
+        else:
+            report['mae'] = abs_error / n_labelled
+            report['rmse'] = math.sqrt(sq_error / n_labelled)
+    return report
+
+
+def print_bulk_report(report: Dict[str, Any]):
+    """Print counts, timing, throughput and quality of a score_file run."""
+    print("\n" + "="*60)
+    print("BULK SCORING")
+    print("="*60)
+    print(f"  Domain:       {report['domain']} ({report['weights']} weights, adapt={report['adapt']}, "
+          f"k={report['k']})")
+    print(f"  Case base:    {report['case_base_size']} cases (loaded in {report['load_seconds']:.2f}s)")
+    print(f"  Queries:      {report['queries']} -> {report['output']}")
+    print(f"  Time:         {report['score_seconds']:.2f}s")
+    print(f"  Throughput:   {report['queries_per_second']:,.0f} queries/s")
+    if 'accuracy' in report:
+        print(f"  Accuracy:     {report['accuracy']:.2f}% ({report['labelled']} labelled queries)")
+    elif 'mae' in report:
+        print(f"  MAE / RMSE:   {report['mae']:.4f} / {report['rmse']:.4f} "
+              f"({report['labelled']} labelled queries)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Score a file of queries against a case base")
+    parser.add_argument('domain', choices=['car', 'energy'])
+    parser.add_argument('queries', help="Query file (.data layout, .csv with header, or .jsonl)")
+    parser.add_argument('--output', required=True, help="Predictions file (.csv or .jsonl)")
+    parser.add_argument('--case-base', help="Case base file (default: car.data / ENB2012_data.xlsx)")
+    parser.add_argument('--input-format', choices=['auto', 'data', 'csv', 'jsonl'], default='auto')
+    parser.add_argument('--weights', choices=['tuned', 'baseline'], default='tuned')
+    parser.add_argument('--adapt', choices=['none', 'rules', 'knn'], default='rules')
+    parser.add_argument('--k', type=int, default=3, help="Neighbours reported per query")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--normalized', action='store_true',
+                        help="Energy query values are already z-scored")
+    parser.add_argument('--explain', action='store_true',
+                        help="Write per-feature similarity contributions of each neighbour")
+    parser.add_argument('--report', help="Also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = score_file(args.domain, args.queries, args.output, args.case_base,
+                        input_format=args.input_format, weights=args.weights, adapt=args.adapt,
+                        k=args.k, chunk_size=args.chunk_size, normalized=args.normalized,
+                        explain=args.explain)
+    print_bulk_report(report)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,9 +3,40 @@ Car Classification CBR System
 Implements case-based reasoning for car evaluation classification.
 """
 
-from typing import List, Tuple, Optional
+from typing import List, Dict, Tuple, Optional
+from dataclasses import dataclass
+import time
+import numpy as np
 from data_loader import Case
-from cbr_system import CBRSystem
+from cbr_system import CBRSystem, top_k_indices, pin_case_base
+from inverted_index import InvertedIndex
+
+
+@dataclass
+class NeighbourVote:
+    """
+    Result of one fused retrieval pass: top-1, top-k and class votes.
+    
+    votes maps each class among the neighbours to [count, similarity sum],
+    in order of first appearance among the neighbours.
+    """
+    query: Case
+    neighbours: List[Tuple[Case, float]]
+    votes: Dict[str, List[float]]
+    use_weights: bool
+    weights: Dict[str, float]
+    case_base: List[Case]
+    case_base_size: int
+    
+    @property
+    def best(self) -> Tuple[Case, float]:
+        """Most similar case and its similarity."""
+        return self.neighbours[0]
+    
+    @property
+    def majority_class(self) -> str:
+        """Class with the most votes (first seen wins ties, as Counter does)."""
+        return max(self.votes, key=lambda label: self.votes[label][0])
 
 
 class CarCBRSystem(CBRSystem):
@@ -53,6 +84,11 @@ class CarCBRSystem(CBRSystem):
         }
         
         super().__init__(feature_weights=baseline_weights, feature_types=feature_types)
+        
+        # Neighbours consulted by the voting rule
+        self.vote_k = 3
+        # Retrieve through posting lists instead of full scans (see enable_inverted_index)
+        self.inverted_retrieval = False
     
     def set_tuned_mode(self):
         """Switch to tuned weights."""
@@ -69,8 +105,128 @@ class CarCBRSystem(CBRSystem):
             'safety': 1.0
         }
     
+    def enable_inverted_index(self):
+        """
+        Retrieve through posting lists per (feature, value) (see inverted_index.py).
+        
+        retrieve_most_similar, retrieve_top_k, retrieve_and_vote (so the
+        voting rule), knn_predict and run_query's retrieval accumulate
+        scores over the distinct feature combinations and prune those that
+        cannot reach the k-th best, using the current weights (tuned_weights
+        in tuned mode). Results equal a full scan. The posting lists are
+        built on first use and follow add_case/remove_cases.
+        """
+        self.inverted_retrieval = True
+    
+    def disable_inverted_index(self):
+        """Go back to full scans (or clustered retrieval, if enabled)."""
+        self.inverted_retrieval = False
+    
+    def inverted_index(self) -> Optional[InvertedIndex]:
+        """
+        Return the posting lists of the current case base's index.
+        
+        Returns:
+            The InvertedIndex, or None when the case base cannot be indexed
+        """
+        index = self.case_index()
+        if index is None:
+            return None
+        inverted = index.views.get('inverted')
+        if inverted is None:
+            with self._write_lock:
+                inverted = index.views.get('inverted')
+                if inverted is None:
+                    try:
+                        inverted = InvertedIndex(index)
+                    except ValueError:
+                        return None
+                    index.views['inverted'] = inverted
+        return inverted
+    
+    def _pruned_top_k(self, query: Case, k: int,
+                      use_weights: bool) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Top-k through the posting lists when enabled, else as CBRSystem does."""
+        if self.inverted_retrieval and self.score_provider is None and not self._memo_applies(query, use_weights):
+            inverted = self.inverted_index()
+            if inverted is not None:
+                weights = self.feature_weights if use_weights and self.feature_weights else None
+                try:
+                    rows, scores, evaluated = inverted.top_k(query, weights, k)
+                except ValueError:
+                    rows = None
+                if rows is not None:
+                    inst = self.instrumentation
+                    if inst is not None:
+                        inst.count('scans')
+                        inst.count('similarity_evaluations', evaluated)
+                    return rows, scores
+        return super()._pruned_top_k(query, k, use_weights)
+    
+    @pin_case_base
+    def retrieve_and_vote(self, query: Case, k: int = 3,
+                          use_weights: bool = True, *,
+                          case_base: Optional[List[Case]] = None) -> NeighbourVote:
+        """
+        Retrieve the top-k neighbours and tally their class votes in one pass.
+        
+        The best neighbour is the case retrieve_most_similar returns, and the
+        neighbours are those of retrieve_top_k (same order and tie handling).
+        
+        Args:
+            query: Query case
+            k: Number of neighbours
+            use_weights: Whether to use weighted similarity
+            case_base: Case base to use instead of self.case_base (e.g. a handle)
+            
+        Returns:
+            NeighbourVote with neighbours and per-class [count, similarity sum]
+        """
+        if not self.case_base:
+            raise ValueError("Case base is empty")
+        
+        pruned = self._pruned_top_k(query, k, use_weights)
+        if pruned is not None:
+            ranked = zip(pruned[0].tolist(), pruned[1].tolist())
+        else:
+            scores = self._scores_for(query, use_weights)
+            ranked = ((i, float(scores[i])) for i in top_k_indices(scores, k).tolist())
+        neighbours = []
+        votes: Dict[str, List[float]] = {}
+        for i, similarity in ranked:
+            case = self.case_base[i]
+            neighbours.append((case, similarity))
+            tally = votes.get(case.solution)
+            if tally is None:
+                votes[case.solution] = [1, similarity]
+            else:
+                tally[0] += 1
+                tally[1] += similarity
+        return NeighbourVote(query=query, neighbours=neighbours, votes=votes,
+                             use_weights=use_weights, weights=self.feature_weights,
+                             case_base=self.case_base, case_base_size=len(self.case_base))
+    
+    def _vote_for(self, query: Case) -> NeighbourVote:
+        """
+        Weighted votes for a query, tallied only when adaptation asks for them.
+        
+        retrieve_and_vote reuses run_query's scores while they apply, and the
+        vote is kept (per thread) for the next adaptation of the same query.
+        """
+        vote = getattr(self._local, 'last_vote', None)
+        if (vote is not None and vote.query is query and vote.use_weights
+                and vote.weights is self.feature_weights
+                and vote.case_base is self.case_base
+                and vote.case_base_size == len(self.case_base)
+                and len(vote.neighbours) == min(self.vote_k, len(self.case_base))):
+            return vote
+        vote = self._local.last_vote = self.retrieve_and_vote(query, k=self.vote_k, use_weights=True)
+        return vote
+    
+    @pin_case_base
     def adapt_classification(self, retrieved_case: Case, query: Case,
-                            use_voting: bool = True) -> str:
+                            use_voting: bool = True, *,
+                            case_base: Optional[List[Case]] = None) -> str:
         """
         Adapt retrieved case solution for classification.
         
@@ -83,30 +239,36 @@ class CarCBRSystem(CBRSystem):
             retrieved_case: Most similar case from case base
             query: Query case
             use_voting: Whether to use voting rule
+            case_base: Case base to use instead of self.case_base (e.g. a handle)
             
         Returns:
             Adapted class prediction
         """
+        inst = self.instrumentation
+        if inst is not None:
+            t = time.perf_counter()
         
         # Rule 1: Feature-based refinement
         adapted_class = self._feature_refinement(retrieved_case, query)
+        if inst is not None:
+            t = inst.lap('adapt.feature_refinement', t)
         
         if not use_voting:
             return adapted_class
         
-        # Rule 2: Multi-case voting for confidence
-        top_3 = self.retrieve_top_k(query, k=3, use_weights=True)
-        voted_classes = [case.solution for case, sim in top_3]
+        # Rule 2: Multi-case voting for confidence (top-3, from the fused retrieval)
+        vote = self._vote_for(query)
+        top_case, top_similarity = vote.best
+        if inst is not None:
+            inst.lap('adapt.voting', t)
         
         # Rule 3: Confidence threshold
-        if len(set(voted_classes)) == 1 and top_3[0][1] > 0.75:
+        if len(vote.votes) == 1 and top_similarity > 0.75:
             # All cases vote the same AND similarity is high
-            return voted_classes[0]
-        elif len([c for c in voted_classes if c == voted_classes[0]]) >= 2:
+            return top_case.solution
+        elif vote.votes[top_case.solution][0] >= 2:
             # Majority vote
-            from collections import Counter
-            counts = Counter(voted_classes)
-            return counts.most_common(1)[0][0]
+            return vote.majority_class
         else:
             # No consensus, use feature refinement
             return adapted_class
@@ -0,0 +1,278 @@
+"""
+Case Clusters Module
+Two-stage retrieval over a CaseIndex:
+- Cases are partitioned into clusters around prototype cases (a seeded
+  sample); each case joins the cluster of its most similar prototype
+- A query is first scored against the prototypes, and only the cases of
+  the most promising clusters are scored
+- Exact mode: every cluster keeps the categorical values and numerical
+  ranges of its cases, which bound the similarity of any of its cases to
+  the query; clusters are searched until no unvisited cluster can reach
+  the current k-th best score, so results equal a full scan
+- The clusters follow their index: extend() assigns new cases to the
+  nearest prototype, delete() drops them, fork() shares the clusters
+- Forks share the member lists and bounds, which only grow: a version
+  ignores members at or past its own size, and only the version that
+  assigned last appends in place (others copy first), so extending a fork
+  costs O(1) per case plus the prototype scoring
+"""
+
+from typing import List, Dict, Optional, Tuple
+from dataclasses import dataclass
+import numpy as np
+from data_loader import Case
+from case_index import CaseIndex
+from case_store import AppendArray
+
+
+# Cases assigned to prototypes per batch (bounds the similarity block size)
+ASSIGN_BLOCK_ELEMENTS = 1 << 18
+
+
+@dataclass
+class ClusterSettings:
+    """
+    Settings of CBRSystem's clustered retrieval (see CBRSystem.enable_clustering).
+
+    Attributes:
+        n_clusters: Number of clusters (None: square root of the case base size)
+        n_probe: Clusters searched first (those with the most similar prototypes)
+        exact: Keep searching while a cluster's upper bound can reach the k-th best
+        seed: Seed of the prototype sample
+    """
+    n_clusters: Optional[int] = None
+    n_probe: int = 1
+    exact: bool = True
+    seed: int = 0
+
+
+class CaseClusters:
+    """
+    Partition of the cases of a CaseIndex into prototype clusters.
+
+    Positions are those of the index (live cases). Prototypes are copies of
+    cases, so they stay valid when their case is removed. Bounds only widen
+    (removing cases leaves them unchanged), so they stay valid too, also
+    for older versions sharing them.
+    """
+
+    def __init__(self, index: CaseIndex, n_clusters: Optional[int] = None,
+                 weights: Optional[Dict[str, float]] = None, seed: int = 0):
+        """
+        Cluster the cases of an index.
+
+        Args:
+            index: Index to cluster (not registered in index.views here)
+            n_clusters: Number of clusters (None: square root of the index size)
+            weights: Feature weights used to assign cases to prototypes
+            seed: Seed of the prototype sample
+        """
+        n = len(index)
+        self.requested = n_clusters
+        self.seed = seed
+        count = min(n, n_clusters or max(1, int(round(np.sqrt(n)))))
+        picks = np.sort(np.random.default_rng(seed).choice(n, count, replace=False))
+        self.index = index
+        self.weights = dict(weights) if weights else None
+        self.prototypes = CaseIndex(index.system, [index.cases[i] for i in picks.tolist()])
+
+        # Cases per cluster (increasing positions), their number (at least the
+        # version's own), and each cluster's categorical codes / numerical ranges.
+        # Shared by forks: _tail[0] counts the positions assigned to them
+        self.members: List[AppendArray] = [AppendArray() for _ in range(count)]
+        self.sizes = np.zeros(count, dtype=np.int64)
+        self._tail = [0]
+        self.present: Dict[str, np.ndarray] = {}
+        self.low: Dict[str, np.ndarray] = {}
+        self.high: Dict[str, np.ndarray] = {}
+        for name in index.feature_names:
+            if index.numerical[name]:
+                self.low[name] = np.full(count, np.inf)
+                self.high[name] = np.full(count, -np.inf)
+            else:
+                self.present[name] = np.zeros((count, 0), dtype=bool)
+        self.extend(0, n)
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def fork(self, index: CaseIndex) -> 'CaseClusters':
+        """Clusters for a fork of the index (shares the clusters, O(1))."""
+        forked = CaseClusters.__new__(CaseClusters)
+        forked.__dict__.update(self.__dict__)
+        forked.index = index
+        return forked
+
+    def _own(self, members: List[np.ndarray]):
+        """Switch to unshared clusters with the given members."""
+        self.members = [AppendArray(group) for group in members]
+        self.sizes = np.array([len(group) for group in members], dtype=np.int64)
+        self.present = {name: codes.copy() for name, codes in self.present.items()}
+        self.low = {name: values.copy() for name, values in self.low.items()}
+        self.high = {name: values.copy() for name, values in self.high.items()}
+        self._tail = [len(self.index)]
+
+    def _nearest_prototypes(self, cases: List[Case]) -> np.ndarray:
+        """Cluster of each case: its most similar prototype (earliest on ties)."""
+        labels = np.zeros(len(cases), dtype=np.int64)
+        block = max(1, ASSIGN_BLOCK_ELEMENTS // len(self.prototypes))
+        for start in range(0, len(cases), block):
+            chunk = cases[start:start + block]
+            try:
+                sims = self.prototypes.score_batch(chunk, self.weights)
+            except ValueError:
+                # Cases listing their features in different orders
+                sims = np.array([self.prototypes.score(case, self.weights) for case in chunk])
+            labels[start:start + len(chunk)] = np.argmax(sims, axis=1)
+        return labels
+
+    def extend(self, start: int, end: int):
+        """
+        Assign the cases at positions start..end-1 of the index to clusters.
+
+        Called by CaseIndex.extend after the cases are encoded.
+        """
+        if end <= start:
+            return
+        if self._tail[0] != start:
+            # Another version assigned past our cases: stop sharing
+            self._own([group.values[group.values < start] for group in self.members])
+        index = self.index
+        positions = np.arange(start, end)
+        labels = self._nearest_prototypes(index.cases[start:end])
+        for name in index.feature_names:
+            if index.numerical[name]:
+                values = index.decode(name, positions)
+                np.minimum.at(self.low[name], labels, values)
+                np.maximum.at(self.high[name], labels, values)
+            else:
+                codes = index.columns[name][index._physical(positions)].astype(np.int64)
+                present = self.present[name]
+                if codes.max() >= present.shape[1]:
+                    grown = np.zeros((len(self), len(index._values[name])), dtype=bool)
+                    grown[:, :present.shape[1]] = present
+                    self.present[name] = present = grown
+                present[labels, codes] = True
+        order = np.argsort(labels, kind='stable')
+        clusters, first = np.unique(labels[order], return_index=True)
+        for cluster, group in zip(clusters.tolist(), np.split(positions[order], first[1:])):
+            self.members[cluster].append(group)
+            self.sizes[cluster] += len(group)
+        self._tail[0] = end
+
+    def delete(self, positions: np.ndarray):
+        """
+        Drop removed cases and renumber the rest (positions: sorted, unique).
+
+        Called by CaseIndex.delete (after the cases are removed).
+        """
+        n = len(self.index) + len(positions)
+        members = []
+        for group in self.members:
+            group = group.values[group.values < n]
+            kept = group[~np.isin(group, positions)]
+            members.append(kept - np.searchsorted(positions, kept))
+        self._own(members)
+
+    def upper_bounds(self, query: Case, weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """
+        Highest similarity any case of each cluster can have to the query.
+
+        Each feature contributes the best similarity among the cluster's
+        values (categorical) or at the nearest end of its range (numerical).
+        The terms are summed in the same order and precision as
+        CaseIndex.score, so no case scores above its cluster's bound.
+
+        Returns:
+            Array with one bound per cluster
+        """
+        index = self.index
+        feature_names = [name for name in query.features if name in index.columns]
+        bounds = np.zeros(len(self), dtype=index._score_dtype)
+        total_weight = 0.0
+        for name in feature_names:
+            value = index._encode_column(name, [query.features[name]])[0]
+            if index.numerical[name]:
+                low, high = self.low[name], self.high[name]
+                if index.precision == 'float32':
+                    value, low, high = np.float32(value), low.astype(np.float32), high.astype(np.float32)
+                gap = np.maximum(np.maximum(low - value, value - high), 0)
+                sims = np.clip(1.0 / (1.0 + gap), 0.0, 1.0)
+            else:
+                present = self.present[name]
+                row = index._table(name)[value][:present.shape[1]]
+                sims = np.where(present, row[None, :], 0).max(axis=1, initial=0).astype(index._score_dtype)
+            if weights:
+                weight = weights.get(name, 1.0)
+                bounds += sims * weight
+            else:
+                weight = 1.0
+                bounds += sims
+            total_weight += weight
+        if total_weight == 0:
+            return np.zeros(len(self))
+        return bounds / total_weight
+
+    def _gather(self, clusters: np.ndarray) -> np.ndarray:
+        """Positions of the cases of clusters (this version's only)."""
+        rows = np.concatenate([self.members[c].values for c in clusters.tolist()]
+                              or [np.zeros(0, dtype=np.int64)])
+        return rows[rows < len(self.index)]
+
+    def _score(self, query: Case, weights: Optional[Dict[str, float]], rows: np.ndarray) -> np.ndarray:
+        if not len(rows):
+            return np.zeros(0, dtype=self.index._score_dtype)
+        return self.index.score(query, weights, rows=rows)
+
+    def top_k(self, query: Case, weights: Optional[Dict[str, float]], k: int,
+              n_probe: int = 1, exact: bool = True) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Highest-scoring cases among the clusters searched.
+
+        The n_probe clusters with the most similar prototypes are searched
+        first. In exact mode the other clusters follow in order of their
+        upper bound (in batches doubling from n_probe), until the best
+        remaining bound is below the k-th best score found. Ties can still
+        go either way at an equal bound, so those clusters are searched too,
+        and the result (including tie order) equals a full scan.
+
+        Args:
+            query: Query case
+            weights: Feature weights, or None for equal weights
+            k: Number of cases
+            n_probe: Clusters searched first
+            exact: Continue while a cluster's bound can reach the k-th best
+
+        Returns:
+            (positions, scores, number of cases scored), best first, ties in
+            position order
+        """
+        if k <= 0 or not len(self.index):
+            return np.zeros(0, dtype=np.int64), np.zeros(0), 0
+        routing = self.prototypes.score(query, weights)
+        order = np.argsort(-routing, kind='stable')
+        order = order[self.sizes[order] > 0]
+        batch = max(1, n_probe)
+        rows = [self._gather(order[:batch])]
+        scores = [self._score(query, weights, rows[0])]
+        remaining = order[batch:]
+        if exact and len(remaining):
+            bounds = self.upper_bounds(query, weights)
+            remaining = remaining[np.argsort(-bounds[remaining], kind='stable')]
+            found = scores[0]
+            while len(remaining):
+                if len(found) >= k:
+                    kth = np.partition(found, len(found) - k)[len(found) - k]
+                    remaining = remaining[bounds[remaining] >= kth]
+                    if not len(remaining):
+                        break
+                batch *= 2
+                block = self._gather(remaining[:batch])
+                remaining = remaining[batch:]
+                rows.append(block)
+                scores.append(self._score(query, weights, block))
+                found = np.concatenate([found, scores[-1]])
+        rows = np.concatenate(rows)
+        scores = np.concatenate(scores)
+        best = np.lexsort((rows, -scores))[:k]
+        return rows[best], scores[best], len(rows)
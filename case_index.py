@@ -0,0 +1,671 @@
+"""
+Case Index Module
+Column-oriented encoding of a case base for vectorized similarity:
+- Categorical features are stored as integer codes with a per-feature
+  similarity lookup table
+- Numerical features are stored as float columns, or as 8/16-bit codes
+  into a table of values (see PRECISIONS)
+- Weighted scores are bit-identical to CBRSystem.calculate_similarity
+  (except for lossy storage precisions)
+- A scoring pass can keep its per-feature weighted similarities
+  (FeatureContributions) to explain retrieved cases
+- fork() gives a new version that can be extended while readers keep
+  scoring against the old one (the case list, column buffers and views are
+  shared until they diverge), so extending a fork costs O(1) per case
+- delete() leaves tombstones (O(1) per row, no re-encoding); compact()
+  drops them
+- Derived structures (views, e.g. prototype clusters or posting lists)
+  are kept up to date by extend(), delete() and fork()
+- scan_top_k() scans with early termination: features in descending weight
+  order, candidates abandoned once they cannot beat the k-th best, and the
+  scan stops once k exact matches are found
+"""
+
+from typing import List, Dict, Optional, Any, Sequence, Tuple
+from dataclasses import dataclass, field
+import copy
+import threading
+import numpy as np
+from data_loader import Case
+from case_store import CaseList, AppendArray
+
+
+# Storage precisions for numerical columns:
+#   float64 - exact (default)
+#   float32 - half the footprint; similarities are computed in float32
+#   int16/int8 - unsigned 16/8-bit codes; exact while a feature has at most
+#                65536/256 distinct values (dictionary codes), otherwise
+#                linearly quantized between the feature's min and max
+PRECISIONS = ('float64', 'float32', 'int16', 'int8')
+_CODE_DTYPES = {'int16': np.uint16, 'int8': np.uint8}
+
+# Early-termination scans visit rows in blocks growing from SCAN_FIRST_BLOCK
+# to SCAN_MAX_BLOCK (small first blocks find exact matches and a k-th best
+# score quickly, large ones keep the per-block overhead low)
+SCAN_FIRST_BLOCK = 64
+SCAN_MAX_BLOCK = 16384
+# Slack of the abandon bound, in units of rounding error per feature (partial
+# sums run in weight order, scores in query order)
+SCAN_SLACK_ULPS = 8
+
+
+@dataclass
+class FeatureContributions:
+    """
+    Per-feature weighted similarities kept from one scoring pass.
+
+    terms[i][q, j] is weight * similarity of feature feature_names[i] between
+    query q of the pass and case j; divided by total_weight, a case's terms
+    sum to its score (up to rounding).
+    """
+    feature_names: List[str] = field(default_factory=list)
+    terms: List[np.ndarray] = field(default_factory=list)
+    total_weight: float = 0.0
+
+    def for_cases(self, positions: Sequence[int], query: int = 0) -> List[Dict[str, float]]:
+        """
+        Contribution of each feature to the score of some cases.
+
+        Args:
+            positions: Case positions (columns of the scoring pass)
+            query: Query row of the scoring pass
+
+        Returns:
+            One {feature: contribution} dictionary per position
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        if not self.terms or self.total_weight == 0:
+            return [dict.fromkeys(self.feature_names, 0.0) for _ in range(len(positions))]
+        block = np.stack([term[query, positions] for term in self.terms], axis=1)
+        return [dict(zip(self.feature_names, row))
+                for row in (block / self.total_weight).tolist()]
+
+    @classmethod
+    def stack(cls, parts: List['FeatureContributions']) -> 'FeatureContributions':
+        """Combine single-query passes (possibly over different features) into one block."""
+        names: List[str] = []
+        for part in parts:
+            names.extend(name for name in part.feature_names if name not in names)
+        n_cases = max((term.shape[1] for part in parts for term in part.terms), default=0)
+        terms = [np.zeros((len(parts), n_cases)) for _ in names]
+        for q, part in enumerate(parts):
+            if part.total_weight == 0:
+                continue
+            for name, term in zip(part.feature_names, part.terms):
+                terms[names.index(name)][q] = term[0] / part.total_weight
+        return cls(feature_names=names, terms=terms, total_weight=1.0)
+
+
+@dataclass
+class ScanStats:
+    """
+    Work done by one early-termination scan (see CaseIndex.scan_top_k).
+
+    feature_evaluations counts per-case feature similarities computed;
+    skipped counts those a full scan would have computed in addition.
+    """
+    cases: int = 0
+    cases_visited: int = 0
+    cases_abandoned: int = 0
+    feature_evaluations: int = 0
+    skipped: int = 0
+    stopped_early: bool = False
+
+
+class CaseIndex:
+    """
+    Encoded view of a list of cases.
+
+    All cases must share the same feature names. Per-feature similarities
+    are computed with the same floating point operations as
+    CBRSystem.feature_similarity, and weighted scores are accumulated in the
+    query's feature order, so results match the scalar path exactly.
+
+    Scoring only reads the index and can run in several threads at once.
+    extend(), delete() and compact() change the index in place; to change
+    an index that other threads may be scoring against, change a fork().
+
+    Positions (rows arguments, cases) count live cases only. Deleted rows
+    stay in the column buffers as tombstones until compact().
+    """
+
+    def __init__(self, system, cases: List[Case], precision: str = 'float64'):
+        """
+        Build the index.
+
+        Args:
+            system: CBRSystem providing feature_types and feature_similarity
+            cases: Cases to encode (all with the same feature names)
+            precision: Storage precision of numerical columns (see PRECISIONS)
+        """
+        if not cases:
+            raise ValueError("Cannot index an empty case base")
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}' (choose from {PRECISIONS})")
+        self.precision = precision
+        # Scores are accumulated in float32 only for float32 storage
+        self._score_dtype = np.float32 if precision == 'float32' else np.float64
+
+        self.system = system
+        self.cases = CaseList()
+        self.feature_names: List[str] = list(cases[0].features.keys())
+        self._feature_set = set(self.feature_names)
+        self.numerical = {name: system.feature_types.get(name, 'categorical') == 'numerical'
+                          for name in self.feature_names}
+
+        # Categorical vocabularies and similarity tables (grown on demand)
+        self._vocab: Dict[str, Dict[Any, int]] = {}
+        self._values: Dict[str, List[Any]] = {}
+        self._tables: Dict[str, np.ndarray] = {}
+        for name in self.feature_names:
+            if not self.numerical[name]:
+                self._vocab[name] = {}
+                self._values[name] = []
+
+        # Quantized numerical features: values of each code, the value -> code
+        # map (None once linearly quantized) and the (low, high) range of the grid.
+        # Levels grow in _level_store; the code maps and stores are shared by forks
+        self._levels: Dict[str, np.ndarray] = {}
+        self._level_codes: Dict[str, Optional[Dict[float, int]]] = {}
+        self._level_store: Dict[str, AppendArray] = {}
+        self._grid: Dict[str, Tuple[float, float]] = {}
+
+        # Column buffers with spare capacity; self.columns holds views of the used part.
+        # Forks share the buffers: _tail[0] counts the rows written to them, so
+        # only the index that wrote last may append in place
+        self._data: Dict[str, np.ndarray] = {
+            name: np.zeros(0, dtype=self._column_dtype(name)) for name in self.feature_names}
+        self.columns: Dict[str, np.ndarray] = {}
+        self._tail = [0]
+        # Rows written (live and deleted), and the rows of live cases (None: all),
+        # a view of _live_store
+        self._size = 0
+        self._live: Optional[np.ndarray] = None
+        self._live_store: Optional[AppendArray] = None
+        # Guards growth of the categorical vocabularies (shared by forks)
+        self._vocab_lock = threading.Lock()
+        # Derived structures kept in step with the rows, by name (e.g. CaseClusters);
+        # each has fork(index), extend(start, end) and delete(positions)
+        self.views: Dict[str, Any] = {}
+        self.extend(cases)
+
+    def fork(self) -> 'CaseIndex':
+        """
+        New version of the index with the same rows.
+
+        Extending the fork leaves this index unchanged (and the reverse), so
+        readers can keep scoring against this one. Costs O(features): the
+        case list, column buffers and level maps are shared until either
+        side appends past the other.
+        """
+        forked = copy.copy(self)
+        forked._data = dict(self._data)
+        forked.columns = dict(self.columns)
+        forked._levels = dict(self._levels)
+        forked._level_codes = dict(self._level_codes)
+        forked._level_store = dict(self._level_store)
+        forked._grid = dict(self._grid)
+        forked.views = {name: view.fork(forked) for name, view in self.views.items()}
+        return forked
+
+    def _own_buffers(self):
+        """Copy the shared buffers before writing, if another index wrote past our rows."""
+        n = self._size
+        if self._tail[0] == n:
+            return
+        for name, buffer in self._data.items():
+            owned = np.zeros(max(len(buffer), 16), dtype=buffer.dtype)
+            owned[:n] = buffer[:n]
+            self._data[name] = owned
+            self.columns[name] = owned[:n]
+        for name in list(self._level_store):
+            levels = self._levels[name]
+            self._level_store[name] = AppendArray(levels)
+            self._level_codes[name] = {value: code for code, value in enumerate(levels.tolist())}
+        if self._live is not None:
+            self._live_store = AppendArray(self._live)
+        self._tail = [n]
+
+    def extend(self, cases: List[Case]):
+        """
+        Append cases to the index (amortized O(1) per case).
+
+        Args:
+            cases: Cases with the same feature names as the index
+        """
+        for case in cases:
+            if case.features.keys() != self._feature_set:
+                raise ValueError("All indexed cases must share the same features")
+
+        encoded = {}
+        for name in self.feature_names:
+            raw = [case.features[name] for case in cases]
+            if self.numerical[name]:
+                try:
+                    encoded[name] = np.array([float(v) for v in raw], dtype=float)
+                except (TypeError, ValueError):
+                    raise ValueError(f"Non-numeric value in numerical feature '{name}'")
+            else:
+                codes = [self._code(name, v) for v in raw]
+                dtype = self._data[name].dtype
+                if codes and max(codes) > np.iinfo(dtype).max:
+                    raise ValueError(f"Too many categories in '{name}' for {self.precision} storage")
+                encoded[name] = np.array(codes, dtype=dtype)
+
+        self._own_buffers()
+        start = self._size
+        end = start + len(cases)
+        for name in self.feature_names:
+            if self.numerical[name] and self.precision in _CODE_DTYPES:
+                encoded[name] = self._quantize(name, encoded[name], start)
+            buffer = self._data[name]
+            if end > len(buffer):
+                grown = np.zeros(max(end, 2 * len(buffer), 16), dtype=buffer.dtype)
+                grown[:start] = buffer[:start]
+                self._data[name] = buffer = grown
+            buffer[start:end] = encoded[name]
+            self.columns[name] = buffer[:end]
+        self.cases = self.cases.extended(cases)
+        self._tail[0] = self._size = end
+        if self._live is not None:
+            self._live_store.append(np.arange(start, end))
+            self._live = self._live_store.values
+        for view in self.views.values():
+            view.extend(len(self.cases) - len(cases), len(self.cases))
+
+    def delete(self, positions: Sequence[int]):
+        """
+        Remove cases from the index, leaving tombstones (see compact()).
+
+        Args:
+            positions: Positions of the cases to remove
+        """
+        positions = np.unique(np.asarray(positions, dtype=np.int64))
+        if len(positions) == 0:
+            return
+        if positions[0] < 0 or positions[-1] >= len(self.cases):
+            raise IndexError("Case position out of range")
+        live = self._live if self._live is not None else np.arange(self._size)
+        self._live_store = AppendArray(np.delete(live, positions))
+        self._live = self._live_store.values
+        drop = set(positions.tolist())
+        self.cases = CaseList(case for i, case in enumerate(self.cases) if i not in drop)
+        for view in self.views.values():
+            view.delete(positions)
+
+    def compact(self):
+        """Rewrite the columns without deleted rows (into new buffers, so forks are unaffected)."""
+        if self._live is None:
+            return
+        n = len(self._live)
+        for name, buffer in self._data.items():
+            packed = np.zeros(max(2 * n, 16), dtype=buffer.dtype)
+            packed[:n] = buffer[self._live]
+            self._data[name] = packed
+            self.columns[name] = packed[:n]
+        self._tail = [n]
+        self._size = n
+        self._live = self._live_store = None
+
+    @property
+    def tombstones(self) -> int:
+        """Deleted rows still held in the columns."""
+        return self._size - len(self.cases)
+
+    def _physical(self, rows: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """Column rows of case positions (None: all cases, when there are no tombstones)."""
+        if self._live is None:
+            return rows
+        return self._live if rows is None else self._live[rows]
+
+    def __len__(self) -> int:
+        return len(self.cases)
+
+    @property
+    def nbytes(self) -> int:
+        """Footprint of the encoded columns (excluding spare capacity)."""
+        return sum(column.nbytes for column in self.columns.values())
+
+    def _column_dtype(self, feature_name: str):
+        """Storage dtype of a feature's column."""
+        if not self.numerical[feature_name]:
+            if self.precision == 'float64':
+                return np.int64
+            return _CODE_DTYPES.get(self.precision, np.uint16)
+        if self.precision in _CODE_DTYPES:
+            return _CODE_DTYPES[self.precision]
+        return np.float32 if self.precision == 'float32' else np.float64
+
+    def _quantize(self, feature_name: str, values: np.ndarray, start: int) -> np.ndarray:
+        """
+        Codes for new values of a quantized numerical feature.
+
+        Distinct values get their own code while they fit in the code width
+        (lossless). Past that the feature switches to a linear grid over its
+        range; existing rows are recoded when the grid changes.
+
+        Args:
+            feature_name: Numerical feature
+            values: New float values
+            start: Number of rows already stored
+
+        Returns:
+            Codes for the new values
+        """
+        dtype = _CODE_DTYPES[self.precision]
+        capacity = int(np.iinfo(dtype).max) + 1
+        lookup = self._level_codes.setdefault(feature_name, {})
+        if lookup is not None:
+            new_values = [v for v in dict.fromkeys(values.tolist()) if v not in lookup]
+            if len(lookup) + len(new_values) <= capacity:
+                store = self._level_store.get(feature_name)
+                if store is None:
+                    store = self._level_store[feature_name] = AppendArray(dtype=float)
+                for value in new_values:
+                    lookup[value] = len(lookup)
+                store.append(np.array(new_values, dtype=float))
+                self._levels[feature_name] = store.values
+                return np.array([lookup[v] for v in values.tolist()], dtype=dtype)
+            self._level_codes[feature_name] = None
+            self._level_store.pop(feature_name, None)
+
+        # Linear grid: decode existing rows, and recode them if the range grows
+        old = self._levels[feature_name][self._data[feature_name][:start]] if start else values[:0]
+        grid = self._grid.get(feature_name)
+        low, high = float(np.min(values)), float(np.max(values))
+        if grid is not None:
+            low, high = min(low, grid[0]), max(high, grid[1])
+        elif start:
+            low, high = min(low, float(np.min(old))), max(high, float(np.max(old)))
+        if grid != (low, high):
+            self._grid[feature_name] = (low, high)
+            self._levels[feature_name] = np.linspace(low, high, capacity)
+            if start:
+                # Recode into a new buffer: forks may still read the old codes
+                buffer = self._data[feature_name].copy()
+                buffer[:start] = self._grid_codes(feature_name, old, dtype)
+                self._data[feature_name] = buffer
+                self.columns[feature_name] = buffer[:start]
+        return self._grid_codes(feature_name, values, dtype)
+
+    def _grid_codes(self, feature_name: str, values: np.ndarray, dtype) -> np.ndarray:
+        """Nearest linear-grid codes for values."""
+        low, high = self._grid[feature_name]
+        step = (high - low) / (len(self._levels[feature_name]) - 1) if high > low else 1.0
+        codes = np.rint((values - low) / step)
+        return np.clip(codes, 0, len(self._levels[feature_name]) - 1).astype(dtype)
+
+    def decode(self, feature_name: str, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Stored values of a numerical feature as float64 (quantized values for int storage).
+
+        Args:
+            feature_name: Numerical feature
+            rows: Optional positions (default: all)
+        """
+        column = self.columns[feature_name]
+        rows = self._physical(rows)
+        if rows is not None:
+            column = column[rows]
+        if self.precision in _CODE_DTYPES:
+            return self._levels[feature_name][column]
+        return column.astype(float)
+
+    def _code(self, feature_name: str, value: Any) -> int:
+        """Return the integer code of a categorical value, adding it if unseen."""
+        vocab = self._vocab[feature_name]
+        code = vocab.get(value)
+        if code is None:
+            with self._vocab_lock:
+                code = vocab.get(value)
+                if code is None:
+                    code = len(vocab)
+                    self._values[feature_name].append(value)
+                    vocab[value] = code
+        return code
+
+    def _table(self, feature_name: str) -> np.ndarray:
+        """Pairwise similarity table between all known values of a feature."""
+        table = self._tables.get(feature_name)
+        if table is None or len(table) < len(self._values[feature_name]):
+            # Vocabularies only grow, so a table covering every known value stays valid
+            values = list(self._values[feature_name])
+            table = np.array([[self.system.feature_similarity(a, b, feature_name)
+                               for b in values] for a in values], dtype=self._score_dtype)
+            self._tables[feature_name] = table
+        return table
+
+    def _encode_column(self, feature_name: str, values: Sequence[Any]) -> np.ndarray:
+        """Encode query values of one feature."""
+        if self.numerical[feature_name]:
+            return np.array([float(v) for v in values], dtype=float)
+        return np.array([self._code(feature_name, v) for v in values], dtype=np.int64)
+
+    def feature_similarity_block(self, feature_name: str, query_values: np.ndarray,
+                                 rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Similarity of each encoded query value to each indexed case for one feature.
+
+        Args:
+            feature_name: Feature to compare
+            query_values: Encoded query values (shape: (q,))
+            rows: Optional case positions to restrict the comparison to
+
+        Returns:
+            Array of shape (q, n_rows)
+        """
+        column = self.columns[feature_name]
+        rows = self._physical(rows)
+        if rows is not None:
+            column = column[rows]
+        if not self.numerical[feature_name]:
+            return self._table(feature_name)[query_values[:, None], column[None, :]]
+        if self.precision in _CODE_DTYPES:
+            # Similarity to every stored level, then one gather per case
+            levels = self._levels[feature_name]
+            level_sims = np.clip(1.0 / (1.0 + np.abs(query_values[:, None] - levels[None, :])),
+                                 0.0, 1.0)
+            if len(query_values) == 1:
+                return level_sims[0][column][None, :]
+            return level_sims[np.arange(len(query_values))[:, None], column[None, :]]
+        if self.precision == 'float32':
+            query_values = query_values.astype(np.float32)
+        diff = np.abs(query_values[:, None] - column[None, :])
+        return np.clip(1.0 / (1.0 + diff), 0.0, 1.0)
+
+    def _weighted_block(self, feature_names: List[str], encoded: Dict[str, np.ndarray],
+                        weights: Optional[Dict[str, float]],
+                        rows: Optional[np.ndarray],
+                        contributions: Optional[FeatureContributions] = None) -> np.ndarray:
+        """
+        Accumulate weighted similarities feature by feature (scalar-path order).
+
+        When contributions is given, it receives each feature's weighted
+        similarities (the same arrays that are summed) and the total weight.
+        """
+        n_queries = len(next(iter(encoded.values()))) if encoded else 0
+        n_rows = len(self.cases) if rows is None else len(rows)
+        if not feature_names:
+            return np.zeros((n_queries, n_rows))
+
+        weighted_sum = np.zeros((n_queries, n_rows), dtype=self._score_dtype)
+        total_weight = 0.0
+        for name in feature_names:
+            sims = self.feature_similarity_block(name, encoded[name], rows)
+            if weights:
+                weight = weights.get(name, 1.0)
+                term = sims * weight
+            else:
+                weight = 1.0
+                term = sims
+            weighted_sum += term
+            total_weight += weight
+            if contributions is not None:
+                contributions.feature_names.append(name)
+                contributions.terms.append(term)
+        if contributions is not None:
+            contributions.total_weight = total_weight
+
+        if total_weight == 0:
+            return np.zeros((n_queries, n_rows))
+        return weighted_sum / total_weight
+
+    def score(self, query: Case, weights: Optional[Dict[str, float]] = None,
+              rows: Optional[np.ndarray] = None,
+              contributions: Optional[FeatureContributions] = None) -> np.ndarray:
+        """
+        Weighted similarity of a query to every indexed case.
+
+        Args:
+            query: Query case
+            weights: Feature weights, or None for equal weights
+            rows: Optional case positions to restrict scoring to
+            contributions: Optional empty FeatureContributions to fill
+
+        Returns:
+            Array of similarities in index order
+        """
+        if not query.features:
+            return np.zeros(len(self.cases) if rows is None else len(rows))
+        feature_names = [name for name in query.features if name in self.columns]
+        encoded = {name: self._encode_column(name, [query.features[name]])
+                   for name in feature_names}
+        if not encoded:
+            return np.zeros(len(self.cases) if rows is None else len(rows))
+        return self._weighted_block(feature_names, encoded, weights, rows, contributions)[0]
+
+    def score_batch(self, queries: List[Case],
+                    weights: Optional[Dict[str, float]] = None,
+                    contributions: Optional[FeatureContributions] = None) -> np.ndarray:
+        """
+        Weighted similarity of several queries to every indexed case.
+
+        All queries must list their features in the same order (the order
+        fixes the summation order, and so the exact scores).
+
+        Args:
+            queries: Query cases
+            weights: Feature weights, or None for equal weights
+            contributions: Optional empty FeatureContributions to fill
+
+        Returns:
+            Array of shape (len(queries), len(index))
+        """
+        if not queries:
+            return np.zeros((0, len(self.cases)))
+        order = list(queries[0].features)
+        for query in queries:
+            if list(query.features) != order:
+                raise ValueError("Batched queries must share the same feature order")
+        feature_names = [name for name in order if name in self.columns]
+        encoded = {name: self._encode_column(name, [q.features[name] for q in queries])
+                   for name in feature_names}
+        if not encoded:
+            return np.zeros((len(queries), len(self.cases)))
+        return self._weighted_block(feature_names, encoded, weights, None, contributions)
+
+    def scan_top_k(self, query: Case, weights: Optional[Dict[str, float]],
+                   k: int) -> Tuple[np.ndarray, np.ndarray, ScanStats]:
+        """
+        k most similar cases by a scan with early termination.
+
+        Cases are visited in position order, in blocks. Within a block,
+        features are evaluated in descending weight order, and a case is
+        abandoned once its partial score plus the weight of its remaining
+        features cannot beat the k-th best score of the earlier blocks
+        (ties go to the earlier case, so equalling it is not enough). Once
+        the k-th best is a perfect score, no later case can beat it and the
+        scan stops. Surviving cases sum their terms in query order, so
+        results (and tie order) equal score() followed by a stable top-k.
+
+        Args:
+            query: Query case
+            weights: Feature weights, or None for equal weights
+            k: Number of cases
+
+        Returns:
+            (positions, scores, ScanStats), best first
+        """
+        n = len(self.cases)
+        feature_names = [name for name in query.features if name in self.columns]
+        stats = ScanStats(cases=n)
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=self._score_dtype)
+        if k <= 0 or not n:
+            return best_rows, best_scores, stats
+        encoded = {name: self._encode_column(name, [query.features[name]]) for name in feature_names}
+        weight_of = {name: weights.get(name, 1.0) if weights else 1.0 for name in feature_names}
+        total_weight = float(sum(weight_of.values()))
+
+        # Score of a case matching every feature exactly (same arithmetic as a scan)
+        ones = np.ones(1, dtype=self._score_dtype)
+        perfect = np.zeros(1, dtype=self._score_dtype)
+        for name in feature_names:
+            perfect += ones * weight_of[name] if weights else ones
+        perfect = perfect[0] / total_weight if total_weight else 0.0
+        slack = SCAN_SLACK_ULPS * len(feature_names) * np.finfo(self._score_dtype).eps * total_weight
+        by_weight = sorted(range(len(feature_names)), key=lambda i: -weight_of[feature_names[i]])
+
+        start, block = 0, SCAN_FIRST_BLOCK
+        while start < n:
+            rows = np.arange(start, min(start + block, n))
+            kth = best_scores[k - 1] * total_weight if len(best_scores) == k else None
+            # Per-feature terms of the block (abandoned cases keep partial rows)
+            terms = np.zeros((len(feature_names), len(rows)), dtype=self._score_dtype)
+            partial = np.zeros(len(rows))
+            alive = np.arange(len(rows))
+            remaining = total_weight
+            for i in by_weight:
+                name = feature_names[i]
+                sims = self.feature_similarity_block(name, encoded[name], rows[alive])[0]
+                term = sims * weight_of[name] if weights else sims
+                terms[i, alive] = term
+                partial[alive] += term
+                remaining -= weight_of[name]
+                stats.feature_evaluations += len(alive)
+                if kth is not None:
+                    alive = alive[partial[alive] + remaining + slack > kth]
+                    if not len(alive):
+                        break
+            stats.cases_visited += len(rows)
+            stats.cases_abandoned += len(rows) - len(alive)
+            if len(alive):
+                # Sum in query order, as _weighted_block does
+                weighted_sum = np.zeros(len(alive), dtype=self._score_dtype)
+                for i in range(len(feature_names)):
+                    weighted_sum += terms[i, alive]
+                scores = weighted_sum / total_weight if total_weight else np.zeros(len(alive))
+                seen_rows = np.concatenate([best_rows, rows[alive]])
+                seen_scores = np.concatenate([best_scores, scores])
+                keep = np.lexsort((seen_rows, -seen_scores))[:k]
+                best_rows, best_scores = seen_rows[keep], seen_scores[keep]
+            start += len(rows)
+            block = min(2 * block, SCAN_MAX_BLOCK)
+            if start < n and len(best_scores) == k and best_scores[k - 1] >= perfect:
+                # Later cases can at best tie, and ties go to earlier cases
+                stats.stopped_early = True
+                break
+        stats.skipped = n * len(feature_names) - stats.feature_evaluations
+        return best_rows, best_scores, stats
+
+    def pairwise(self, weights: Optional[Dict[str, float]] = None,
+                 query_rows: Optional[np.ndarray] = None,
+                 rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Weighted similarity between indexed cases.
+
+        Entry [i, j] equals calculate_similarity(cases[query_rows[i]], cases[rows[j]]).
+
+        Args:
+            weights: Feature weights, or None for equal weights
+            query_rows: Positions of the cases used as queries (default: all)
+            rows: Positions of the cases compared against (default: all)
+
+        Returns:
+            Similarity matrix of shape (len(query_rows), len(rows))
+        """
+        if query_rows is None:
+            query_rows = np.arange(len(self.cases))
+        encoded = {name: self.decode(name, query_rows) if self.numerical[name]
+                   else self.columns[name][self._physical(query_rows)] for name in self.feature_names}
+        return self._weighted_block(self.feature_names, encoded, weights, rows)
@@ -0,0 +1,144 @@
+"""
+Case Store Module
+Append-only storage shared by the versions of a growing case base:
+- CaseList: read-only list of cases; extended() gives a new version that
+  shares the storage, so retaining a case costs O(1) amortized instead of
+  a copy of the whole case base
+- AppendArray: growable numpy array (1-D, or rows of a 2-D array) whose
+  filled part only grows; readers keep a consistent view while it grows
+
+Versions are prefixes of one storage: only the longest version appends in
+place, an older one copies its prefix first (as CaseIndex does with its
+column buffers). Writers must not extend the same storage concurrently
+(CBRSystem holds its write lock); readers need no lock.
+"""
+
+from typing import List, Iterable, Iterator, Optional, Union
+from collections.abc import Sequence
+import itertools
+import numpy as np
+from data_loader import Case
+
+
+class CaseList(Sequence):
+    """
+    Read-only list of cases that shares its storage with other versions.
+
+    Indexing, iteration, len() and comparison behave as for a list; slices,
+    copy() and concatenation (cases + [case]) give ordinary lists. Pickles
+    as a plain list.
+    """
+    __slots__ = ('_items', '_n')
+
+    def __init__(self, cases: Iterable[Case] = ()):
+        """
+        Args:
+            cases: Cases (copied), or a CaseList whose storage is shared
+        """
+        if isinstance(cases, CaseList):
+            self._items, self._n = cases._items, cases._n
+        else:
+            self._items = list(cases)
+            self._n = len(self._items)
+
+    def extended(self, cases: Iterable[Case]) -> 'CaseList':
+        """
+        New version with cases appended; this one is not changed.
+
+        Appends to the shared storage when this is its longest version,
+        else copies this version's prefix first.
+        """
+        items = self._items
+        if len(items) != self._n:
+            items = items[:self._n]  # another version appended past ours
+        items.extend(cases)
+        grown = CaseList.__new__(CaseList)
+        grown._items, grown._n = items, len(items)
+        return grown
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, i: Union[int, slice]):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self._n)
+            if step == 1:
+                return self._items[start:stop]
+            return [self._items[j] for j in range(start, stop, step)]
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError("case index out of range")
+        return self._items[i]
+
+    def __iter__(self) -> Iterator[Case]:
+        return itertools.islice(self._items, self._n)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (list, CaseList)):
+            return len(self) == len(other) and all(a is b or a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __add__(self, other) -> List[Case]:
+        return list(self) + list(other)
+
+    def __radd__(self, other) -> List[Case]:
+        return list(other) + list(self)
+
+    def copy(self) -> List[Case]:
+        """The cases as an ordinary list."""
+        return list(self)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+class AppendArray:
+    """
+    Growable numpy array: 1-D, or rows of a 2-D array (width columns).
+
+    values is a view of the filled part. append() writes past it in place,
+    or into a larger buffer when full, and then replaces values in one
+    step, so a reader holding values (or reading it once) sees a
+    consistent array while another thread appends.
+    """
+    __slots__ = ('_buffer', 'values')
+
+    def __init__(self, values: Optional[np.ndarray] = None, dtype=np.int64,
+                 width: Optional[int] = None):
+        """
+        Args:
+            values: Initial contents (copied)
+            dtype: Element type when values is None
+            width: Columns of a 2-D array when values is None
+        """
+        if values is None:
+            values = np.zeros(0 if width is None else (0, width), dtype=dtype)
+        values = np.asarray(values)
+        self._buffer = np.zeros((max(2 * len(values), 4),) + values.shape[1:], dtype=values.dtype)
+        self._buffer[:len(values)] = values
+        self.values = self._buffer[:len(values)]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def append(self, values: np.ndarray):
+        """Append elements (or rows)."""
+        n = len(self.values)
+        end = n + len(values)
+        buffer = self._buffer
+        if end > len(buffer):
+            grown = np.zeros((max(end, 2 * len(buffer)),) + buffer.shape[1:], dtype=buffer.dtype)
+            grown[:n] = buffer[:n]
+            self._buffer = buffer = grown
+        buffer[n:end] = values
+        self.values = buffer[:end]
+
+    def copy(self, n: Optional[int] = None) -> 'AppendArray':
+        """Independent copy of the first n elements (default: all)."""
+        return AppendArray(self.values if n is None else self.values[:n])
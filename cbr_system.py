@@ -4,11 +4,127 @@ Implements the core Case-Based Reasoning logic:
 - Similarity computation
 - Case retrieval
 - Case storage and learning
+
+The case base is published as read-only snapshots: retention publishes a
+new snapshot (copy-on-write), so queries in other threads keep retrieving
+against the snapshot they started with, without locks.
 """
 
 from typing import List, Dict, Tuple, Any, Optional, Callable
+import functools
+import operator
+import threading
 import numpy as np
 from data_loader import Case
+from case_index import CaseIndex, FeatureContributions, ScanStats, PRECISIONS
+from case_clusters import CaseClusters, ClusterSettings
+from case_store import CaseList
+
+
+# (queries x cases) similarities scored per block by batch k-NN (kept cache-sized)
+BATCH_SCORE_ELEMENTS = 1 << 16
+
+# Scan modes of the top-k retrievals (see CBRSystem.set_scan_mode)
+SCAN_MODES = ('full', 'early')
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Positions of the k highest scores, in O(n).
+
+    Orders by descending score with ties kept in position order, i.e. the
+    same result as np.argsort(-scores, kind='stable')[:k].
+    
+    Args:
+        scores: Similarity scores
+        k: Number of positions to return
+        
+    Returns:
+        Array of at most k positions
+    """
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores, kind='stable')
+    threshold = np.partition(scores, n - k)[n - k]
+    above = np.flatnonzero(scores > threshold)
+    tied = np.flatnonzero(scores == threshold)[:k - len(above)]
+    candidates = np.concatenate([above, tied])
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+class CaseBaseSnapshot(CaseList):
+    """
+    One version of a case base: the system's own, or an independent one
+    (see CBRSystem.case_base_handle).
+    
+    A read-only list: retention makes a new snapshot instead of appending,
+    so a snapshot never changes once a query holds it. Snapshots of one
+    case base share their storage (see CaseList), so a new version costs
+    O(1) per added case. Copies (cb.copy(), slices, cb + [case]) are
+    ordinary lists.
+    """
+    __slots__ = ('owner', 'lineage', 'version', 'index')
+    
+    def __init__(self, cases: List[Case], owner, lineage: object, version: int,
+                 index: Optional[CaseIndex] = None):
+        super().__init__(cases)
+        # System whose index the snapshot caches, token of the case base it
+        # is a version of, and position in that case base's history
+        self.owner = owner
+        self.lineage = lineage
+        self.version = version
+        # CaseIndex of the cases; None until first needed, False if they cannot be indexed
+        self.index = index
+    
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("A published case base is read-only; use CBRSystem.add_case")
+    
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+
+class _QueryState(threading.local):
+    """Per-thread state of a CBRSystem."""
+    # Case base of the running call (None = latest snapshot)
+    case_base = None
+    # Case base that retention extends (None = latest snapshot)
+    retain_base = None
+    # Snapshot published by this thread's last add_case
+    published = None
+    # Scores of the last retrieval pass (see CBRSystem._scores_for)
+    last_scores = None
+    # (query, use_weights) of run_query's last retrieval (see CBRSystem.adapt_knn)
+    last_retrieval = None
+    # ScanStats of the last early-termination scan (see CBRSystem.last_scan)
+    last_scan = None
+
+
+def pin_case_base(method):
+    """
+    Run a read method against one case base for the whole call.
+    
+    That is the method's case_base= argument if given, else the case base
+    of the enclosing call (e.g. run_query's cb), else the current snapshot,
+    even if another thread publishes meanwhile. Everything the method calls
+    (adaptation rules included) sees it as self.case_base.
+    """
+    @functools.wraps(method)
+    def pinned(self, *args, **kwargs):
+        local = self._local
+        case_base = kwargs.get('case_base')
+        if case_base is None:
+            if local.case_base is not None:
+                return method(self, *args, **kwargs)
+            case_base = self._snapshot
+        outer = local.case_base
+        local.case_base = case_base
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            local.case_base = outer
+    return pinned
 
 
 class CBRSystem:
@@ -30,16 +146,263 @@ class CBRSystem:
         """
         self.feature_weights = feature_weights or {}
         self.feature_types = feature_types or {}
-        self.case_base: List[Case] = []
+        # Published case base; writers hold _write_lock, readers need no lock
+        self._write_lock = threading.RLock()
+        self._lineage = object()
+        self._snapshot = CaseBaseSnapshot([], self, self._lineage, 0)
+        self._local = _QueryState()
+        # Optional callable(query, case_base, use_weights) -> np.ndarray or None.
+        # Lets callers supply precomputed similarity rows (e.g. cross-validation).
+        self.score_provider: Optional[Callable] = None
+        # Optional Instrumentation (see instrumentation.py); None = disabled
+        self.instrumentation = None
+        # Encoded copy of the case base for vectorized scoring (see case_index())
+        self.index_precision = 'float64'
+        # (list, its length, CaseIndex or False) for the last case base that is not a snapshot
+        self._foreign_index: Optional[tuple] = None
+        # Compact an index once this fraction of its rows are deleted cases,
+        # in a background thread unless background_rebalance is False
+        self.rebalance_threshold = 0.25
+        self.background_rebalance = True
+        self._rebalancer: Optional[threading.Thread] = None
+        # Keep per-feature contributions of every retrieval pass, so that
+        # explaining the retrieved cases afterwards costs nothing extra
+        self.keep_contributions = False
+        # Neighbours used by the k-NN prediction mode
+        self.knn_k = 5
+        # Two-stage retrieval through prototype clusters (see enable_clustering)
+        self.clustering: Optional[ClusterSettings] = None
+        # 'full' scores every case; 'early' scans with early termination (see set_scan_mode)
+        self.scan_mode = 'full'
     
-    def set_case_base(self, cases: List[Case]):
+    def enable_instrumentation(self, *sinks):
+        """
+        Attach per-phase timers and counters to this system.
+        
+        Args:
+            sinks: Sinks receiving one record per query (default: InMemoryStats)
+            
+        Returns:
+            The Instrumentation object
+        """
+        from instrumentation import Instrumentation
+        self.instrumentation = Instrumentation(list(sinks) if sinks else None)
+        return self.instrumentation
+    
+    def disable_instrumentation(self):
+        """Detach instrumentation (closing its sinks)."""
+        if self.instrumentation is not None:
+            self.instrumentation.close()
+        self.instrumentation = None
+    
+    @property
+    def case_base(self) -> List[Case]:
+        """
+        Case base seen by the calling thread.
+        
+        Within run_query and the retrieval methods, the case base the call
+        works on; otherwise the latest published snapshot. Assigning a list
+        publishes a snapshot of it.
+        """
+        active = self._local.case_base
+        return active if active is not None else self._snapshot
+    
+    @case_base.setter
+    def case_base(self, cases: List[Case]):
+        self._publish(cases)
+    
+    def _publish(self, cases: List[Case], index: Optional[CaseIndex] = None) -> CaseBaseSnapshot:
+        """Make cases the current case base (atomically replaces the snapshot)."""
+        with self._write_lock:
+            snapshot = CaseBaseSnapshot(cases, self, self._lineage, self._snapshot.version + 1, index)
+            self._snapshot = snapshot
+        return snapshot
+    
+    def _owns(self, cases: List[Case]) -> bool:
+        """Whether cases is a snapshot of this system (published, or a handle)."""
+        return isinstance(cases, CaseBaseSnapshot) and cases.owner is self
+    
+    def case_base_handle(self, cases: List[Case]) -> CaseBaseSnapshot:
+        """
+        Read-only handle to a case base independent of self.case_base.
+        
+        Pass it as case_base= to the retrieval and adaptation methods, or as
+        run_query's cb, to query it with this system's weights and fitted
+        statistics; the system's own case base is not touched. Each handle
+        keeps its own index, so one system can serve many case bases.
+        Retaining into a handle gives a new handle with the case added.
+        
+        Args:
+            cases: Cases of the case base (copied)
+            
+        Returns:
+            CaseBaseSnapshot of the cases
+        """
+        return CaseBaseSnapshot(cases, self, object(), 0)
+    
+    def set_case_base(self, cases: List[Case], verbose: bool = True):
         """Set the initial case base."""
-        self.case_base = cases.copy()
-        print(f"Case base initialized with {len(self.case_base)} cases")
+        self.case_base = cases
+        if verbose:
+            print(f"Case base initialized with {len(self.case_base)} cases")
+    
+    def add_case(self, case: Case,
+                 case_base: Optional[CaseBaseSnapshot] = None) -> CaseBaseSnapshot:
+        """
+        Add a new case to the case base (learning).
+        
+        Publishes a new snapshot: the latest one plus the case (or, when
+        run_query retains into a case base list of its caller, that list
+        plus the case). Queries already running are not affected. The index
+        of the old snapshot is forked and extended, not rebuilt.
+        
+        Args:
+            case: Case to retain
+            case_base: Optional handle (see case_base_handle) to add the case
+                to instead; the system's case base and statistics are not changed
+            
+        Returns:
+            The new snapshot (or handle)
+        """
+        return self.add_cases([case], case_base=case_base)
     
-    def add_case(self, case: Case):
-        """Add a new case to the case base (learning)."""
-        self.case_base.append(case)
+    def add_cases(self, cases: List[Case],
+                  case_base: Optional[CaseBaseSnapshot] = None) -> CaseBaseSnapshot:
+        """
+        Add several cases at once: one new snapshot and one index extension.
+        
+        Same result as calling add_case for each case in order.
+        
+        Args:
+            cases: Cases to retain
+            case_base: Optional handle to add the cases to instead (see add_case)
+            
+        Returns:
+            The new snapshot (or handle)
+        """
+        cases = list(cases)
+        with self._write_lock:
+            base = case_base if case_base is not None else self._local.retain_base
+            if base is None:
+                base = self._snapshot
+            extends = self._holds_snapshot(base)
+            # Snapshots share storage with the new version; a caller's list is copied
+            grown = base.extended(cases) if isinstance(base, CaseList) else base + cases
+            result = self._next_version(base, grown, lambda index: index.extend(cases))
+            if result is self._snapshot:
+                if extends:
+                    for case in cases:
+                        self._retained(case)
+                else:
+                    self._replaced()
+            return result
+    
+    def _holds_snapshot(self, cases: List[Case]) -> bool:
+        """Whether cases are the cases of the system's current snapshot (in order)."""
+        snapshot = self._snapshot
+        return cases is snapshot or (len(cases) == len(snapshot) and
+                                     all(map(operator.is_, cases, snapshot)))
+    
+    def remove_cases(self, positions: List[int],
+                     case_base: Optional[CaseBaseSnapshot] = None) -> CaseBaseSnapshot:
+        """
+        Evict cases from the case base.
+        
+        Publishes a new snapshot without the cases. Its index is the old
+        one with the rows marked deleted (tombstones); once they exceed
+        rebalance_threshold of the rows, the index is compacted (see rebalance).
+        
+        Args:
+            positions: Positions of the cases to remove
+            case_base: Optional handle to remove the cases from instead
+            
+        Returns:
+            The new snapshot (or handle)
+        """
+        with self._write_lock:
+            base = case_base if case_base is not None else self._snapshot
+            drop = sorted(set(int(p) for p in positions))
+            if drop and (drop[0] < 0 or drop[-1] >= len(base)):
+                raise IndexError("Case position out of range")
+            evicted = [base[i] for i in drop]
+            dropped = set(drop)
+            kept = [case for i, case in enumerate(base) if i not in dropped]
+            result = self._next_version(base, kept, lambda index: index.delete(drop))
+            if result is self._snapshot and evicted:
+                self._evicted(evicted)
+            return result
+    
+    def _next_version(self, base: List[Case], cases: List[Case], edit: Callable) -> CaseBaseSnapshot:
+        """
+        Make cases the next version of base (caller holds the write lock).
+        
+        A handle gets a new handle; anything else publishes a new snapshot.
+        The index is base's index forked and changed by edit(index), or
+        built lazily if base has none.
+        """
+        if self._owns(base):
+            index = base.index
+        else:
+            foreign = self._foreign_index
+            index = foreign[2] if foreign is not None and foreign[0] is base else None
+        if index and len(index) == len(base) and index.precision == self.index_precision:
+            index = index.fork()
+            try:
+                edit(index)
+            except ValueError:
+                index = False
+        else:
+            index = None
+        if self._owns(base) and base.lineage is not self._lineage:
+            result = CaseBaseSnapshot(cases, self, base.lineage, base.version + 1, index)
+        else:
+            result = self._publish(cases, index)
+        self._local.published = result
+        if index and index.tombstones > self.rebalance_threshold * (len(index) + index.tombstones):
+            if not self.background_rebalance:
+                self.rebalance(result)
+            elif self._rebalancer is None or not self._rebalancer.is_alive():
+                self._rebalancer = threading.Thread(target=self.rebalance, daemon=True)
+                self._rebalancer.start()
+        return result
+    
+    def rebalance(self, case_base: Optional[CaseBaseSnapshot] = None):
+        """
+        Compact the index of a snapshot, dropping the rows of evicted cases.
+        
+        The compacted index is built outside the write lock and swapped in
+        atomically; queries see the same scores before and after. Without
+        case_base, compacts the current snapshot (again if it was replaced
+        meanwhile).
+        
+        Args:
+            case_base: Optional snapshot or handle to compact instead
+        """
+        for _ in range(3):
+            snapshot = case_base if case_base is not None else self._snapshot
+            index = snapshot.index if self._owns(snapshot) else None
+            if not index or not index.tombstones:
+                return
+            compacted = index.fork()
+            compacted.compact()
+            with self._write_lock:
+                if snapshot.index is index:
+                    snapshot.index = compacted
+                    if case_base is not None or snapshot is self._snapshot:
+                        return
+    
+    def _retained(self, case: Case):
+        """Hook run (under the write lock) when a case joins the system's own case base."""
+    
+    def _evicted(self, cases: List[Case]):
+        """Hook run (under the write lock) when cases leave the system's own case base."""
+    
+    def _replaced(self):
+        """
+        Hook run (under the write lock) when retention publishes a case base
+        that does not extend the system's own (e.g. run_query retaining into
+        a cb holding other cases); _retained is not run for its cases.
+        """
     
     def feature_similarity(self, val1: Any, val2: Any, feature_name: str = None) -> float:
         """
@@ -127,7 +490,8 @@ class CBRSystem:
         return ordinal_maps.get(feature_name)
     
     def calculate_similarity(self, case1: Case, case2: Case, 
-                           use_weights: bool = True) -> float:
+                           use_weights: bool = True,
+                           contributions: Optional[Dict[str, float]] = None) -> float:
         """
         Calculate overall similarity between two cases.
         
@@ -137,6 +501,8 @@ class CBRSystem:
             case1: First case
             case2: Second case
             use_weights: Whether to use feature weights (True=tuned, False=baseline)
+            contributions: Optional dictionary that receives each shared
+                feature's weighted similarity divided by the total weight
             
         Returns:
             Similarity score (0.0 to 1.0)
@@ -144,8 +510,8 @@ class CBRSystem:
         if not case1.features or not case2.features:
             return 0.0
         
-        # Get all feature names
-        feature_names = set(case1.features.keys()) & set(case2.features.keys())
+        # Get shared feature names (in case1 order, so the sum order is deterministic)
+        feature_names = [name for name in case1.features if name in case2.features]
         
         if not feature_names:
             return 0.0
@@ -184,35 +550,335 @@ class CBRSystem:
         else:
             weighted_sum = sum(feature_sims[name] for name in feature_names)
         
+        if contributions is not None:
+            for name in feature_names:
+                weight = self.feature_weights.get(name, 1.0) if use_weights and self.feature_weights else 1.0
+                contributions[name] = feature_sims[name] * weight / total_weight
+        
         return weighted_sum / total_weight
     
-    def retrieve_most_similar(self, query: Case, use_weights: bool = True) -> Tuple[Case, float]:
+    def set_index_precision(self, precision: str):
+        """
+        Choose the storage precision of the encoded case base.
+        
+        Args:
+            precision: 'float64' (exact), 'float32', 'int16' or 'int8' (see case_index.PRECISIONS)
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}' (choose from {PRECISIONS})")
+        with self._write_lock:
+            self.index_precision = precision
+            self._foreign_index = None
+    
+    def case_index(self) -> Optional[CaseIndex]:
+        """
+        Return a CaseIndex mirroring the current case base.
+        
+        Each snapshot (and handle) builds its index once, on first use;
+        add_case derives the next snapshot's index from it. Other case base
+        lists (e.g. a caller's copy) reuse the index of a snapshot or earlier
+        list holding the same cases, extended by any new ones. Case bases that cannot be
+        encoded (mixed schemas, non-numeric values in numerical features)
+        return None and are scored case by case.
+        
+        Returns:
+            The index, or None when the case base cannot be indexed
+        """
+        cb = self.case_base
+        if not cb:
+            return None
+        if self._owns(cb):
+            index = cb.index
+            if index is None or (index and index.precision != self.index_precision):
+                with self._write_lock:
+                    index = cb.index
+                    if index is None or (index and index.precision != self.index_precision):
+                        cb.index = index = self._build_index(cb)
+            return index or None
+        
+        foreign = self._foreign_index
+        if foreign is not None and foreign[0] is cb and foreign[1] == len(cb):
+            return foreign[2] or None
+        with self._write_lock:
+            index = None
+            for known in (foreign and foreign[2], self._snapshot.index):
+                # Same cases (possibly followed by new ones) in another list
+                if known and len(known) <= len(cb) and all(map(operator.is_, known.cases, cb)):
+                    index = known
+                    break
+            if index is None:
+                index = self._build_index(cb)
+            elif len(index) < len(cb):
+                index = index.fork()
+                try:
+                    index.extend(cb[len(index):])
+                except ValueError:
+                    index = False
+            self._foreign_index = (cb, len(cb), index)
+        return index or None
+    
+    def enable_clustering(self, n_clusters: Optional[int] = None, n_probe: int = 1,
+                          exact: bool = True, seed: int = 0) -> ClusterSettings:
+        """
+        Retrieve through prototype clusters instead of scanning every case.
+        
+        retrieve_most_similar, retrieve_top_k, knn_predict (so adapt_knn)
+        and run_query's retrieval score the query against the cluster
+        prototypes, then only the cases of the best clusters. With exact
+        set, results equal a full scan (see CaseClusters.top_k). The clusters
+        are built on first use and follow add_case/remove_cases. Scores
+        reused by the rule-based adaptations still come from a full scan.
+        
+        Args:
+            n_clusters: Number of clusters (None: square root of the case base size)
+            n_probe: Clusters searched first, by prototype similarity
+            exact: Search further clusters while their similarity bound can
+                reach the k-th best (False: search only n_probe clusters)
+            seed: Seed of the prototype sample
+            
+        Returns:
+            The ClusterSettings in use
+        """
+        self.clustering = ClusterSettings(n_clusters, n_probe, exact, seed)
+        return self.clustering
+    
+    def disable_clustering(self):
+        """Go back to full scans."""
+        self.clustering = None
+    
+    def set_scan_mode(self, mode: str):
+        """
+        Choose how retrieval scans the case base when no clusters are used.
+        
+        'early' makes retrieve_most_similar, retrieve_top_k, knn_predict
+        (so adapt_knn) and run_query's retrieval use CaseIndex.scan_top_k:
+        features in descending weight order, cases abandoned once they
+        cannot beat the k-th best, and a stop after k exact matches (earlier
+        cases win ties, so later ones cannot displace them). Results equal
+        a full scan; last_scan reports the feature evaluations skipped.
+        Scores reused by the rule-based adaptations still come from a full scan.
+        
+        Args:
+            mode: 'full' (default) or 'early'
+        """
+        if mode not in SCAN_MODES:
+            raise ValueError(f"Unknown scan mode '{mode}' (choose from {SCAN_MODES})")
+        self.scan_mode = mode
+    
+    @property
+    def last_scan(self) -> Optional[ScanStats]:
+        """ScanStats of the calling thread's last early-termination scan."""
+        return self._local.last_scan
+    
+    def case_clusters(self) -> Optional[CaseClusters]:
+        """
+        Return the prototype clusters of the current case base's index.
+        
+        Returns:
+            The clusters, or None when clustering is disabled or the case
+            base cannot be indexed
+        """
+        settings = self.clustering
+        index = self.case_index() if settings is not None else None
+        if index is None:
+            return None
+        clusters = index.views.get('clusters')
+        if clusters is None or (clusters.requested, clusters.seed) != (settings.n_clusters, settings.seed):
+            with self._write_lock:
+                clusters = index.views.get('clusters')
+                if clusters is None or (clusters.requested, clusters.seed) != (settings.n_clusters, settings.seed):
+                    clusters = CaseClusters(index, settings.n_clusters,
+                                            self.feature_weights or None, settings.seed)
+                    index.views['clusters'] = clusters
+        return clusters
+    
+    def _pruned_top_k(self, query: Case, k: int,
+                         use_weights: bool) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        (positions, scores) of the top-k cases without a full scan.
+        
+        Used by the retrieval methods before falling back to scoring the
+        whole case base; here through the prototype clusters, or else the
+        early-termination scan (subclasses add their own structures, e.g.
+        CarCBRSystem's posting lists). None when neither applies: both
+        disabled, score_provider set, scores of this query already kept, or
+        a query the index cannot encode.
+        """
+        settings = self.clustering
+        if ((settings is None and self.scan_mode == 'full') or self.score_provider is not None
+                or self._memo_applies(query, use_weights)):
+            return None
+        weights = self.feature_weights if use_weights and self.feature_weights else None
+        inst = self.instrumentation
+        clusters = self.case_clusters() if settings is not None else None
+        try:
+            if clusters is not None:
+                rows, scores, scored = clusters.top_k(query, weights, k, settings.n_probe, settings.exact)
+                if inst is not None:
+                    inst.count('scans')
+                    inst.count('similarity_evaluations', scored + len(clusters))
+                return rows, scores
+            if self.scan_mode != 'early':
+                return None
+            index = self.case_index()
+            if index is None:
+                return None
+            rows, scores, stats = index.scan_top_k(query, weights, k)
+        except ValueError:
+            return None
+        self._local.last_scan = stats
+        if inst is not None:
+            inst.count('scans')
+            inst.count('similarity_evaluations', stats.cases_visited)
+            inst.count('feature_evaluations_skipped', stats.skipped)
+        return rows, scores
+    
+    def _build_index(self, cases: List[Case]):
+        """CaseIndex of cases, or False when they cannot be encoded."""
+        try:
+            return CaseIndex(self, cases, precision=self.index_precision)
+        except ValueError:
+            return False
+    
+    @pin_case_base
+    def score_case_base(self, query: Case, use_weights: bool = True,
+                        contributions: Optional[FeatureContributions] = None, *,
+                        case_base: Optional[List[Case]] = None) -> np.ndarray:
+        """
+        Calculate the similarity of a query to every case in the case base.
+        
+        Uses score_provider when it returns precomputed scores, then the
+        vectorized case index, and otherwise calls calculate_similarity for
+        each case. All three give identical scores.
+        
+        Args:
+            query: Query case
+            use_weights: Whether to use weighted similarity (True=tuned, False=baseline)
+            contributions: Optional empty FeatureContributions that receives the
+                per-feature weighted similarities of this pass (score_provider
+                is skipped, since it only has scores)
+            case_base: Case base to use instead of self.case_base (e.g. a handle)
+            
+        Returns:
+            Array of similarity scores in case base order
+        """
+        inst = self.instrumentation
+        if inst is not None:
+            inst.count('scans')
+        if self.score_provider is not None and contributions is None:
+            scores = self.score_provider(query, self.case_base, use_weights)
+            if scores is not None:
+                if inst is not None:
+                    inst.count('cache_hits')
+                return scores
+        if inst is not None:
+            inst.count('similarity_evaluations', len(self.case_base))
+        index = self.case_index()
+        if index is not None:
+            weights = self.feature_weights if use_weights and self.feature_weights else None
+            try:
+                return index.score(query, weights, contributions=contributions)
+            except ValueError:
+                pass  # query value the index cannot encode; score case by case
+        if contributions is None:
+            return np.array([self.calculate_similarity(query, case, use_weights=use_weights)
+                             for case in self.case_base], dtype=float)
+        
+        per_case = [{} for _ in self.case_base]
+        scores = np.array([self.calculate_similarity(query, case, use_weights, parts)
+                           for case, parts in zip(self.case_base, per_case)], dtype=float)
+        contributions.feature_names = list(query.features)
+        contributions.terms = [np.array([[parts.get(name, 0.0) for parts in per_case]])
+                               for name in contributions.feature_names]
+        contributions.total_weight = 1.0
+        return scores
+    
+    @pin_case_base
+    def score_case_base_batch(self, queries: List[Case], use_weights: bool = True,
+                              contributions: Optional[FeatureContributions] = None, *,
+                              case_base: Optional[List[Case]] = None) -> np.ndarray:
+        """
+        Calculate the similarity of several queries to every case in the case base.
+        
+        Scores the whole batch through the case index when possible (no
+        score_provider, queries with a common feature order); otherwise
+        falls back to score_case_base per query. Scores are identical either way.
+        
+        Args:
+            queries: Query cases
+            use_weights: Whether to use weighted similarity
+            contributions: Optional empty FeatureContributions that receives the
+                per-feature weighted similarities (one row per query)
+            case_base: Case base to use instead of self.case_base (e.g. a handle)
+            
+        Returns:
+            Array of shape (len(queries), len(case_base))
+        """
+        index = self.case_index() if self.score_provider is None or contributions is not None else None
+        if index is not None and queries:
+            weights = self.feature_weights if use_weights and self.feature_weights else None
+            try:
+                scores = index.score_batch(queries, weights, contributions=contributions)
+            except ValueError:
+                scores = None
+            if scores is not None:
+                inst = self.instrumentation
+                if inst is not None:
+                    inst.count('scans', len(queries))
+                    inst.count('similarity_evaluations', scores.size)
+                return scores
+        if contributions is None:
+            return np.array([self.score_case_base(query, use_weights=use_weights)
+                             for query in queries], dtype=float).reshape(len(queries), -1)
+        
+        parts = [FeatureContributions() for _ in queries]
+        scores = np.array([self.score_case_base(query, use_weights, part)
+                           for query, part in zip(queries, parts)], dtype=float)
+        stacked = FeatureContributions.stack(parts)
+        contributions.feature_names = stacked.feature_names
+        contributions.terms = stacked.terms
+        contributions.total_weight = stacked.total_weight
+        return scores.reshape(len(queries), -1)
+    
+    @pin_case_base
+    def retrieve_most_similar(self, query: Case, use_weights: bool = True,
+                              with_contributions: bool = False, *,
+                              case_base: Optional[List[Case]] = None) -> Tuple:
         """
         Retrieve the most similar case from case base.
         
+        Ties are resolved in favour of the earliest case in the case base.
+        
         Args:
             query: Query case
             use_weights: Whether to use weighted similarity (True=tuned, False=baseline)
+            with_contributions: Also return each feature's weighted share of the similarity
+            case_base: Case base to use instead of self.case_base (e.g. a handle)
             
         Returns:
-            Tuple of (most_similar_case, similarity_score)
+            Tuple of (most_similar_case, similarity_score), plus a
+            {feature: contribution} dictionary when with_contributions is set
         """
         if not self.case_base:
             raise ValueError("Case base is empty")
         
-        max_similarity = -1
-        best_case = None
-        
-        for case in self.case_base:
-            sim = self.calculate_similarity(query, case, use_weights=use_weights)
-            if sim > max_similarity:
-                max_similarity = sim
-                best_case = case
+        if with_contributions:
+            scores, contributions, row = self._contributions_for(query, use_weights)
+        else:
+            pruned = self._pruned_top_k(query, 1, use_weights)
+            if pruned is not None:
+                return self.case_base[int(pruned[0][0])], float(pruned[1][0])
+            scores = self._scores_for(query, use_weights)
+        best = int(np.argmax(scores))
         
-        return best_case, max_similarity
+        if with_contributions:
+            return self.case_base[best], float(scores[best]), contributions.for_cases([best], row)[0]
+        return self.case_base[best], float(scores[best])
     
+    @pin_case_base
     def retrieve_top_k(self, query: Case, k: int = 3, 
-                      use_weights: bool = True) -> List[Tuple[Case, float]]:
+                      use_weights: bool = True, with_contributions: bool = False, *,
+                      case_base: Optional[List[Case]] = None) -> List[Tuple]:
         """
         Retrieve top-k most similar cases from case base.
         
@@ -220,22 +886,256 @@ class CBRSystem:
             query: Query case
             k: Number of cases to retrieve
             use_weights: Whether to use weighted similarity
+            with_contributions: Also return each feature's weighted share of the similarity
+            case_base: Case base to use instead of self.case_base (e.g. a handle)
+            
+        Returns:
+            List of (case, similarity) tuples, sorted by similarity (descending),
+            with a third {feature: contribution} element when with_contributions
+            is set. Ties keep case base order.
+        """
+        if not self.case_base:
+            raise ValueError("Case base is empty")
+        
+        if with_contributions:
+            scores, contributions, row = self._contributions_for(query, use_weights)
+        else:
+            pruned = self._pruned_top_k(query, k, use_weights)
+            if pruned is not None:
+                return [(self.case_base[i], float(score))
+                        for i, score in zip(pruned[0].tolist(), pruned[1].tolist())]
+            scores = self._scores_for(query, use_weights)
+        
+        # Highest similarities first, ties in case base order
+        order = top_k_indices(scores, k)
+        
+        if with_contributions:
+            return [(self.case_base[i], float(scores[i]), parts)
+                    for i, parts in zip(order, contributions.for_cases(order, row))]
+        return [(self.case_base[i], float(scores[i])) for i in order]
+    
+    def _combine_neighbours(self, solutions: List[Any], similarities: np.ndarray) -> Any:
+        """
+        k-NN prediction from neighbour solutions: similarity-weighted vote.
+        
+        Ties go to the class seen first among the neighbours (most similar first).
+        Subclasses with numeric solutions override this with a weighted mean.
+        """
+        totals: Dict[Any, float] = {}
+        for solution, similarity in zip(solutions, similarities.tolist()):
+            totals[solution] = totals.get(solution, 0.0) + similarity
+        return max(totals, key=totals.get)
+    
+    def _knn_from_scores(self, scores: np.ndarray, k: int) -> Any:
+        """Combine the k highest-scoring cases of a score vector."""
+        order = top_k_indices(scores, k)
+        return self._combine_neighbours([self.case_base[i].solution for i in order.tolist()],
+                                        scores[order])
+    
+    @pin_case_base
+    def knn_predict(self, query: Case, k: Optional[int] = None,
+                    use_weights: bool = True, *,
+                    case_base: Optional[List[Case]] = None) -> Any:
+        """
+        Predict a solution from the k most similar cases.
+        
+        Args:
+            query: Query case
+            k: Number of neighbours (default: self.knn_k)
+            use_weights: Whether to use weighted similarity
+            case_base: Case base to use instead of self.case_base (e.g. a handle)
             
         Returns:
-            List of (case, similarity) tuples, sorted by similarity (descending)
+            Weighted vote (classification) or weighted mean (regression)
         """
         if not self.case_base:
             raise ValueError("Case base is empty")
+        k = self.knn_k if k is None else k
+        pruned = self._pruned_top_k(query, k, use_weights)
+        if pruned is not None:
+            return self._combine_neighbours([self.case_base[i].solution for i in pruned[0].tolist()],
+                                            pruned[1])
+        return self._knn_from_scores(self._scores_for(query, use_weights), k)
+    
+    @pin_case_base
+    def knn_predict_batch(self, queries: List[Case], k: Optional[int] = None,
+                          use_weights: bool = True, *,
+                          case_base: Optional[List[Case]] = None) -> List[Any]:
+        """
+        k-NN predictions for a batch of queries (same results as knn_predict).
         
-        similarities = []
-        for case in self.case_base:
-            sim = self.calculate_similarity(query, case, use_weights=use_weights)
-            similarities.append((case, sim))
+        Queries are scored in blocks of at most BATCH_SCORE_ELEMENTS similarities.
         
-        # Sort by similarity (descending)
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        Args:
+            queries: Query cases
+            k: Number of neighbours (default: self.knn_k)
+            use_weights: Whether to use weighted similarity
+            case_base: Case base to use instead of self.case_base (e.g. a handle)
+            
+        Returns:
+            List of predictions in query order
+        """
+        if not self.case_base:
+            raise ValueError("Case base is empty")
+        k = self.knn_k if k is None else k
+        chunk = max(1, BATCH_SCORE_ELEMENTS // len(self.case_base))
+        predictions = []
+        for start in range(0, len(queries), chunk):
+            block = self.score_case_base_batch(queries[start:start + chunk], use_weights=use_weights)
+            predictions.extend(self._knn_from_scores(scores, k) for scores in block)
+        return predictions
+    
+    @pin_case_base
+    def adapt_knn(self, retrieved_case: Case, query: Case, system: Optional['CBRSystem'] = None, *,
+                  k: Optional[int] = None, use_weights: Optional[bool] = None,
+                  case_base: Optional[List[Case]] = None) -> Any:
+        """
+        k-NN prediction as an adaptation step for run_query.
+        
+        Follows the adapt_fn(retrieved_case, query, system) contract, so it
+        can be passed directly (adapt_fn=system.adapt_knn). Inside run_query
+        it weights similarity as the retrieval did (run_query's tuned), so
+        it reuses that retrieval's scores instead of scanning again.
         
-        return similarities[:k]
+        Args:
+            retrieved_case: Most similar case (unused)
+            query: Query case
+            system: System passed by run_query (unused; this is self)
+            k: Number of neighbours (default: self.knn_k)
+            use_weights: Whether to use weighted similarity (default: as
+                run_query's retrieval of this query, else True)
+            case_base: Case base to use instead of self.case_base (e.g. a handle)
+            
+        Returns:
+            k-NN prediction
+        """
+        if use_weights is None:
+            last = self._local.last_retrieval
+            use_weights = last[1] if last is not None and last[0] is query else True
+        return self.knn_predict(query, k=k, use_weights=use_weights)
+    
+    def _retrieve_for_query(self, query: Case, use_weights: bool) -> Tuple[Case, float]:
+        """
+        Retrieval step of run_query.
+        
+        Same result as retrieve_most_similar; the scores are kept so that
+        adaptation can reuse them (see _scores_for).
+        """
+        if not self.case_base:
+            raise ValueError("Case base is empty")
+        self._local.last_retrieval = (query, use_weights)
+        memo = self._local.last_scores
+        if self._memo_applies(query, use_weights) and (memo[6] is not None or not self.keep_contributions):
+            # Same query against the same case base again (e.g. another condition)
+            return self._retrieve_from_scores(query, use_weights, memo[5], memo[6], memo[7])
+        if not self.keep_contributions:
+            pruned = self._pruned_top_k(query, 1, use_weights)
+            if pruned is not None:
+                return self.case_base[int(pruned[0][0])], float(pruned[1][0])
+        contributions = FeatureContributions() if self.keep_contributions else None
+        scores = self.score_case_base(query, use_weights, contributions)
+        return self._retrieve_from_scores(query, use_weights, scores, contributions)
+    
+    def _retrieve_from_scores(self, query: Case, use_weights: bool, scores: np.ndarray,
+                              contributions: Optional[FeatureContributions] = None,
+                              row: int = 0) -> Tuple[Case, float]:
+        """
+        Most similar case for already computed scores; keeps them for adaptation.
+        
+        contributions (if any) is the pass's FeatureContributions and row
+        the query's row in it.
+        """
+        self._local.last_scores = (query, use_weights, self.feature_weights,
+                                   self.case_base, len(self.case_base), scores, contributions, row)
+        best = int(np.argmax(scores))
+        return self.case_base[best], float(scores[best])
+    
+    def _scores_for(self, query: Case, use_weights: bool) -> np.ndarray:
+        """
+        Scores of a query, reusing run_query's retrieval pass while it still applies.
+        
+        The adaptation rules and the retrieval helpers call this, so one
+        query costs a single scan however many neighbours they look up.
+        """
+        memo = self._local.last_scores
+        if self._memo_applies(query, use_weights):
+            return memo[5]
+        return self.score_case_base(query, use_weights=use_weights)
+    
+    def _memo_applies(self, query: Case, use_weights: bool) -> bool:
+        """Whether the last retrieval pass scored this query against the current case base."""
+        memo = self._local.last_scores
+        return (memo is not None and memo[0] is query and memo[1] == use_weights
+                and memo[2] is self.feature_weights and memo[3] is self.case_base
+                and memo[4] == len(self.case_base))
+    
+    def _contributions_for(self, query: Case,
+                           use_weights: bool) -> Tuple[np.ndarray, FeatureContributions, int]:
+        """
+        Scores and per-feature contributions of a query, with its row in them.
+        
+        Reuses the last retrieval pass when it kept contributions (see
+        keep_contributions); otherwise scores once and keeps the result.
+        """
+        memo = self._local.last_scores
+        if self._memo_applies(query, use_weights) and memo[6] is not None:
+            return memo[5], memo[6], memo[7]
+        contributions = FeatureContributions()
+        scores = self.score_case_base(query, use_weights, contributions)
+        self._local.last_scores = (query, use_weights, self.feature_weights,
+                                   self.case_base, len(self.case_base), scores, contributions, 0)
+        return scores, contributions, 0
+    
+    @pin_case_base
+    def solve_batch(self, queries: List[Case], adapt_fn: Optional[Callable] = None,
+                    k: int = 3, use_weights: bool = True,
+                    with_contributions: bool = False, *,
+                    case_base: Optional[List[Case]] = None) -> List[Tuple]:
+        """
+        Retrieve and adapt a batch of queries against the current case base.
+        
+        Queries are scored in blocks of at most BATCH_SCORE_ELEMENTS
+        similarities; each query then goes through the same retrieval and
+        adaptation steps as run_query without learning (same solutions),
+        with adaptation reusing the block's scores.
+        
+        Args:
+            queries: Query cases
+            adapt_fn: Optional adaptation function(retrieved_case, query, system)
+            k: Number of neighbours to report per query
+            use_weights: Whether to use weighted similarity
+            with_contributions: Also report each neighbour's per-feature
+                contributions, kept from the block's scoring pass
+            case_base: Case base to use instead of self.case_base (e.g. a handle)
+            
+        Returns:
+            List of (solution, neighbour case base positions, neighbour
+            similarities) per query, neighbours most similar first, plus a
+            list of {feature: contribution} per neighbour when with_contributions is set
+        """
+        if not self.case_base:
+            raise ValueError("Case base is empty")
+        chunk = max(1, BATCH_SCORE_ELEMENTS // len(self.case_base))
+        results = []
+        for start in range(0, len(queries), chunk):
+            batch = queries[start:start + chunk]
+            keep = with_contributions or self.keep_contributions
+            contributions = FeatureContributions() if keep else None
+            block = self.score_case_base_batch(batch, use_weights, contributions)
+            for row, (query, scores) in enumerate(zip(batch, block)):
+                retrieved_case, _ = self._retrieve_from_scores(query, use_weights, scores,
+                                                               contributions, row)
+                if adapt_fn:
+                    solution = adapt_fn(retrieved_case, query, self)
+                else:
+                    solution = retrieved_case.solution
+                order = top_k_indices(scores, k)
+                if with_contributions:
+                    results.append((solution, order, scores[order],
+                                    contributions.for_cases(order, row)))
+                else:
+                    results.append((solution, order, scores[order]))
+        return results
     
     def run_query(self, cb: List['Case'], query: Case, tuned: bool = False,
                  adapt_fn: Optional[Callable] = None,
@@ -253,10 +1153,13 @@ class CBRSystem:
         1. Retrieve: Find the most similar case in cb
         2. Adapt: Modify solution if an adaptation function is provided
         3. Solve: Return the solution
-        4. Retain: Append the new case to cb when learning is enabled
+        4. Retain: When learning is enabled, publish cb plus the new case as
+           the system's case base and return it (cb itself is not changed)
 
         Args:
-            cb: Current case base (list of Case objects)
+            cb: Current case base (list of Case objects, or a handle from
+                case_base_handle: retaining then gives a new handle and leaves
+                the system's case base unchanged)
             query: Query case (without solution)
             tuned: Whether to use tuned similarity (weighted) or baseline (equal)
             adapt_fn: Optional adaptation function(retrieved_case, query) -> solution
@@ -265,30 +1168,53 @@ class CBRSystem:
         Returns:
             [solution, updated_case_base]  — list with solution and (possibly grown) cb
         """
-        # Temporarily set case base to the provided cb for retrieval
-        original_case_base = self.case_base
-        self.case_base = cb
+        inst = self.instrumentation
+        if inst is not None:
+            t = inst.start_query()
 
-        # 1. RETRIEVE: Find most similar case
-        retrieved_case, similarity = self.retrieve_most_similar(query, use_weights=tuned)
+        # Retrieve and adapt against cb in this thread only; other threads
+        # keep their own case base. Retaining into one of our snapshots
+        # extends the latest snapshot, so concurrent retentions are all kept
+        local = self._local
+        outer = local.case_base, local.retain_base
+        local.case_base = cb
+        local.retain_base = None if self._owns(cb) and cb.lineage is self._lineage else cb
+        similarity = None
+        error = None
+        try:
+            # 1. RETRIEVE: Find most similar case
+            retrieved_case, similarity = self._retrieve_for_query(query, use_weights=tuned)
+            if inst is not None:
+                t = inst.lap('retrieve', t)
 
-        # 2. ADAPT & 3. SOLVE: Get solution (with or without adaptation)
-        if adapt_fn:
-            solution = adapt_fn(retrieved_case, query, self)
-        else:
-            solution = retrieved_case.solution
-
-        # Create new case with solution
-        new_case = Case(features=query.features, solution=solution)
+            # 2. ADAPT & 3. SOLVE: Get solution (with or without adaptation)
+            if adapt_fn:
+                solution = adapt_fn(retrieved_case, query, self)
+            else:
+                solution = retrieved_case.solution
+            if inst is not None:
+                t = inst.lap('adapt', t)
 
-        # 4. RETAIN: Add to case base if learning enabled
-        if learning:
-            cb = cb + [new_case]      # Return a new list (non-destructive)
-            self.add_case(new_case)   # Also update internal state
+            # Create new case with solution
+            new_case = Case(features=query.features, solution=solution)
 
-        # Restore internal case base
-        if not learning:
-            self.case_base = original_case_base
+            # 4. RETAIN: Publish a new case base if learning enabled (cb is not changed)
+            if learning:
+                self.add_case(new_case)
+                cb = local.published
+            if inst is not None:
+                inst.lap('retain', t)
+        except BaseException as failure:
+            error = type(failure).__name__
+            raise
+        finally:
+            local.case_base, local.retain_base = outer
+            # Close the query record even if a step raised (sinks such as
+            # ProfilerSink stop per-query work here)
+            if inst is not None:
+                fields = {} if error is None else {'error': error}
+                inst.end_query(case_base_size=len(cb), similarity=similarity,
+                               tuned=tuned, learning=learning, **fields)
 
         return [solution, cb]
 
@@ -77,16 +77,46 @@ class DataLoader:
         Target: Y1 (heating_load), Y2 (cooling_load) - we use Y1 (heating_load)
         
         Args:
-            filepath: Path to Excel file
+            filepath: Path to Excel file (or a .csv file with the same columns)
             
         Returns:
             List of Case objects
         """
+        data = DataLoader.read_energy_table(filepath)
+        cases = DataLoader.energy_cases_from_table(data)
+        
+        print(f"Loaded {len(cases)} energy cases")
+        return cases
+    
+    @staticmethod
+    def read_energy_table(filepath: str = 'ENB2012_data.xlsx') -> pd.DataFrame:
+        """
+        Read the raw ENB2012 table (columns X1-X8, Y1, Y2).
+        
+        Args:
+            filepath: Path to .xlsx file, or .csv file with a header row
+            
+        Returns:
+            DataFrame with the raw columns
+        """
         try:
-            data = pd.read_excel(filepath)
+            if filepath.endswith('.csv'):
+                return pd.read_csv(filepath)
+            return pd.read_excel(filepath)
         except FileNotFoundError:
             raise FileNotFoundError(f"Cannot find {filepath}")
+    
+    @staticmethod
+    def energy_cases_from_table(data: pd.DataFrame) -> List[Case]:
+        """
+        Create energy Case objects from a raw ENB2012 table.
         
+        Args:
+            data: DataFrame with columns X1-X8 and Y1
+            
+        Returns:
+            List of Case objects
+        """
         # Feature names are X1-X8, target is Y1 (heating load)
         feature_names = ['X1', 'X2', 'X3', 'X4', 'X5', 'X6', 'X7', 'X8']
         
@@ -114,7 +144,6 @@ class DataLoader:
             )
             cases.append(case)
         
-        print(f"Loaded {len(cases)} energy cases")
         return cases
     
     @staticmethod
@@ -205,25 +234,22 @@ class DataLoader:
         return train_cases, test_cases
 
 
-def load_car_system_data(random_seed: int = 42) -> Tuple[List[Case], List[Case]]:
+def load_car_cases() -> List[Case]:
     """
-    Load car data, split into train/test.
+    Load all car cases (no split).
     
     Returns:
-        Tuple of (train_cases, test_cases)
+        List of Case objects
     """
-    loader = DataLoader()
-    cases = loader.load_car_data()
-    train, test = loader.train_test_split(cases, train_ratio=0.8, random_seed=random_seed)
-    return train, test
+    return DataLoader.load_car_data()
 
 
-def load_energy_system_data(random_seed: int = 42) -> Tuple[List[Case], List[Case]]:
+def load_energy_cases() -> List[Case]:
     """
-    Load energy data, normalize, split into train/test.
+    Load all energy cases with z-score normalized features (no split).
     
     Returns:
-        Tuple of (train_cases, test_cases)
+        List of Case objects
     """
     loader = DataLoader()
     cases = loader.load_energy_data()
@@ -233,9 +259,32 @@ def load_energy_system_data(random_seed: int = 42) -> Tuple[List[Case], List[Cas
     
     # Normalize numerical features
     normalized_cases, params = loader.normalize_features(cases, feature_names, method='zscore')
+    return normalized_cases
+
+
+def load_car_system_data(random_seed: int = 42) -> Tuple[List[Case], List[Case]]:
+    """
+    Load car data, split into train/test.
+    
+    Returns:
+        Tuple of (train_cases, test_cases)
+    """
+    cases = load_car_cases()
+    train, test = DataLoader.train_test_split(cases, train_ratio=0.8, random_seed=random_seed)
+    return train, test
+
+
+def load_energy_system_data(random_seed: int = 42) -> Tuple[List[Case], List[Case]]:
+    """
+    Load energy data, normalize, split into train/test.
+    
+    Returns:
+        Tuple of (train_cases, test_cases)
+    """
+    normalized_cases = load_energy_cases()
     
     # Split
-    train, test = loader.train_test_split(normalized_cases, train_ratio=0.8, random_seed=random_seed)
+    train, test = DataLoader.train_test_split(normalized_cases, train_ratio=0.8, random_seed=random_seed)
     
     return train, test
 
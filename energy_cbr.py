@@ -4,9 +4,186 @@ Implements case-based reasoning for predicting building heating loads.
 """
 
 from typing import List, Tuple, Optional
+import copy
+import time
 import numpy as np
 from data_loader import Case
-from cbr_system import CBRSystem
+from case_index import CaseIndex
+from cbr_system import CBRSystem, pin_case_base, top_k_indices, BATCH_SCORE_ELEMENTS
+
+
+class SolutionStats:
+    """
+    Running statistics of the case base solutions.
+    
+    Updated in O(1) per retained case: count, min, max, mean and variance
+    (Welford), plus the segment boundaries used by segment-based adaptation.
+    """
+    
+    # Fractions of the solution range that separate the four segments
+    SEGMENT_FRACTIONS = (0.25, 0.5, 0.75)
+    
+    def __init__(self, solutions: Optional[List[float]] = None):
+        self.count = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._boundaries: Optional[Tuple[float, ...]] = None
+        if solutions:
+            self.update_batch(solutions)
+    
+    def update(self, solution: float):
+        """Add one solution."""
+        solution = float(solution)
+        self.count += 1
+        delta = solution - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (solution - self.mean)
+        if solution < self.min:
+            self.min = solution
+            self._boundaries = None
+        if solution > self.max:
+            self.max = solution
+            self._boundaries = None
+    
+    def update_batch(self, solutions: List[float]):
+        """Add many solutions (merged with Chan's parallel formula)."""
+        values = np.asarray(solutions, dtype=float)
+        if values.size == 0:
+            return
+        n = values.size
+        batch_mean = float(values.mean())
+        batch_m2 = float(((values - batch_mean) ** 2).sum())
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self._m2 += batch_m2 + delta * delta * self.count * n / total
+        self.mean += delta * n / total
+        self.count = total
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._boundaries = None
+    
+    @property
+    def variance(self) -> float:
+        return self._m2 / self.count if self.count else 0.0
+    
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.variance))
+    
+    def segment_boundaries(self) -> Tuple[float, ...]:
+        """Boundaries q1, q2, q3 at 25/50/75% of the solution range."""
+        if self._boundaries is None:
+            span = self.max - self.min
+            self._boundaries = tuple(self.min + span * f for f in self.SEGMENT_FRACTIONS)
+        return self._boundaries
+
+
+class SolutionStatsView:
+    """
+    SolutionStats of the cases of one CaseIndex version.
+    
+    Registered as index.views['solutions'], so forks copy the statistics
+    (O(1)) and extend() updates them with the added cases only; delete()
+    recomputes them, since min/max cannot be downdated.
+    """
+    
+    def __init__(self, index: CaseIndex):
+        self.index = index
+        self.stats = SolutionStats([case.solution for case in index.cases])
+    
+    def fork(self, index: CaseIndex) -> 'SolutionStatsView':
+        forked = SolutionStatsView.__new__(SolutionStatsView)
+        forked.index = index
+        forked.stats = copy.copy(self.stats)
+        return forked
+    
+    def extend(self, start: int, end: int):
+        self.stats.update_batch([case.solution for case in self.index.cases[start:end]])
+    
+    def delete(self, positions: np.ndarray):
+        self.stats = SolutionStats([case.solution for case in self.index.cases])
+
+
+class CorrelationStats:
+    """
+    Sufficient statistics for feature/solution correlations.
+    
+    Keeps per-feature means, centered sums of squares and centered
+    cross-products with the solution (Welford's update), so correlations
+    can be refreshed in O(features) after each retained case.
+    """
+    
+    def __init__(self, feature_names: List[str]):
+        n_features = len(feature_names)
+        self.feature_names = list(feature_names)
+        self.count = 0
+        self.mean_x = np.zeros(n_features)
+        self.mean_y = 0.0
+        self.m2_x = np.zeros(n_features)
+        self.m2_y = 0.0
+        self.c_xy = np.zeros(n_features)
+    
+    def _vector(self, case: Case) -> np.ndarray:
+        return np.array([case.features.get(name, 0.0) for name in self.feature_names], dtype=float)
+    
+    def update(self, case: Case):
+        """Add one case in O(features)."""
+        x = self._vector(case)
+        y = float(case.solution)
+        self.count += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x += dx / self.count
+        self.mean_y += dy / self.count
+        self.m2_x += dx * (x - self.mean_x)
+        self.m2_y += dy * (y - self.mean_y)
+        self.c_xy += dx * (y - self.mean_y)
+    
+    def update_batch(self, X: np.ndarray, y: np.ndarray):
+        """
+        Add many cases (merged with Chan's parallel formula).
+        
+        Args:
+            X: Feature values, shape (cases, features)
+            y: Solutions, shape (cases,)
+        """
+        n = len(y)
+        if n == 0:
+            return
+        batch_mean_x = X.mean(axis=0)
+        batch_mean_y = float(y.mean())
+        centered_x = X - batch_mean_x
+        centered_y = y - batch_mean_y
+        total = self.count + n
+        dx = batch_mean_x - self.mean_x
+        dy = batch_mean_y - self.mean_y
+        factor = self.count * n / total
+        self.m2_x += (centered_x ** 2).sum(axis=0) + dx * dx * factor
+        self.m2_y += float((centered_y ** 2).sum()) + dy * dy * factor
+        self.c_xy += centered_x.T @ centered_y + dx * dy * factor
+        self.mean_x += dx * n / total
+        self.mean_y += dy * n / total
+        self.count = total
+    
+    def weights(self) -> Optional[dict]:
+        """
+        Absolute correlations normalized to sum to 1.
+        
+        Returns:
+            Dictionary of feature weights, or None if no feature correlates
+        """
+        if self.count < 2 or self.m2_y <= 0:
+            return None
+        valid = self.m2_x > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = np.abs(self.c_xy / np.sqrt(self.m2_x * self.m2_y))
+        corr = np.where(valid & ~np.isnan(corr), np.minimum(corr, 1.0), 0.0)
+        total = float(corr.sum())
+        if total == 0:
+            return None
+        return {name: float(c) / total for name, c in zip(self.feature_names, corr)}
 
 
 class EnergyCBRSystem(CBRSystem):
@@ -17,8 +194,14 @@ class EnergyCBRSystem(CBRSystem):
     Features: X1-X8 (8 numerical features)
     """
     
-    def __init__(self):
-        """Initialize energy regression system."""
+    def __init__(self, weight_refresh_interval: Optional[int] = None):
+        """
+        Initialize energy regression system.
+        
+        Args:
+            weight_refresh_interval: Refresh the correlation-tuned weights after
+                every N retained cases (None = keep the weights fitted in set_case_base)
+        """
         
         # All features are numerical
         feature_types = {
@@ -60,7 +243,10 @@ class EnergyCBRSystem(CBRSystem):
         }
         
         super().__init__(feature_weights=baseline_weights, feature_types=feature_types)
-        self.case_base_with_solutions: List[Tuple[Case, float]] = []
+        self.solution_stats = SolutionStats()
+        self.correlation_stats: Optional[CorrelationStats] = None
+        self.weight_refresh_interval = weight_refresh_interval
+        self._retained_since_refresh = 0
         self._computed_tuned_weights: Optional[dict] = None
     
     def set_tuned_mode(self):
@@ -83,19 +269,113 @@ class EnergyCBRSystem(CBRSystem):
             'glazing_type': 1.0
         }
     
-    def set_case_base(self, cases: List[Case]):
-        """Override to store both cases and solutions for adaptation."""
-        super().set_case_base(cases)
-        self.case_base_with_solutions = [(case, case.solution) for case in cases]
+    @property
+    def case_base_with_solutions(self) -> List[Tuple[Case, float]]:
+        """(case, solution) pairs of the case base, built on demand."""
+        return [(case, case.solution) for case in self.case_base]
+    
+    def set_case_base(self, cases: List[Case], verbose: bool = True):
+        """Override to initialize solution statistics and tuned weights."""
+        super().set_case_base(cases, verbose=verbose)
+        self.solution_stats = SolutionStats([case.solution for case in cases])
         self._computed_tuned_weights = self._compute_correlation_weights(cases)
+        self._retained_since_refresh = 0
+    
+    def _retained(self, case: Case):
+        """Override to keep solution and correlation statistics current (case extends the snapshot)."""
+        self.solution_stats.update(case.solution)
+        if self.correlation_stats is not None:
+            self.correlation_stats.update(case)
+            self._retained_since_refresh += 1
+            if (self.weight_refresh_interval and
+                    self._retained_since_refresh >= self.weight_refresh_interval):
+                self.refresh_tuned_weights()
+    
+    def _replaced(self):
+        """
+        Override: recompute the statistics from the new case base, and (with
+        weight_refresh_interval set) refresh the tuned weights from them.
+        """
+        self._recompute_statistics()
+        if self.weight_refresh_interval:
+            self.refresh_tuned_weights()
+    
+    def _evicted(self, cases: List[Case]):
+        """Override: recompute the statistics from the remaining cases (min/max cannot be downdated)."""
+        self._recompute_statistics()
+    
+    def _recompute_statistics(self):
+        """Solution and correlation statistics of the system's snapshot, from scratch."""
+        cases = self._snapshot
+        self.solution_stats = SolutionStats([case.solution for case in cases])
+        if self.correlation_stats is not None:
+            stats = CorrelationStats(self.correlation_stats.feature_names)
+            if cases:
+                stats.update_batch(np.array([stats._vector(case) for case in cases]),
+                                   np.array([case.solution for case in cases], dtype=float))
+            self.correlation_stats = stats
+    
+    @pin_case_base
+    def solution_stats_for_case_base(self, *, case_base: Optional[List[Case]] = None) -> SolutionStats:
+        """
+        Solution statistics of the current case base (a pinned snapshot or
+        handle inside a call, else the system's own).
+        
+        The system's latest snapshot uses solution_stats; other versions
+        keep theirs with their index (see SolutionStatsView), or compute
+        them when the case base cannot be indexed.
+        
+        Args:
+            case_base: Case base to use instead of self.case_base (e.g. a handle)
+            
+        Returns:
+            SolutionStats of the case base
+        """
+        cb = self.case_base
+        if cb is self._snapshot:
+            return self.solution_stats
+        index = self.case_index()
+        if index is None:
+            return SolutionStats([case.solution for case in cb])
+        view = index.views.get('solutions')
+        if view is None:
+            with self._write_lock:
+                view = index.views.get('solutions')
+                if view is None:
+                    view = index.views['solutions'] = SolutionStatsView(index)
+        return view.stats
     
-    def add_case(self, case: Case):
-        """Override to maintain parallel structure."""
-        super().add_case(case)
-        self.case_base_with_solutions.append((case, case.solution))
+    def _combine_neighbours(self, solutions: List[float], similarities: np.ndarray) -> float:
+        """k-NN prediction: similarity-weighted mean of the neighbour loads."""
+        solutions = np.array(solutions, dtype=float)
+        total = float(np.sum(similarities))
+        if total > 0:
+            return float(np.dot(similarities, solutions) / total)
+        return float(np.mean(solutions))
     
+    def refresh_tuned_weights(self):
+        """
+        Recompute correlation-tuned weights from the running statistics.
+        
+        Costs O(features). If tuned mode is active, the new weights take
+        effect immediately.
+        """
+        self._retained_since_refresh = 0
+        if self.correlation_stats is None:
+            return
+        weights = self.correlation_stats.weights()
+        if weights is None:
+            return
+        in_tuned_mode = (self._computed_tuned_weights is not None and
+                         self.feature_weights is self._computed_tuned_weights)
+        self._computed_tuned_weights = weights
+        if in_tuned_mode:
+            self.feature_weights = weights
+    
+    @pin_case_base
     def adapt_regression(self, retrieved_case: Case, query: Case,
-                        use_multiple_rules: bool = True) -> float:
+                        use_multiple_rules: bool = True, *,
+                        case_base: Optional[List[Case]] = None) -> float:
         """
         Adapt retrieved case solution for regression.
         
@@ -109,6 +389,7 @@ class EnergyCBRSystem(CBRSystem):
             retrieved_case: Most similar case from case base
             query: Query case
             use_multiple_rules: Whether to use multiple rules (True) or just retrieved
+            case_base: Case base to use instead of self.case_base (e.g. a handle)
             
         Returns:
             Adapted heating load prediction
@@ -118,22 +399,33 @@ class EnergyCBRSystem(CBRSystem):
             return retrieved_case.solution
         
         predictions = []
+        inst = self.instrumentation
+        if inst is not None:
+            t = time.perf_counter()
         
         # Rule 1: Difference scaling
         rule1_pred = self._difference_scaling(retrieved_case, query)
         predictions.append(rule1_pred)
+        if inst is not None:
+            t = inst.lap('adapt.difference_scaling', t)
         
         # Rule 2: Linear extrapolation
         rule2_pred = self._linear_extrapolation(retrieved_case, query)
         predictions.append(rule2_pred)
+        if inst is not None:
+            t = inst.lap('adapt.linear_extrapolation', t)
         
         # Rule 3: Multi-case averaging
         rule3_pred = self._multi_case_averaging(query)
         predictions.append(rule3_pred)
+        if inst is not None:
+            t = inst.lap('adapt.multi_case_averaging', t)
         
         # Rule 4: Segment-based adaptation
         rule4_pred = self._segment_based_adaptation(retrieved_case, query)
         predictions.append(rule4_pred)
+        if inst is not None:
+            t = inst.lap('adapt.segment_based', t)
         
         # Blend adapted predictions with retrieved solution for stability
         adapted_mean = np.mean(predictions) if predictions else retrieved_case.solution
@@ -142,6 +434,8 @@ class EnergyCBRSystem(CBRSystem):
         # Safeguard: avoid large deviations from retrieved case
         top_k = self.retrieve_top_k(query, k=5, use_weights=True)
         top_solutions = [case.solution for case, _ in top_k] if top_k else []
+        if inst is not None:
+            inst.lap('adapt.safeguard', t)
         if top_solutions:
             std_dev = np.std(top_solutions)
             threshold = max(0.5, 0.5 * std_dev)
@@ -208,59 +502,110 @@ class EnergyCBRSystem(CBRSystem):
         Returns:
             Adapted prediction
         """
-        base_solution = retrieved_case.solution
-        adjustment = 0.0
+        return float(self.linear_extrapolation_batch([retrieved_case], [query])[0])
+    
+    @pin_case_base
+    def linear_extrapolation_batch(self, retrieved_cases: List[Case],
+                                   queries: List[Case], k: int = 10, *,
+                                   case_base: Optional[List[Case]] = None) -> np.ndarray:
+        """
+        Rule 2 for a batch of queries.
         
-        # Learn slopes from case base (use top 10 similar cases to query)
-        similar_cases = self.retrieve_top_k(query, k=min(10, len(self.case_base)))
+        Scores the whole block of queries against the case base at once
+        (score_case_base_batch, in chunks of BATCH_SCORE_ELEMENTS) and takes
+        each query's top-k neighbours from its row; a single query reuses
+        run_query's retrieval instead. Every feature's local slope is then
+        computed for every query in one pass over the stacked
+        (queries x neighbours x features) block.
         
-        for feature_name in retrieved_case.features:
-            if feature_name not in query.features:
-                continue
+        Args:
+            retrieved_cases: Reference case for each query
+            queries: Query cases
+            k: Neighbours used to fit the local slopes
+            case_base: Case base to use instead of self.case_base (e.g. a handle)
             
-            # Calculate correlation of this feature with heating load
-            feature_values = []
-            solutions = []
+        Returns:
+            Array of adapted predictions
+        """
+        if not queries:
+            return np.zeros(0)
+        
+        # Features of the retrieved case that the query also has
+        feature_names = [name for name in retrieved_cases[0].features
+                         if name in queries[0].features]
+        case_base = self.case_base
+        k = min(k, len(case_base))
+        
+        if len(queries) == 1:
+            neighbours = [[case for case, _ in self.retrieve_top_k(queries[0], k=k)]]
+        else:
+            neighbours = []
+            chunk = max(1, BATCH_SCORE_ELEMENTS // len(case_base))
+            for start in range(0, len(queries), chunk):
+                block = self.score_case_base_batch(queries[start:start + chunk], use_weights=True)
+                neighbours.extend([case_base[i] for i in top_k_indices(scores, k).tolist()]
+                                  for scores in block)
+        blocks = [[[float(case.features[name]) for name in feature_names] for case in cases]
+                  for cases in neighbours]
+        targets = [[float(case.solution) for case in cases] for cases in neighbours]
+        
+        base = np.array([float(case.solution) for case in retrieved_cases])
+        if len(feature_names) == 0 or k <= 2:
+            return base
+        
+        slopes = self._local_slopes(np.array(blocks), np.array(targets))
+        diffs = (np.array([[float(q.features[name]) for name in feature_names] for q in queries]) -
+                 np.array([[float(r.features[name]) for name in feature_names] for r in retrieved_cases]))
+        
+        # Adjust prediction (correlation tells us direction and magnitude);
+        # features are added in order so the sum matches the per-feature loop
+        contributions = diffs * slopes * 0.1
+        adjustment = np.zeros(len(queries))
+        for j in range(len(feature_names)):
+            adjustment = adjustment + contributions[:, j]
+        return base + adjustment
+    
+    @staticmethod
+    def _local_slopes(X: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Correlation of each feature with the solution over each neighbour block.
+        
+        Features (or targets) without variance, and undefined correlations,
+        get a slope of 0.
+        
+        Args:
+            X: Neighbour features, shape (queries, neighbours, features)
+            y: Neighbour solutions, shape (queries, neighbours)
             
-            for case, sim in similar_cases:
-                if feature_name in case.features:
-                    try:
-                        feature_values.append(float(case.features[feature_name]))
-                        solutions.append(float(case.solution))
-                    except (TypeError, ValueError):
-                        pass
+        Returns:
+            Slopes, shape (queries, features)
+        """
+        x_std = X.std(axis=1, keepdims=True)
+        y_std = y.std(axis=1, keepdims=True)
+        valid = (x_std[:, 0, :] > 0) & (y_std > 0)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Normalize for comparison, then correlate (as np.corrcoef: re-center first)
+            x_norm = (X - X.mean(axis=1, keepdims=True)) / x_std
+            y_norm = (y - y.mean(axis=1, keepdims=True)) / y_std
+            x_norm = x_norm - x_norm.mean(axis=1, keepdims=True)
+            y_norm = y_norm - y_norm.mean(axis=1, keepdims=True)
             
-            if len(feature_values) > 2:
-                try:
-                    # Calculate slope using simple linear regression
-                    feature_values = np.array(feature_values)
-                    solutions = np.array(solutions)
-                    
-                    # Normalize for comparison
-                    if np.std(feature_values) > 0 and np.std(solutions) > 0:
-                        feature_values_norm = (feature_values - np.mean(feature_values)) / np.std(feature_values)
-                        solutions_norm = (solutions - np.mean(solutions)) / np.std(solutions)
-                        
-                        # Simple correlation coefficient as slope
-                        correlation = np.corrcoef(feature_values_norm, solutions_norm)[0, 1]
-                        if np.isnan(correlation):
-                            continue
-                        
-                        # Calculate feature difference
-                        feature_diff = (float(query.features[feature_name]) - 
-                                       float(retrieved_case.features[feature_name]))
-                        
-                        # Adjust prediction (correlation tells us direction and magnitude)
-                        adjustment += feature_diff * correlation * 0.1
-                except:
-                    pass
+            covariance = np.einsum('qnf,qn->qf', x_norm, y_norm)
+            scale = np.sqrt(np.einsum('qnf,qnf->qf', x_norm, x_norm) *
+                            np.einsum('qn,qn->q', y_norm, y_norm)[:, None])
+            correlation = np.clip(covariance / scale, -1.0, 1.0)
         
-        return base_solution + adjustment
+        valid &= ~np.isnan(correlation)
+        return np.where(valid, correlation, 0.0)
 
     def _compute_correlation_weights(self, cases: List[Case]) -> dict:
         """
         Compute tuned weights based on absolute correlation with heating load.
         
+        Also initializes the running correlation statistics used by
+        refresh_tuned_weights.
+        
         Args:
             cases: List of cases from training data
             
@@ -268,14 +613,20 @@ class EnergyCBRSystem(CBRSystem):
             Dictionary of feature weights summing to 1.0
         """
         if not cases:
+            self.correlation_stats = None
             return self.tuned_weights
         
         feature_names = list(cases[0].features.keys())
         solutions = np.array([case.solution for case in cases], dtype=float)
+        # One contiguous row per feature
+        feature_values = np.array([[case.features.get(name, 0.0) for case in cases]
+                                   for name in feature_names], dtype=float)
+        
+        self.correlation_stats = CorrelationStats(feature_names)
+        self.correlation_stats.update_batch(feature_values.T, solutions)
         
         weights = {}
-        for name in feature_names:
-            values = np.array([case.features.get(name, 0.0) for case in cases], dtype=float)
+        for name, values in zip(feature_names, feature_values):
             if np.std(values) == 0 or np.std(solutions) == 0:
                 weights[name] = 0.0
                 continue
@@ -334,6 +685,8 @@ class EnergyCBRSystem(CBRSystem):
         
         Logic:
         - Divide case base into segments by heating load level
+          (boundaries come from the solution statistics of the case base
+          in use, see solution_stats_for_case_base)
         - Identify which segment the query belongs to
         - Apply segment-specific rules
         
@@ -346,18 +699,13 @@ class EnergyCBRSystem(CBRSystem):
         """
         base_solution = retrieved_case.solution
         
-        # Get all solutions to determine segments
-        if not self.case_base_with_solutions:
+        # Segments need at least one known solution
+        stats = self.solution_stats_for_case_base()
+        if not stats.count:
             return base_solution
         
-        all_solutions = [sol for case, sol in self.case_base_with_solutions]
-        min_sol = min(all_solutions)
-        max_sol = max(all_solutions)
-        
         # Define segments
-        q1 = min_sol + (max_sol - min_sol) * 0.25
-        q2 = min_sol + (max_sol - min_sol) * 0.5
-        q3 = min_sol + (max_sol - min_sol) * 0.75
+        q1, q2, q3 = stats.segment_boundaries()
         
         # Determine segment of base solution
         if base_solution < q1:
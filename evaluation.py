@@ -1,14 +1,32 @@
 """
 Evaluation Module
-Implements evaluation metrics for regression and classification tasks.
+Implements evaluation metrics for regression and classification tasks,
+and a cross-validation harness (k-fold and leave-one-out) for the six
+test conditions and the k-NN prediction mode.
 """
 
-from typing import List, Tuple, Union
+from typing import List, Tuple, Union, Dict, Optional, Callable
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from functools import partial
+import io
+import os
+import time
 import numpy as np
+from data_loader import (Case, DataLoader, load_car_cases, load_energy_cases,
+                         load_car_system_data, load_energy_system_data)
+from case_index import CaseIndex, PRECISIONS
 
 
 class Evaluator:
-    """Evaluator for regression and classification metrics."""
+    """Evaluator for regression and classification metrics (NumPy-backed)."""
+    
+    @staticmethod
+    def _errors(predictions: List[float], actuals: List[float]) -> np.ndarray:
+        """Signed errors (prediction - actual) as a float array."""
+        if len(predictions) != len(actuals):
+            raise ValueError("Predictions and actuals must have same length")
+        return np.asarray(predictions, dtype=float) - np.asarray(actuals, dtype=float)
     
     @staticmethod
     def calculate_mae(predictions: List[float], actuals: List[float]) -> float:
@@ -24,11 +42,7 @@ class Evaluator:
         Returns:
             Mean Absolute Error
         """
-        if len(predictions) != len(actuals):
-            raise ValueError("Predictions and actuals must have same length")
-        
-        errors = [abs(p - a) for p, a in zip(predictions, actuals)]
-        return np.mean(errors)
+        return np.mean(np.abs(Evaluator._errors(predictions, actuals)))
     
     @staticmethod
     def calculate_rmse(predictions: List[float], actuals: List[float]) -> float:
@@ -44,11 +58,8 @@ class Evaluator:
         Returns:
             Root Mean Squared Error
         """
-        if len(predictions) != len(actuals):
-            raise ValueError("Predictions and actuals must have same length")
-        
-        errors = [(p - a) ** 2 for p, a in zip(predictions, actuals)]
-        return np.sqrt(np.mean(errors))
+        errors = Evaluator._errors(predictions, actuals)
+        return np.sqrt(np.mean(errors * errors))
     
     @staticmethod
     def calculate_accuracy(predictions: List[str], actuals: List[str]) -> float:
@@ -67,9 +78,38 @@ class Evaluator:
         if len(predictions) != len(actuals):
             raise ValueError("Predictions and actuals must have same length")
         
-        correct = sum(1 for p, a in zip(predictions, actuals) if p == a)
+        correct = int(np.count_nonzero(np.asarray(predictions, dtype=object) ==
+                                       np.asarray(actuals, dtype=object)))
         return (correct / len(actuals)) * 100
     
+    @staticmethod
+    def confusion_matrix(predictions: List[str], actuals: List[str],
+                         labels: Optional[List[str]] = None) -> Tuple[np.ndarray, List[str]]:
+        """
+        Build a confusion matrix.
+        
+        Args:
+            predictions: List of predicted classes
+            actuals: List of actual classes
+            labels: Class order (default: sorted union of both lists)
+            
+        Returns:
+            Tuple of (matrix, labels); matrix[i, j] counts actual labels[i]
+            predicted as labels[j]
+        """
+        if len(predictions) != len(actuals):
+            raise ValueError("Predictions and actuals must have same length")
+        predictions = np.asarray([str(p) for p in predictions])
+        actuals = np.asarray([str(a) for a in actuals])
+        if labels is None:
+            labels = sorted(set(actuals.tolist()) | set(predictions.tolist()))
+        position = {label: i for i, label in enumerate(labels)}
+        n = len(labels)
+        actual_idx = np.array([position[a] for a in actuals.tolist()], dtype=np.int64)
+        predicted_idx = np.array([position[p] for p in predictions.tolist()], dtype=np.int64)
+        matrix = np.bincount(actual_idx * n + predicted_idx, minlength=n * n).reshape(n, n)
+        return matrix, list(labels)
+    
     @staticmethod
     def calculate_metrics_summary(predictions: List[Union[float, str]], 
                                   actuals: List[Union[float, str]],
@@ -90,42 +130,826 @@ class Evaluator:
         if task_type == 'regression':
             # Convert to float
             try:
-                predictions = [float(p) for p in predictions]
-                actuals = [float(a) for a in actuals]
+                predictions = np.asarray(predictions, dtype=float)
+                actuals = np.asarray(actuals, dtype=float)
             except (TypeError, ValueError):
                 raise ValueError("Regression task requires numerical predictions and actuals")
             
-            metrics['mae'] = Evaluator.calculate_mae(predictions, actuals)
-            metrics['rmse'] = Evaluator.calculate_rmse(predictions, actuals)
+            errors = Evaluator._errors(predictions, actuals)
+            abs_errors = np.abs(errors)
+            metrics['mae'] = np.mean(abs_errors)
+            metrics['rmse'] = np.sqrt(np.mean(errors * errors))
             
             # Additional regression metrics
-            metrics['min_error'] = min(abs(p - a) for p, a in zip(predictions, actuals))
-            metrics['max_error'] = max(abs(p - a) for p, a in zip(predictions, actuals))
+            metrics['min_error'] = float(abs_errors.min())
+            metrics['max_error'] = float(abs_errors.max())
             metrics['mean_prediction'] = np.mean(predictions)
             metrics['mean_actual'] = np.mean(actuals)
             
         elif task_type == 'classification':
-            # Convert to string
-            predictions = [str(p) for p in predictions]
-            actuals = [str(a) for a in actuals]
+            matrix, labels = Evaluator.confusion_matrix(predictions, actuals)
+            support = matrix.sum(axis=1)
             
-            metrics['accuracy'] = Evaluator.calculate_accuracy(predictions, actuals)
+            metrics['accuracy'] = (int(np.trace(matrix)) / len(actuals)) * 100
             
             # Additional classification metrics
-            unique_classes = set(actuals)
-            metrics['num_classes'] = len(unique_classes)
+            metrics['num_classes'] = int(np.count_nonzero(support))
             
-            # Per-class accuracy
-            for class_label in unique_classes:
-                class_indices = [i for i, a in enumerate(actuals) if a == class_label]
-                if class_indices:
-                    class_correct = sum(1 for i in class_indices if predictions[i] == class_label)
-                    class_acc = (class_correct / len(class_indices)) * 100
-                    metrics[f'accuracy_{class_label}'] = class_acc
+            # Per-class accuracy (recall of each actual class)
+            for i, class_label in enumerate(labels):
+                if support[i]:
+                    metrics[f'accuracy_{class_label}'] = (int(matrix[i, i]) / int(support[i])) * 100
         
         return metrics
 
 
+class RegressionAccumulator:
+    """
+    Streaming regression metrics with O(1) updates.
+    
+    Keeps running sums instead of the predictions, so metrics can be read at
+    any point of a long evaluation. Sums are accumulated sequentially, so
+    results can differ from the batch metrics in the last few bits.
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.sum_abs_error = 0.0
+        self.sum_sq_error = 0.0
+        self.min_error = float('inf')
+        self.max_error = 0.0
+        self.sum_prediction = 0.0
+        self.sum_actual = 0.0
+    
+    def update(self, prediction: float, actual: float):
+        """Add one prediction."""
+        error = float(prediction) - float(actual)
+        abs_error = abs(error)
+        self.count += 1
+        self.sum_abs_error += abs_error
+        self.sum_sq_error += error * error
+        if abs_error < self.min_error:
+            self.min_error = abs_error
+        if abs_error > self.max_error:
+            self.max_error = abs_error
+        self.sum_prediction += float(prediction)
+        self.sum_actual += float(actual)
+    
+    def update_batch(self, predictions: List[float], actuals: List[float]):
+        """Add a batch of predictions (vectorized)."""
+        if len(predictions) == 0:
+            return
+        predictions = np.asarray(predictions, dtype=float)
+        actuals = np.asarray(actuals, dtype=float)
+        errors = Evaluator._errors(predictions, actuals)
+        abs_errors = np.abs(errors)
+        self.count += len(errors)
+        self.sum_abs_error += float(abs_errors.sum())
+        self.sum_sq_error += float((errors * errors).sum())
+        self.min_error = min(self.min_error, float(abs_errors.min()))
+        self.max_error = max(self.max_error, float(abs_errors.max()))
+        self.sum_prediction += float(predictions.sum())
+        self.sum_actual += float(actuals.sum())
+    
+    @property
+    def mae(self) -> float:
+        return self.sum_abs_error / self.count if self.count else 0.0
+    
+    @property
+    def rmse(self) -> float:
+        return float(np.sqrt(self.sum_sq_error / self.count)) if self.count else 0.0
+    
+    def summary(self) -> dict:
+        """Metrics with the same keys as Evaluator.calculate_metrics_summary."""
+        if not self.count:
+            return {}
+        return {
+            'mae': self.mae,
+            'rmse': self.rmse,
+            'min_error': self.min_error,
+            'max_error': self.max_error,
+            'mean_prediction': self.sum_prediction / self.count,
+            'mean_actual': self.sum_actual / self.count,
+        }
+
+
+class ClassificationAccumulator:
+    """
+    Streaming confusion matrix with O(1) updates.
+    
+    Accuracy, per-class accuracy (recall) and precision are derived from
+    the matrix on demand. New classes grow the matrix when first seen.
+    """
+    
+    def __init__(self, labels: Optional[List[str]] = None):
+        self.labels: List[str] = []
+        self._position: Dict[str, int] = {}
+        self.matrix = np.zeros((0, 0), dtype=np.int64)
+        for label in labels or []:
+            self._index(label)
+    
+    def _index(self, label: str) -> int:
+        position = self._position.get(label)
+        if position is None:
+            position = len(self.labels)
+            self._position[label] = position
+            self.labels.append(label)
+            grown = np.zeros((position + 1, position + 1), dtype=np.int64)
+            grown[:position, :position] = self.matrix
+            self.matrix = grown
+        return position
+    
+    @property
+    def count(self) -> int:
+        return int(self.matrix.sum())
+    
+    def update(self, prediction: str, actual: str):
+        """Add one prediction."""
+        actual_idx = self._index(str(actual))
+        predicted_idx = self._index(str(prediction))
+        self.matrix[actual_idx, predicted_idx] += 1
+    
+    def update_batch(self, predictions: List[str], actuals: List[str]):
+        """Add a batch of predictions (vectorized)."""
+        if len(predictions) == 0:
+            return
+        matrix, labels = Evaluator.confusion_matrix(predictions, actuals)
+        positions = np.array([self._index(label) for label in labels], dtype=np.int64)
+        self.matrix[np.ix_(positions, positions)] += matrix
+    
+    @property
+    def accuracy(self) -> float:
+        total = self.count
+        return (int(np.trace(self.matrix)) / total) * 100 if total else 0.0
+    
+    def precision(self) -> Dict[str, float]:
+        """Per-class precision (percentage) for classes that were predicted."""
+        predicted = self.matrix.sum(axis=0)
+        return {label: (int(self.matrix[i, i]) / int(predicted[i])) * 100
+                for i, label in enumerate(self.labels) if predicted[i]}
+    
+    def recall(self) -> Dict[str, float]:
+        """Per-class recall (percentage) for classes that occurred."""
+        support = self.matrix.sum(axis=1)
+        return {label: (int(self.matrix[i, i]) / int(support[i])) * 100
+                for i, label in enumerate(self.labels) if support[i]}
+    
+    def summary(self) -> dict:
+        """Metrics with the keys of Evaluator.calculate_metrics_summary plus precision/recall."""
+        if not self.count:
+            return {}
+        recall = self.recall()
+        metrics = {'accuracy': self.accuracy, 'num_classes': len(recall)}
+        for label, value in recall.items():
+            metrics[f'accuracy_{label}'] = value
+        for label, value in self.precision().items():
+            metrics[f'precision_{label}'] = value
+        for label, value in recall.items():
+            metrics[f'recall_{label}'] = value
+        return metrics
+
+
+def make_accumulator(task_type: str):
+    """Create the streaming accumulator for 'regression' or 'classification'."""
+    if task_type == 'regression':
+        return RegressionAccumulator()
+    if task_type == 'classification':
+        return ClassificationAccumulator()
+    raise ValueError(f"Unknown task type: {task_type}")
+
+
+# The six test conditions (same keys and labels as main.py), plus the k-NN
+# prediction mode ('adapt': 'knn') for comparison with the adaptation rules
+CAR_CONDITIONS = [
+    {'key': 'untuned', 'condition': 'Baseline (equal weights, no adaptation)',
+     'tuned': False, 'adapt': False, 'learning': False},
+    {'key': 'tuned', 'condition': 'Tuned weights, no adaptation',
+     'tuned': True, 'adapt': False, 'learning': False},
+    {'key': 'tuned_adapt', 'condition': 'Tuned weights + adaptation rules',
+     'tuned': True, 'adapt': True, 'learning': False},
+    {'key': 'tuned_knn', 'condition': 'Tuned weights + k-NN weighted vote',
+     'tuned': True, 'adapt': 'knn', 'learning': False},
+]
+
+ENERGY_CONDITIONS = [
+    {'key': 'untuned', 'condition': 'Baseline (equal weights, no adaptation, learning enabled)',
+     'tuned': False, 'adapt': False, 'learning': True},
+    {'key': 'tuned', 'condition': 'Tuned weights + adaptation (learning enabled)',
+     'tuned': True, 'adapt': True, 'learning': True},
+    {'key': 'tuned_nolearn', 'condition': 'Tuned weights + adaptation (learning DISABLED)',
+     'tuned': True, 'adapt': True, 'learning': False},
+    {'key': 'tuned_knn', 'condition': 'Tuned weights + k-NN weighted mean (learning enabled)',
+     'tuned': True, 'adapt': 'knn', 'learning': True},
+]
+
+
+class PrecomputedScores:
+    """
+    score_provider that serves similarity rows from a precomputed pairwise matrix.
+    
+    Full matrices are cached per weight vector. Queries and case base entries
+    are mapped back to dataset rows through their features dict, so cases
+    retained under learning (which share the query's features) are scored too.
+    Returns None for anything it does not know, so the system falls back to
+    calculate_similarity.
+    """
+    
+    def __init__(self, index: CaseIndex):
+        """
+        Args:
+            index: CaseIndex over the full dataset
+        """
+        self.index = index
+        self.system = None
+        self._row_of = {id(case.features): i for i, case in enumerate(index.cases)}
+        self._matrices: Dict[tuple, np.ndarray] = {}
+        self._rows: Dict[tuple, np.ndarray] = {}
+        self._columns = np.zeros(0, dtype=np.int64)
+    
+    @staticmethod
+    def _weights_key(weights: Optional[Dict[str, float]]) -> tuple:
+        return tuple(sorted(weights.items())) if weights else ()
+    
+    def precompute(self, weights: Optional[Dict[str, float]]) -> np.ndarray:
+        """Compute (or fetch) the full pairwise matrix for a weight vector."""
+        key = self._weights_key(weights)
+        if key not in self._matrices:
+            self._matrices[key] = self.index.pairwise(weights)
+        return self._matrices[key]
+    
+    def attach(self, system, columns: np.ndarray):
+        """
+        Attach to a system whose case base holds the dataset rows in columns.
+        
+        Args:
+            system: CBRSystem to serve scores for
+            columns: Dataset row of each case base entry, in case base order
+        """
+        self.system = system
+        self._columns = np.asarray(columns, dtype=np.int64)
+        self._rows.clear()
+        system.score_provider = self
+    
+    def _case_base_columns(self, case_base: List[Case]) -> Optional[np.ndarray]:
+        """Map case base entries to dataset rows (incremental for appended cases)."""
+        cases = self.index.cases
+        columns = self._columns
+        n = len(columns)
+        if len(case_base) < n or (n and case_base[n - 1].features is not cases[columns[-1]].features):
+            n, columns = 0, np.zeros(0, dtype=np.int64)
+        if len(case_base) > n:
+            extra = [self._row_of.get(id(case.features)) for case in case_base[n:]]
+            if None in extra:
+                return None
+            columns = np.concatenate([columns, np.array(extra, dtype=np.int64)])
+        self._columns = columns
+        return columns
+    
+    def __call__(self, query: Case, case_base: List[Case], use_weights: bool) -> Optional[np.ndarray]:
+        row = self._row_of.get(id(query.features))
+        if row is None:
+            return None
+        columns = self._case_base_columns(case_base)
+        if columns is None:
+            return None
+        
+        weights = self.system.feature_weights if use_weights and self.system.feature_weights else None
+        key = self._weights_key(weights)
+        matrix = self._matrices.get(key)
+        if matrix is not None:
+            return matrix[row, columns]
+        
+        # Weights not precomputed (e.g. fitted per fold): score this query row once
+        full_row = self._rows.get((key, row))
+        if full_row is None:
+            full_row = self.index.pairwise(weights, query_rows=np.array([row]))[0]
+            self._rows[(key, row)] = full_row
+        return full_row[columns]
+
+
+class SharedScores:
+    """
+    score_provider shared by several systems (of one domain) that query the same test cases.
+    
+    Similarity rows are cached per (query, weight vector) over an arena of
+    every case seen in any attached case base. Cases are keyed by their
+    features dict, since similarity depends only on features. Conditions
+    with the same weights reuse each other's rows, and a case base that
+    grows through learning only scores its newly retained cases. Scores
+    come from a CaseIndex over the arena, so they equal the system's own.
+    """
+    
+    def __init__(self):
+        self.index: Optional[CaseIndex] = None
+        self._column_of: Dict[int, int] = {}
+        self._pending: List[Case] = []
+        self._queries: Dict[int, Case] = {}
+        self._rows: Dict[tuple, np.ndarray] = {}
+        self._columns: Dict[int, np.ndarray] = {}
+        self.similarities_computed = 0
+        self.similarities_served = 0
+    
+    def attach(self, system):
+        """Serve scores to a system (replaces its score_provider)."""
+        self._columns[id(system)] = np.zeros(0, dtype=np.int64)
+        system.score_provider = partial(self._scores, system)
+    
+    def _arena_columns(self, system, case_base: List[Case]) -> np.ndarray:
+        """Map case base entries to arena columns (incremental for appended cases)."""
+        columns = self._columns[id(system)]
+        n = len(columns)
+        arena = self.index.cases if self.index is not None else []
+        if len(case_base) < n or (n and case_base[n - 1].features is not self._case_at(columns[-1], arena).features):
+            n, columns = 0, np.zeros(0, dtype=np.int64)
+        if len(case_base) > n:
+            extra = []
+            for case in case_base[n:]:
+                column = self._column_of.get(id(case.features))
+                if column is None:
+                    column = len(self._column_of)
+                    self._column_of[id(case.features)] = column
+                    self._pending.append(case)
+                extra.append(column)
+            columns = np.concatenate([columns, np.array(extra, dtype=np.int64)])
+        self._columns[id(system)] = columns
+        return columns
+    
+    def _case_at(self, column: int, arena: List[Case]) -> Case:
+        return arena[column] if column < len(arena) else self._pending[column - len(arena)]
+    
+    def _scores(self, system, query: Case, case_base: List[Case],
+                use_weights: bool) -> Optional[np.ndarray]:
+        try:
+            columns = self._arena_columns(system, case_base)
+            if self._pending:
+                if self.index is None:
+                    self.index = CaseIndex(system, self._pending)
+                else:
+                    self.index.extend(self._pending)
+                self._pending = []
+        except ValueError:
+            self._columns[id(system)] = np.zeros(0, dtype=np.int64)
+            return None
+        
+        weights = system.feature_weights if use_weights and system.feature_weights else None
+        key = (tuple(sorted(weights.items())) if weights else (), id(query.features))
+        self._queries.setdefault(id(query.features), query)
+        row = self._rows.get(key)
+        n_arena = len(self.index)
+        if row is None or len(row) < n_arena:
+            done = 0 if row is None else len(row)
+            try:
+                new = self.index.score(query, weights, rows=np.arange(done, n_arena))
+            except ValueError:
+                return None
+            row = new if row is None else np.concatenate([row, new])
+            self._rows[key] = row
+            self.similarities_computed += n_arena - done
+        self.similarities_served += len(columns)
+        return row[columns]
+
+
+class CrossValidator:
+    """
+    K-fold and leave-one-out cross-validation over the test conditions.
+    
+    Similarities are taken from a pairwise matrix computed once per weight
+    vector; each fold's training set is a mask over the matrix columns that
+    excludes the fold's own test rows.
+    """
+    
+    def __init__(self, cases: List[Case], system_factory: Callable, task_type: str,
+                 adapt: Callable, conditions: List[dict]):
+        """
+        Args:
+            cases: Full dataset
+            system_factory: Callable returning a fresh CarCBRSystem/EnergyCBRSystem
+            task_type: 'regression' or 'classification'
+            adapt: Function(system, retrieved_case, query) -> adapted solution
+            conditions: Condition definitions (see CAR_CONDITIONS / ENERGY_CONDITIONS)
+        """
+        self.cases = cases
+        self.system_factory = system_factory
+        self.task_type = task_type
+        self.adapt = adapt
+        self.conditions = conditions
+        self.scores: Optional[PrecomputedScores] = None
+        self.precompute_time = 0.0
+    
+    def make_folds(self, n_folds: Optional[int] = None,
+                   random_seed: int = 42) -> List[np.ndarray]:
+        """
+        Split dataset rows into test folds.
+        
+        Args:
+            n_folds: Number of folds, or None for leave-one-out
+            random_seed: Seed for the k-fold shuffle
+            
+        Returns:
+            List of test row arrays (one per fold)
+        """
+        n = len(self.cases)
+        if n_folds is None:
+            return [np.array([i]) for i in range(n)]
+        if not 2 <= n_folds <= n:
+            raise ValueError(f"n_folds must be between 2 and {n}")
+        order = np.random.RandomState(random_seed).permutation(n)
+        return np.array_split(order, n_folds)
+    
+    def _precompute(self):
+        """Build the index and pairwise matrices for the fixed weight vectors."""
+        start = time.perf_counter()
+        system = self.system_factory()
+        self.scores = PrecomputedScores(CaseIndex(system, self.cases))
+        self.scores.precompute(None)
+        system.set_tuned_mode()
+        if system.feature_weights is system.tuned_weights:
+            # Fixed tuned weights (car); data-fitted weights are scored per fold
+            self.scores.precompute(system.feature_weights)
+        self.precompute_time = time.perf_counter() - start
+    
+    def run_fold(self, condition: dict, test_rows: np.ndarray) -> List:
+        """
+        Run one condition on one fold.
+        
+        Args:
+            condition: Condition definition
+            test_rows: Dataset rows used as queries; all other rows form the case base
+            
+        Returns:
+            List of predictions (in test_rows order)
+        """
+        # Self-exclusion mask: every row except the fold's own test rows
+        mask = np.ones(len(self.cases), dtype=bool)
+        mask[test_rows] = False
+        train_rows = np.flatnonzero(mask)
+        
+        system = self.system_factory()
+        system.set_case_base([self.cases[i] for i in train_rows], verbose=False)
+        if condition['tuned']:
+            system.set_tuned_mode()
+        else:
+            system.set_baseline_mode()
+        self.scores.attach(system, train_rows)
+        
+        adapt_fn = None
+        if condition['adapt'] == 'knn':
+            def adapt_fn(retrieved, query, s):
+                return s.adapt_knn(retrieved, query)
+        elif condition['adapt']:
+            def adapt_fn(retrieved, query, s):
+                return self.adapt(s, retrieved, query)
+        
+        predictions = []
+        cb = system.case_base.copy()
+        for row in test_rows:
+            result = system.run_query(cb, self.cases[row], tuned=condition['tuned'],
+                                      adapt_fn=adapt_fn, learning=condition['learning'])
+            predictions.append(result[0])
+            if condition['learning']:
+                cb = result[1]
+        return predictions
+    
+    def run(self, n_folds: Optional[int] = None, random_seed: int = 42) -> Dict[str, Dict]:
+        """
+        Cross-validate every condition.
+        
+        Args:
+            n_folds: Number of folds, or None for leave-one-out
+            random_seed: Seed for the k-fold shuffle
+            
+        Returns:
+            Dictionary keyed by condition with per-fold metrics, mean/std,
+            pooled metrics and timing
+        """
+        if self.scores is None:
+            self._precompute()
+        folds = self.make_folds(n_folds, random_seed)
+        
+        results = {}
+        for condition in self.conditions:
+            start = time.perf_counter()
+            fold_metrics = []
+            pooled = make_accumulator(self.task_type)
+            for test_rows in folds:
+                predictions = self.run_fold(condition, test_rows)
+                actuals = [self.cases[i].solution for i in test_rows]
+                fold_metrics.append(Evaluator.calculate_metrics_summary(
+                    predictions, actuals, task_type=self.task_type))
+                pooled.update_batch(predictions, actuals)
+            elapsed = time.perf_counter() - start
+            
+            keys = sorted({key for metrics in fold_metrics for key in metrics})
+            mean = {key: float(np.mean([m[key] for m in fold_metrics if key in m])) for key in keys}
+            std = {key: float(np.std([m[key] for m in fold_metrics if key in m])) for key in keys}
+            results[condition['key']] = {
+                'condition': condition['condition'],
+                'learning': condition['learning'],
+                'n_folds': len(folds),
+                'fold_metrics': fold_metrics,
+                'mean': mean,
+                'std': std,
+                'pooled': pooled.summary(),
+                'time_seconds': elapsed,
+                'time_per_fold': elapsed / len(folds),
+            }
+        return results
+
+
+def domain_spec(domain: str) -> Tuple[Callable, str, Callable, List[dict]]:
+    """
+    Return (system factory, task type, adaptation function, conditions) for a domain.
+    
+    The adaptation function takes (system, retrieved_case, query).
+    """
+    if domain == 'car':
+        from car_cbr import CarCBRSystem
+        return (CarCBRSystem, 'classification',
+                lambda s, retrieved, query: s.adapt_classification(retrieved, query, use_voting=True),
+                CAR_CONDITIONS)
+    if domain == 'energy':
+        from energy_cbr import EnergyCBRSystem
+        return (EnergyCBRSystem, 'regression',
+                lambda s, retrieved, query: s.adapt_regression(retrieved, query, use_multiple_rules=True),
+                ENERGY_CONDITIONS)
+    raise ValueError(f"Unknown domain: {domain}")
+
+
+def car_cross_validator(cases: Optional[List[Case]] = None) -> CrossValidator:
+    """Cross-validator for the car classification conditions."""
+    return CrossValidator(cases if cases is not None else load_car_cases(), *domain_spec('car'))
+
+
+def energy_cross_validator(cases: Optional[List[Case]] = None) -> CrossValidator:
+    """Cross-validator for the energy regression conditions."""
+    return CrossValidator(cases if cases is not None else load_energy_cases(), *domain_spec('energy'))
+
+
+def print_cv_report(title: str, results: Dict[str, Dict], precompute_time: float = 0.0):
+    """Print mean/std per condition with timing."""
+    print("\n" + "="*70)
+    print(title)
+    print("="*70)
+    if precompute_time:
+        print(f"Pairwise similarity precompute: {precompute_time:.2f}s")
+    for key, result in results.items():
+        print(f"\n{result['condition']} ({result['n_folds']} folds, "
+              f"{result['time_seconds']:.2f}s, {result['time_per_fold'] * 1000:.2f} ms/fold)")
+        for metric in ('accuracy', 'mae', 'rmse'):
+            if metric in result['mean']:
+                print(f"  {metric:<10} mean={result['mean'][metric]:.4f}  "
+                      f"std={result['std'][metric]:.4f}  pooled={result['pooled'][metric]:.4f}")
+
+
+def run_cross_validation(n_folds: Optional[int] = 10, random_seed: int = 42) -> Tuple[Dict, Dict]:
+    """
+    Cross-validate all conditions (the six main.py conditions plus k-NN).
+    
+    Args:
+        n_folds: Number of folds, or None for leave-one-out
+        random_seed: Seed for the k-fold shuffle
+        
+    Returns:
+        Tuple of (car_results, energy_results)
+    """
+    label = "LEAVE-ONE-OUT" if n_folds is None else f"{n_folds}-FOLD"
+    
+    car_cv = car_cross_validator()
+    car_results = car_cv.run(n_folds, random_seed)
+    print_cv_report(f"CAR CLASSIFICATION - {label} CROSS-VALIDATION", car_results, car_cv.precompute_time)
+    
+    energy_cv = energy_cross_validator()
+    energy_results = energy_cv.run(n_folds, random_seed)
+    print_cv_report(f"ENERGY REGRESSION - {label} CROSS-VALIDATION", energy_results, energy_cv.precompute_time)
+    
+    return car_results, energy_results
+
+
+def evaluate_split(domain: str, train: List[Case], test: List[Case]) -> Dict[str, Dict]:
+    """
+    Run every condition of a domain on one train/test split.
+    
+    Conditions share similarity rows through SharedScores.
+    
+    Args:
+        domain: 'car' or 'energy'
+        train: Training case base
+        test: Test cases
+        
+    Returns:
+        Dictionary keyed by condition with its metrics summary
+    """
+    system_factory, task_type, adapt, conditions = domain_spec(domain)
+    shared_scores = SharedScores()
+    actuals = [case.solution for case in test]
+    results = {}
+    for condition in conditions:
+        system = system_factory()
+        system.set_case_base(train, verbose=False)
+        if condition['tuned']:
+            system.set_tuned_mode()
+        else:
+            system.set_baseline_mode()
+        shared_scores.attach(system)
+        
+        if condition['adapt'] == 'knn':
+            adapt_fn = lambda retrieved, query, s: s.adapt_knn(retrieved, query)
+        elif condition['adapt']:
+            adapt_fn = lambda retrieved, query, s: adapt(s, retrieved, query)
+        else:
+            adapt_fn = None
+        
+        predictions = []
+        cb = system.case_base.copy()
+        for query in test:
+            solution, updated = system.run_query(cb, query, tuned=condition['tuned'],
+                                                 adapt_fn=adapt_fn, learning=condition['learning'])
+            predictions.append(solution)
+            if condition['learning']:
+                cb = updated
+        results[condition['key']] = Evaluator.calculate_metrics_summary(
+            predictions, actuals, task_type=task_type)
+    return results
+
+
+# Datasets loaded once per multi-seed worker process
+_WORKER_CASES: Dict[str, List[Case]] = {}
+
+
+def _init_seed_worker(domains: Tuple[str, ...]):
+    """Process pool initializer: load (and normalize) each dataset once."""
+    with redirect_stdout(io.StringIO()):  # silence the loader output
+        for domain in domains:
+            _WORKER_CASES[domain] = load_car_cases() if domain == 'car' else load_energy_cases()
+
+
+def _evaluate_seed(seed: int) -> Dict[str, Dict]:
+    """Evaluate all conditions of the loaded domains on one seed's 80/20 split."""
+    results = {}
+    for domain, cases in _WORKER_CASES.items():
+        with redirect_stdout(io.StringIO()):  # silence the split output
+            train, test = DataLoader.train_test_split(cases, train_ratio=0.8, random_seed=seed)
+        results[domain] = evaluate_split(domain, train, test)
+    return results
+
+
+def bootstrap_ci(values: List[float], n_bootstrap: int = 2000, confidence: float = 0.95,
+                 random_seed: int = 0) -> Tuple[float, float]:
+    """
+    Percentile bootstrap confidence interval of the mean.
+    
+    Args:
+        values: Per-seed values
+        n_bootstrap: Number of resamples
+        confidence: Interval coverage
+        random_seed: Seed for the resampling
+        
+    Returns:
+        Tuple of (lower, upper)
+    """
+    values = np.asarray(values, dtype=float)
+    rng = np.random.default_rng(random_seed)
+    means = values[rng.integers(0, len(values), size=(n_bootstrap, len(values)))].mean(axis=1)
+    tail = (1.0 - confidence) / 2 * 100
+    return float(np.percentile(means, tail)), float(np.percentile(means, 100 - tail))
+
+
+def run_multi_seed(seeds: List[int], workers: Optional[int] = None,
+                   domains: Tuple[str, ...] = ('car', 'energy'),
+                   n_bootstrap: int = 2000, confidence: float = 0.95) -> Dict:
+    """
+    Evaluate every condition on many random 80/20 splits in parallel.
+    
+    Each seed is one task on a process pool; every worker loads the
+    datasets once (pool initializer) and reuses them for all its seeds.
+    
+    Args:
+        seeds: Split seeds (seed 42 reproduces main.py's split)
+        workers: Worker processes (default: one per CPU, at most one per seed)
+        domains: Domains to evaluate
+        n_bootstrap: Bootstrap resamples for the confidence intervals
+        confidence: Confidence interval coverage
+        
+    Returns:
+        Dictionary with 'per_seed' results, a 'summary' per domain/condition/metric
+        (mean, std, ci_low, ci_high) and 'wall_time'/'workers'
+    """
+    workers = workers or min(len(seeds), os.cpu_count() or 1)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_seed_worker,
+                             initargs=(tuple(domains),)) as pool:
+        per_seed = list(pool.map(_evaluate_seed, seeds))
+    wall_time = time.perf_counter() - start
+    
+    summary = {}
+    for domain in domains:
+        summary[domain] = {}
+        for key in per_seed[0][domain]:
+            summary[domain][key] = {}
+            for metric in ('accuracy', 'mae', 'rmse'):
+                if metric not in per_seed[0][domain][key]:
+                    continue
+                values = [result[domain][key][metric] for result in per_seed]
+                low, high = bootstrap_ci(values, n_bootstrap, confidence)
+                summary[domain][key][metric] = {
+                    'mean': float(np.mean(values)),
+                    'std': float(np.std(values, ddof=1)) if len(values) > 1 else 0.0,
+                    'ci_low': low,
+                    'ci_high': high,
+                }
+    return {'seeds': list(seeds), 'per_seed': per_seed, 'summary': summary,
+            'confidence': confidence, 'wall_time': wall_time, 'workers': workers}
+
+
+def print_multi_seed_report(results: Dict):
+    """Print mean, std and bootstrap CI per condition and metric."""
+    conditions = {'car': CAR_CONDITIONS, 'energy': ENERGY_CONDITIONS}
+    level = f"{results['confidence'] * 100:.0f}% CI"
+    for domain, by_condition in results['summary'].items():
+        labels = {c['key']: c['condition'] for c in conditions[domain]}
+        print("\n" + "="*70)
+        print(f"{domain.upper()} - {len(results['seeds'])} RANDOM SPLITS")
+        print("="*70)
+        for key, metrics in by_condition.items():
+            print(f"\n{labels.get(key, key)}")
+            for metric, stats in metrics.items():
+                print(f"  {metric:<10} mean={stats['mean']:.4f}  std={stats['std']:.4f}  "
+                      f"{level}=[{stats['ci_low']:.4f}, {stats['ci_high']:.4f}]")
+    print(f"\nWall time: {results['wall_time']:.2f}s on {results['workers']} worker(s)")
+
+
+def compare_index_precisions(domain: str = 'energy', precisions: Tuple[str, ...] = PRECISIONS,
+                             k: int = 3) -> Dict[str, Dict]:
+    """
+    Compare case base storage precisions against float64 on the main.py split.
+    
+    For each precision, runs the tuned + adaptation condition (no learning)
+    and reports its metrics, the footprint of the encoded case base, the
+    fraction of queries whose top-k neighbours match float64 and the
+    largest similarity difference from float64.
+    
+    Args:
+        domain: 'car' or 'energy'
+        precisions: Storage precisions to compare (float64 is always included)
+        k: Neighbours compared per query
+        
+    Returns:
+        Dictionary keyed by precision
+    """
+    if domain == 'car':
+        from car_cbr import CarCBRSystem
+        train, test = load_car_system_data()
+        system, task_type = CarCBRSystem(), 'classification'
+        adapt = lambda s, retrieved, query: s.adapt_classification(retrieved, query, use_voting=True)
+    else:
+        from energy_cbr import EnergyCBRSystem
+        train, test = load_energy_system_data()
+        system, task_type = EnergyCBRSystem(), 'regression'
+        adapt = lambda s, retrieved, query: s.adapt_regression(retrieved, query, use_multiple_rules=True)
+    system.set_case_base(train, verbose=False)
+    system.set_tuned_mode()
+    actuals = [q.solution for q in test]
+    
+    results = {}
+    reference = None
+    for precision in ['float64'] + [p for p in precisions if p != 'float64']:
+        system.set_index_precision(precision)
+        start = time.perf_counter()
+        scores = system.score_case_base_batch(test, use_weights=True)
+        predictions = [system.run_query(system.case_base, query, tuned=True,
+                                        adapt_fn=lambda r, q, s: adapt(s, r, q),
+                                        learning=False)[0] for query in test]
+        elapsed = time.perf_counter() - start
+        neighbours = [set(np.argsort(-row, kind='stable')[:k].tolist()) for row in scores]
+        if reference is None:
+            reference = (scores, neighbours)
+        results[precision] = {
+            'metrics': Evaluator.calculate_metrics_summary(predictions, actuals, task_type=task_type),
+            'nbytes': system.case_index().nbytes,
+            'top_k_agreement': float(np.mean([a == b for a, b in zip(neighbours, reference[1])])),
+            'max_score_error': float(np.max(np.abs(scores - reference[0]))),
+            'time_seconds': elapsed,
+        }
+    system.set_index_precision('float64')
+    return results
+
+
+def print_precision_report(domain: str, results: Dict[str, Dict]):
+    """Print the storage precision comparison."""
+    print("\n" + "="*86)
+    print(f"{domain.upper()} - CASE BASE STORAGE PRECISION (vs float64)")
+    print("="*86)
+    print(f"{'Precision':<10} {'Bytes':>9} {'Metric':>18} {'Top-k agree':>12} "
+          f"{'Max |dsim|':>12} {'Time (s)':>9}")
+    for precision, result in results.items():
+        metrics = result['metrics']
+        metric = (f"acc={metrics['accuracy']:.2f}%" if 'accuracy' in metrics
+                  else f"mae={metrics['mae']:.4f}")
+        print(f"{precision:<10} {result['nbytes']:>9} {metric:>18} "
+              f"{result['top_k_agreement'] * 100:>11.1f}% {result['max_score_error']:>12.2e} "
+              f"{result['time_seconds']:>9.3f}")
+
+
 if __name__ == '__main__':
     print("=== Testing Evaluator ===")
     
@@ -163,3 +987,21 @@ if __name__ == '__main__':
     print("\nClassification Summary:")
     for key, value in summary.items():
         print(f"  {key}: {value:.2f}" if isinstance(value, float) else f"  {key}: {value}")
+    
+    # Test streaming accumulators
+    print("\n--- Streaming Accumulators ---")
+    reg_acc = RegressionAccumulator()
+    for p, a in zip(pred_reg, actual_reg):
+        reg_acc.update(p, a)
+    print(f"Running MAE: {reg_acc.mae:.4f}  RMSE: {reg_acc.rmse:.4f}")
+    
+    class_acc = ClassificationAccumulator()
+    class_acc.update_batch(pred_class, actual_class)
+    print(f"Confusion matrix (rows=actual, cols=predicted, labels={class_acc.labels}):")
+    print(class_acc.matrix)
+    print(f"Precision: {class_acc.precision()}")
+    print(f"Recall: {class_acc.recall()}")
+    
+    # Compare storage precisions of the encoded case base
+    for domain in ('car', 'energy'):
+        print_precision_report(domain, compare_index_precisions(domain))
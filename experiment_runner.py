@@ -0,0 +1,318 @@
+"""
+Experiment Runner Module
+Runs CBR conditions from a declarative JSON config and caches the results:
+- Each condition names its domain, weights, adaptation, learning, split seed and k
+- A condition's cache key hashes its config, the data file and the source code,
+  so unchanged conditions load from disk and only changed ones recompute
+- Predictions and metrics (via Evaluator) are stored per condition
+
+Config format (see experiments.json):
+    {
+      "cache_dir": ".experiment_cache",
+      "conditions": [
+        {"name": "car_tuned_adapt", "domain": "car", "weights": "tuned",
+         "adaptation": "rules", "learning": false, "split_seed": 42, "k": 3}
+      ]
+    }
+
+Usage:
+    python experiment_runner.py experiments.json
+    python experiment_runner.py experiments.json --only car_tuned,energy_tuned --force
+"""
+
+from typing import List, Dict, Optional, Any
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from data_loader import Case, load_car_system_data, load_energy_system_data
+from evaluation import Evaluator, SharedScores
+
+
+DATA_FILES = {'car': 'car.data', 'energy': 'ENB2012_data.xlsx'}
+
+CONDITION_DEFAULTS = {
+    'weights': 'tuned',        # 'baseline' or 'tuned'
+    'adaptation': 'none',      # 'none', 'rules' or 'knn'
+    'learning': False,
+    'split_seed': 42,
+    'k': None,                 # k-NN neighbours, or car voting neighbours for 'rules'
+}
+
+DEFAULT_CACHE_DIR = '.experiment_cache'
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def file_hash(filepath: str) -> str:
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_files() -> List[str]:
+    """
+    Source files whose contents define the code version of a result: every
+    module of the project, so a new or changed module (e.g. an index the
+    systems import) invalidates cached results.
+    """
+    return sorted(os.path.basename(path) for path in glob.glob(os.path.join(_BASE_DIR, '*.py')))
+
+
+def code_version() -> str:
+    """Hash of the source files that produce results."""
+    digest = hashlib.sha256()
+    for name in code_files():
+        digest.update(name.encode())
+        digest.update(file_hash(os.path.join(_BASE_DIR, name)).encode())
+    return digest.hexdigest()
+
+
+def normalize_condition(condition: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fill in defaults and validate a condition.
+
+    Raises:
+        ValueError: For missing names/domains or unknown option values
+    """
+    if 'name' not in condition or 'domain' not in condition:
+        raise ValueError(f"Condition needs 'name' and 'domain': {condition}")
+    normalized = {**CONDITION_DEFAULTS, **condition}
+    if normalized['domain'] not in DATA_FILES:
+        raise ValueError(f"Unknown domain '{normalized['domain']}'")
+    if normalized['weights'] not in ('baseline', 'tuned'):
+        raise ValueError(f"Unknown weights '{normalized['weights']}'")
+    if normalized['adaptation'] not in ('none', 'rules', 'knn'):
+        raise ValueError(f"Unknown adaptation '{normalized['adaptation']}'")
+    unknown = set(normalized) - set(CONDITION_DEFAULTS) - {'name', 'domain'}
+    if unknown:
+        raise ValueError(f"Unknown condition keys: {sorted(unknown)}")
+    return normalized
+
+
+def condition_key(condition: Dict[str, Any], data_hash: str, code_hash: str) -> str:
+    """Cache key of a condition (its name is not part of the key)."""
+    inputs = {key: value for key, value in condition.items() if key != 'name'}
+    payload = json.dumps({'condition': inputs, 'data': data_hash, 'code': code_hash},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def _make_system(condition: Dict[str, Any], train: List[Case]):
+    """Build and configure the system for a condition."""
+    if condition['domain'] == 'car':
+        from car_cbr import CarCBRSystem
+        system = CarCBRSystem()
+        if condition['k'] is not None and condition['adaptation'] == 'rules':
+            system.vote_k = condition['k']
+    else:
+        from energy_cbr import EnergyCBRSystem
+        system = EnergyCBRSystem()
+    if condition['k'] is not None and condition['adaptation'] == 'knn':
+        system.knn_k = condition['k']
+    system.set_case_base(train, verbose=False)
+    if condition['weights'] == 'tuned':
+        system.set_tuned_mode()
+    else:
+        system.set_baseline_mode()
+    return system
+
+
+def _adapt_fn(condition: Dict[str, Any]):
+    """run_query adapt_fn for a condition (None for no adaptation)."""
+    if condition['adaptation'] == 'knn':
+        return lambda retrieved, query, s: s.adapt_knn(retrieved, query)
+    if condition['adaptation'] == 'rules':
+        if condition['domain'] == 'car':
+            return lambda retrieved, query, s: s.adapt_classification(retrieved, query, use_voting=True)
+        return lambda retrieved, query, s: s.adapt_regression(retrieved, query, use_multiple_rules=True)
+    return None
+
+
+def run_condition(condition: Dict[str, Any], train: List[Case], test: List[Case],
+                  shared_scores: Optional[SharedScores] = None) -> Dict[str, Any]:
+    """
+    Run one condition on a train/test split.
+
+    Args:
+        condition: Normalized condition
+        train: Training case base
+        test: Test cases
+        shared_scores: Optional similarity cache shared with other conditions
+
+    Returns:
+        Dictionary with predictions, actuals, metrics and timing
+    """
+    start = time.perf_counter()
+    system = _make_system(condition, train)
+    if shared_scores is not None:
+        shared_scores.attach(system)
+    tuned = condition['weights'] == 'tuned'
+    adapt_fn = _adapt_fn(condition)
+
+    predictions = []
+    cb = system.case_base.copy()
+    for query in test:
+        solution, updated = system.run_query(cb, query, tuned=tuned, adapt_fn=adapt_fn,
+                                             learning=condition['learning'])
+        predictions.append(solution)
+        if condition['learning']:
+            cb = updated
+
+    actuals = [case.solution for case in test]
+    task_type = 'classification' if condition['domain'] == 'car' else 'regression'
+    return {
+        'predictions': predictions,
+        'actuals': actuals,
+        'metrics': Evaluator.calculate_metrics_summary(predictions, actuals, task_type=task_type),
+        'case_base_size': len(cb),
+        'time_seconds': time.perf_counter() - start,
+    }
+
+
+class ExperimentRunner:
+    """Runs config conditions, loading unchanged ones from the on-disk cache."""
+
+    def __init__(self, config: Dict[str, Any], cache_dir: Optional[str] = None):
+        """
+        Args:
+            config: Parsed config with a 'conditions' list (and optional 'cache_dir')
+            cache_dir: Overrides the config's cache directory
+        """
+        self.conditions = [normalize_condition(c) for c in config.get('conditions', [])]
+        names = [c['name'] for c in self.conditions]
+        if len(set(names)) != len(names):
+            raise ValueError("Condition names must be unique")
+        self.cache_dir = cache_dir or config.get('cache_dir', DEFAULT_CACHE_DIR)
+        self._data_hashes: Dict[str, str] = {}
+        self._code_hash: Optional[str] = None
+
+    @classmethod
+    def from_file(cls, filepath: str, cache_dir: Optional[str] = None) -> 'ExperimentRunner':
+        with open(filepath) as f:
+            return cls(json.load(f), cache_dir)
+
+    def key(self, condition: Dict[str, Any]) -> str:
+        """Cache key of a condition under the current data and code."""
+        domain = condition['domain']
+        if domain not in self._data_hashes:
+            self._data_hashes[domain] = file_hash(DATA_FILES[domain])
+        if self._code_hash is None:
+            self._code_hash = code_version()
+        return condition_key(condition, self._data_hashes[domain], self._code_hash)
+
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def load_cached(self, condition: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Cached result of a condition, or None."""
+        path = self._cache_path(self.key(condition))
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _store(self, key: str, result: Dict[str, Any]):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._cache_path(key)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+
+    def run(self, only: Optional[List[str]] = None, force: bool = False) -> Dict[str, Dict]:
+        """
+        Run (or load) the configured conditions.
+
+        Conditions on the same domain and split share a SharedScores cache.
+
+        Args:
+            only: Condition names to run (default: all)
+            force: Recompute even when a cached result exists
+
+        Returns:
+            Dictionary keyed by condition name; each result has 'cached' set
+        """
+        selected = [c for c in self.conditions if only is None or c['name'] in only]
+        if only is not None:
+            missing = set(only) - {c['name'] for c in selected}
+            if missing:
+                raise ValueError(f"Unknown conditions: {sorted(missing)}")
+
+        splits: Dict[tuple, tuple] = {}
+        results = {}
+        for condition in selected:
+            key = self.key(condition)
+            cached = None if force else self.load_cached(condition)
+            if cached is not None:
+                results[condition['name']] = {**cached, 'cached': True}
+                continue
+
+            split_key = (condition['domain'], condition['split_seed'])
+            if split_key not in splits:
+                loader = load_car_system_data if condition['domain'] == 'car' else load_energy_system_data
+                splits[split_key] = (*loader(random_seed=condition['split_seed']), SharedScores())
+            train, test, shared_scores = splits[split_key]
+
+            result = run_condition(condition, train, test, shared_scores)
+            record = {'name': condition['name'], 'key': key, 'condition': condition,
+                      'created': time.strftime('%Y-%m-%dT%H:%M:%S'), **result}
+            self._store(key, record)
+            results[condition['name']] = {**record, 'cached': False}
+        return results
+
+
+def print_experiment_report(results: Dict[str, Dict]):
+    """
+    Print metrics per condition, marking cached results.
+
+    Cached results show when they were computed and how long that took
+    instead of a time for this run.
+    """
+    print("\n" + "="*86)
+    print("EXPERIMENT RESULTS")
+    print("="*86)
+    print(f"{'Condition':<28} {'Source':<9} {'Metrics':<36} {'Time (s)':>9}")
+    for name, result in results.items():
+        metrics = result['metrics']
+        if 'accuracy' in metrics:
+            summary = f"accuracy={metrics['accuracy']:.2f}%"
+        else:
+            summary = f"mae={metrics['mae']:.4f} rmse={metrics['rmse']:.4f}"
+        if result['cached']:
+            timing = f"{'-':>9}  (cached: {result['time_seconds']:.3f}s on {result['created']})"
+        else:
+            timing = f"{result['time_seconds']:>9.3f}"
+        source = 'cache' if result['cached'] else 'computed'
+        print(f"{name:<28} {source:<9} {summary:<36} {timing}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run CBR experiments from a JSON config")
+    parser.add_argument('config', nargs='?', default='experiments.json', help="Experiment config file")
+    parser.add_argument('--only', help="Comma-separated condition names to run")
+    parser.add_argument('--force', action='store_true', help="Ignore cached results")
+    parser.add_argument('--cache-dir', help="Result cache directory (overrides the config)")
+    parser.add_argument('--output', help="Write all results (with predictions) as JSON")
+    args = parser.parse_args(argv)
+
+    runner = ExperimentRunner.from_file(args.config, args.cache_dir)
+    only = [name.strip() for name in args.only.split(',')] if args.only else None
+    results = runner.run(only=only, force=args.force)
+    print_experiment_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+"""
+Instrumentation Module
+Per-phase timers and counters for the CBR cycle, with pluggable sinks:
+- InMemoryStats: aggregate phase times and counters across queries
+- JsonlTraceSink: one JSON record per query written to a trace file
+- ProfilerSink: cProfile enabled only while queries run (per thread)
+
+Attach with CBRSystem.enable_instrumentation(); when no instrumentation is
+attached the systems only pay an attribute check per hook. Queries may run
+in several threads at once: each thread times its own query, and finished
+records reach the sinks one at a time.
+"""
+
+from typing import List, Dict, Optional, Any
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+
+
+class InMemoryStats:
+    """Aggregates per-query records in memory."""
+
+    def __init__(self):
+        self.queries = 0
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.last_record: Optional[Dict] = None
+
+    def start_query(self):
+        pass
+
+    def record(self, record: Dict):
+        """Fold one query record into the totals."""
+        self.queries += 1
+        self.last_record = record
+        for phase, seconds in record['phases'].items():
+            stats = self.phases.get(phase)
+            if stats is None:
+                self.phases[phase] = {'count': 1, 'total_s': seconds,
+                                      'min_s': seconds, 'max_s': seconds}
+            else:
+                stats['count'] += 1
+                stats['total_s'] += seconds
+                stats['min_s'] = min(stats['min_s'], seconds)
+                stats['max_s'] = max(stats['max_s'], seconds)
+        for name, value in record['counters'].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarize collected statistics.
+
+        Returns:
+            Dictionary with query count, per-phase totals/means and counter totals
+        """
+        phases = {phase: {**stats, 'mean_s': stats['total_s'] / stats['count']}
+                  for phase, stats in self.phases.items()}
+        return {'queries': self.queries, 'phases': phases, 'counters': dict(self.counters)}
+
+    def print_summary(self):
+        """Print per-phase timing and counter totals."""
+        summary = self.summary()
+        print(f"Instrumented queries: {summary['queries']}")
+        print(f"{'Phase':<34} {'Calls':>7} {'Total (ms)':>12} {'Mean (ms)':>11}")
+        for phase, stats in sorted(summary['phases'].items()):
+            print(f"{phase:<34} {stats['count']:>7} {stats['total_s'] * 1000:>12.3f} "
+                  f"{stats['mean_s'] * 1000:>11.4f}")
+        for name, value in sorted(summary['counters'].items()):
+            print(f"  {name}: {value}")
+
+
+class JsonlTraceSink:
+    """Writes one JSON line per query."""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._file = open(filepath, 'w')
+
+    def start_query(self):
+        pass
+
+    def record(self, record: Dict):
+        self._file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+class ProfilerSink:
+    """
+    Runs cProfile only while queries are being processed.
+
+    Each thread has its own profiler, enabled and disabled by its own
+    queries, so overlapping queries do not stop each other's profiling;
+    stats() merges them. Where only one profiler can run at a time
+    (Python 3.12+), a query starting while another is profiled is counted
+    in skipped instead.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.skipped = 0
+        self._local = threading.local()
+        # Profilers that have run, one per thread
+        self._profilers: List[cProfile.Profile] = []
+
+    def start_query(self):
+        local = self._local
+        local.active = False
+        if not self.enabled:
+            return
+        profiler = getattr(local, 'profiler', None)
+        if profiler is None:
+            profiler = local.profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            self.skipped += 1
+            return
+        local.active = True
+        if not getattr(local, 'listed', False):
+            local.listed = True
+            self._profilers.append(profiler)
+
+    def record(self, record: Dict):
+        local = self._local
+        if getattr(local, 'active', False):
+            local.profiler.disable()
+            local.active = False
+
+    def stats(self, sort_by: str = 'cumulative', limit: int = 20) -> str:
+        """Return formatted profiler statistics (all threads)."""
+        if not self._profilers:
+            return "No queries profiled\n"
+        stream = io.StringIO()
+        pstats.Stats(*self._profilers, stream=stream).sort_stats(sort_by).print_stats(limit)
+        return stream.getvalue()
+
+
+class _InFlightQuery(threading.local):
+    """Phase times and counters of the query running in this thread."""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+
+
+class Instrumentation:
+    """
+    Collects phase times and counters per query (per thread, so concurrent
+    run_query calls do not mix) and hands a record to every sink when the
+    query ends.
+
+    Phases used by the systems:
+        retrieve, adapt, retain, and adapt.<rule> for each adaptation rule
+    Counters:
+        scans, similarity_evaluations, cache_hits
+    """
+
+    def __init__(self, sinks: Optional[List] = None):
+        self.sinks = list(sinks) if sinks else [InMemoryStats()]
+        self.query_count = 0
+        self._local = _InFlightQuery()
+        # Serializes sink calls and the query count
+        self._lock = threading.Lock()
+
+    @property
+    def phases(self) -> Dict[str, float]:
+        """Phase times of this thread's current query."""
+        return self._local.phases
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        """Counters of this thread's current query."""
+        return self._local.counters
+
+    @property
+    def stats(self) -> Optional[InMemoryStats]:
+        """The first InMemoryStats sink, if any."""
+        for sink in self.sinks:
+            if isinstance(sink, InMemoryStats):
+                return sink
+        return None
+
+    def start_query(self) -> float:
+        """Reset this thread's query state and return the start time."""
+        local = self._local
+        local.phases = {}
+        local.counters = {}
+        with self._lock:
+            for sink in self.sinks:
+                sink.start_query()
+        return time.perf_counter()
+
+    def lap(self, phase: str, start: float) -> float:
+        """Add the time since start to a phase and return the current time."""
+        now = time.perf_counter()
+        phases = self._local.phases
+        phases[phase] = phases.get(phase, 0.0) + (now - start)
+        return now
+
+    def count(self, name: str, n: int = 1):
+        """Increment a counter for this thread's current query."""
+        counters = self._local.counters
+        counters[name] = counters.get(name, 0) + n
+
+    def end_query(self, **fields):
+        """Build this thread's query record and pass it to every sink."""
+        local = self._local
+        with self._lock:
+            self.query_count += 1
+            record = {'query': self.query_count, 'phases': local.phases,
+                      'counters': local.counters, **fields}
+            for sink in self.sinks:
+                sink.record(record)
+
+    def close(self):
+        """Close sinks that hold resources (e.g. trace files)."""
+        for sink in self.sinks:
+            if hasattr(sink, 'close'):
+                sink.close()
+
+
+if __name__ == '__main__':
+    from data_loader import load_energy_system_data
+    from energy_cbr import EnergyCBRSystem
+    # Import via the module name so isinstance checks match enable_instrumentation
+    from instrumentation import InMemoryStats, ProfilerSink
+
+    print("=== Testing Instrumentation ===")
+    train, test = load_energy_system_data()
+    system = EnergyCBRSystem()
+    system.set_case_base(train)
+    system.set_tuned_mode()
+
+    profiler = ProfilerSink()
+    instrumentation = system.enable_instrumentation(InMemoryStats(), profiler)
+
+    def adapt_fn(retrieved, query, s):
+        return s.adapt_regression(retrieved, query, use_multiple_rules=True)
+
+    cb = system.case_base.copy()
+    for query in test[:20]:
+        cb = system.run_query(cb, query, tuned=True, adapt_fn=adapt_fn, learning=True)[1]
+
+    instrumentation.stats.print_summary()
+    print(profiler.stats(limit=8))
+    system.disable_instrumentation()
@@ -2,6 +2,10 @@
 Interactive CBR Tester
 ======================
 Runs all 6 evaluation conditions, then lets you enter your own queries.
+
+If a warm session is running (python session.py start), attaches to it
+instead: no data loading or evaluation at startup, and queries are
+answered by the session's already-fitted systems.
 """
 
 from data_loader import load_car_system_data, load_energy_system_data, Case
@@ -12,39 +16,42 @@ import warnings
 warnings.filterwarnings('ignore')  # suppress numpy divide warnings
 
 
-def run_full_evaluation(car_train, car_test, energy_train, energy_test):
-    print("\n" + "="*60)
-    print("RUNNING ALL 6 CONDITIONS")
-    print("="*60)
+def evaluate_conditions(car_train, car_test, energy_train, energy_test):
+    """
+    Run all 6 conditions.
+
+    Returns:
+        Tuple of (metrics dict, car system, energy system); the systems are
+        left in their post-evaluation state (energy keeps retained cases)
+    """
+    metrics = {}
 
     # --- CAR ---
-    print("\n--- CAR CLASSIFICATION ---")
     car_sys = CarCBRSystem()
+    car_sys.keep_contributions = True  # explanations reuse the retrieval pass
     car_sys.set_case_base(car_train)
 
     car_sys.set_baseline_mode()
     cb = car_sys.case_base.copy()
     preds = [car_sys.run_query(cb, t, tuned=False, learning=False)[0] for t in car_test]
-    acc1 = Evaluator.calculate_accuracy(preds, [c.solution for c in car_test])
-    print(f"  Condition 1 - Untuned (baseline, no adapt):     {acc1:.2f}%")
+    metrics['car_untuned'] = Evaluator.calculate_accuracy(preds, [c.solution for c in car_test])
 
     car_sys.set_tuned_mode()
     cb = car_sys.case_base.copy()
     preds = [car_sys.run_query(cb, t, tuned=True, learning=False)[0] for t in car_test]
-    acc2 = Evaluator.calculate_accuracy(preds, [c.solution for c in car_test])
-    print(f"  Condition 2 - Tuned (weighted, no adapt):       {acc2:.2f}%")
+    metrics['car_tuned'] = Evaluator.calculate_accuracy(preds, [c.solution for c in car_test])
 
     car_sys.set_tuned_mode()
     cb = car_sys.case_base.copy()
     def car_adapt(r, q, s): return car_sys.adapt_classification(r, q, use_voting=True)
     preds = [car_sys.run_query(cb, t, tuned=True, adapt_fn=car_adapt, learning=False)[0] for t in car_test]
-    acc3 = Evaluator.calculate_accuracy(preds, [c.solution for c in car_test])
-    print(f"  Condition 3 - Tuned + Adaptation:               {acc3:.2f}%")
+    metrics['car_tuned_adapt'] = Evaluator.calculate_accuracy(preds, [c.solution for c in car_test])
 
     # --- ENERGY ---
-    print("\n--- ENERGY REGRESSION ---")
     en_sys = EnergyCBRSystem()
+    en_sys.keep_contributions = True
     en_sys.set_case_base(energy_train)
+    actuals = [c.solution for c in energy_test]
 
     en_sys.set_baseline_mode()
     cb = en_sys.case_base.copy()
@@ -52,9 +59,8 @@ def run_full_evaluation(car_train, car_test, energy_train, energy_test):
     for t in energy_test:
         r = en_sys.run_query(cb, t, tuned=False, learning=True)
         preds.append(r[0]); cb = r[1]
-    mae1 = Evaluator.calculate_mae(preds, [c.solution for c in energy_test])
-    rmse1 = Evaluator.calculate_rmse(preds, [c.solution for c in energy_test])
-    print(f"  Condition 4 - Untuned (baseline, learn ON):     MAE={mae1:.4f}  RMSE={rmse1:.4f}")
+    metrics['energy_untuned'] = (Evaluator.calculate_mae(preds, actuals),
+                                 Evaluator.calculate_rmse(preds, actuals))
 
     en_sys.set_tuned_mode()
     cb = en_sys.case_base.copy()
@@ -63,21 +69,106 @@ def run_full_evaluation(car_train, car_test, energy_train, energy_test):
     for t in energy_test:
         r = en_sys.run_query(cb, t, tuned=True, adapt_fn=en_adapt, learning=True)
         preds.append(r[0]); cb = r[1]
-    mae2 = Evaluator.calculate_mae(preds, [c.solution for c in energy_test])
-    rmse2 = Evaluator.calculate_rmse(preds, [c.solution for c in energy_test])
-    print(f"  Condition 5 - Tuned+Adapt (learn ON):           MAE={mae2:.4f}  RMSE={rmse2:.4f}")
+    metrics['energy_tuned'] = (Evaluator.calculate_mae(preds, actuals),
+                               Evaluator.calculate_rmse(preds, actuals))
 
     en_sys.set_tuned_mode()
     cb = en_sys.case_base.copy()
     preds = [en_sys.run_query(cb, t, tuned=True, adapt_fn=en_adapt, learning=False)[0] for t in energy_test]
-    mae3 = Evaluator.calculate_mae(preds, [c.solution for c in energy_test])
-    rmse3 = Evaluator.calculate_rmse(preds, [c.solution for c in energy_test])
-    print(f"  Condition 6 - Tuned+Adapt (learn OFF):          MAE={mae3:.4f}  RMSE={rmse3:.4f}")
+    metrics['energy_tuned_nolearn'] = (Evaluator.calculate_mae(preds, actuals),
+                                       Evaluator.calculate_rmse(preds, actuals))
+
+    return metrics, car_sys, en_sys
+
+
+def print_evaluation(metrics):
+    """Print the 6 condition results."""
+    print("\n" + "="*60)
+    print("RUNNING ALL 6 CONDITIONS")
+    print("="*60)
+
+    print("\n--- CAR CLASSIFICATION ---")
+    print(f"  Condition 1 - Untuned (baseline, no adapt):     {metrics['car_untuned']:.2f}%")
+    print(f"  Condition 2 - Tuned (weighted, no adapt):       {metrics['car_tuned']:.2f}%")
+    print(f"  Condition 3 - Tuned + Adaptation:               {metrics['car_tuned_adapt']:.2f}%")
+
+    print("\n--- ENERGY REGRESSION ---")
+    mae, rmse = metrics['energy_untuned']
+    print(f"  Condition 4 - Untuned (baseline, learn ON):     MAE={mae:.4f}  RMSE={rmse:.4f}")
+    mae, rmse = metrics['energy_tuned']
+    print(f"  Condition 5 - Tuned+Adapt (learn ON):           MAE={mae:.4f}  RMSE={rmse:.4f}")
+    mae, rmse = metrics['energy_tuned_nolearn']
+    print(f"  Condition 6 - Tuned+Adapt (learn OFF):          MAE={mae:.4f}  RMSE={rmse:.4f}")
 
+
+def run_full_evaluation(car_train, car_test, energy_train, energy_test):
+    metrics, car_sys, en_sys = evaluate_conditions(car_train, car_test, energy_train, energy_test)
+    print_evaluation(metrics)
     return car_sys, en_sys
 
 
-def interactive_car_query(car_sys):
+def answer_car_query(car_sys, features):
+    """
+    Predict a car query under the three car conditions.
+
+    Returns:
+        Dictionary with baseline/tuned/tuned_adapt predictions and the most
+        similar case (tuned weights) with its per-feature contributions
+    """
+    query = Case(features=features, solution=None)
+    cb = car_sys.case_base  # not retained (learning=False), so no copy needed
+
+    car_sys.set_baseline_mode()
+    r1 = car_sys.run_query(cb, query, tuned=False, adapt_fn=None, learning=False)
+
+    car_sys.set_tuned_mode()
+    r2 = car_sys.run_query(cb, query, tuned=True, adapt_fn=None, learning=False)
+
+    def car_adapt(r, q, s): return car_sys.adapt_classification(r, q, use_voting=True)
+    r3 = car_sys.run_query(cb, query, tuned=True, adapt_fn=car_adapt, learning=False)
+
+    retrieved, sim, contributions = car_sys.retrieve_most_similar(query, use_weights=True,
+                                                                 with_contributions=True)
+    return {'baseline': r1[0], 'tuned': r2[0], 'tuned_adapt': r3[0],
+            'retrieved_features': dict(retrieved.features),
+            'retrieved_solution': retrieved.solution, 'similarity': sim,
+            'contributions': contributions}
+
+
+def answer_energy_query(en_sys, features):
+    """
+    Predict an energy query (baseline and tuned + adaptation).
+
+    Returns:
+        Dictionary with baseline/tuned_adapt predictions and the most
+        similar case (tuned weights) with its per-feature contributions
+    """
+    query = Case(features=features, solution=None)
+    ecb = en_sys.case_base
+
+    en_sys.set_baseline_mode()
+    r1 = en_sys.run_query(ecb, query, tuned=False, adapt_fn=None, learning=False)
+
+    en_sys.set_tuned_mode()
+    def en_adapt(r, q, s): return en_sys.adapt_regression(r, q, use_multiple_rules=True)
+    r2 = en_sys.run_query(ecb, query, tuned=True, adapt_fn=en_adapt, learning=False)
+
+    retrieved, sim, contributions = en_sys.retrieve_most_similar(query, use_weights=True,
+                                                                with_contributions=True)
+    return {'baseline': float(r1[0]), 'tuned_adapt': float(r2[0]),
+            'retrieved_features': dict(retrieved.features),
+            'retrieved_solution': float(retrieved.solution), 'similarity': sim,
+            'contributions': contributions}
+
+
+def print_contributions(contributions):
+    """Print what each feature adds to the similarity, largest first."""
+    ranked = sorted(contributions.items(), key=lambda item: -item[1])
+    print("    Similarity by feature: " + ", ".join(f"{name} {value:.3f}" for name, value in ranked))
+
+
+def interactive_car_query(answer):
+    """Prompt for a car query; answer(features) returns answer_car_query's dict."""
     print("\n" + "="*60)
     print("ENTER YOUR OWN CAR QUERY")
     print("="*60)
@@ -107,28 +198,19 @@ def interactive_car_query(car_sys):
                 break
             print(f"    ⚠️  Invalid. Choose from: {options}")
 
-    query = Case(features=features, solution=None)
-    cb = car_sys.case_base.copy()
-
-    car_sys.set_baseline_mode()
-    r1 = car_sys.run_query(cb, query, tuned=False, adapt_fn=None, learning=False)
-
-    car_sys.set_tuned_mode()
-    r2 = car_sys.run_query(cb, query, tuned=True, adapt_fn=None, learning=False)
-
-    def car_adapt(r, q, s): return car_sys.adapt_classification(r, q, use_voting=True)
-    r3 = car_sys.run_query(cb, query, tuned=True, adapt_fn=car_adapt, learning=False)
-
-    retrieved, sim = car_sys.retrieve_most_similar(query, use_weights=True)
+    result = answer(features)
 
     print(f"\n  Results:")
-    print(f"    Baseline prediction:   {r1[0]}")
-    print(f"    Tuned prediction:      {r2[0]}")
-    print(f"    Tuned+Adapt prediction:{r3[0]}")
-    print(f"    Most similar case:     {dict(retrieved.features)} → {retrieved.solution}  (sim={sim:.3f})")
+    print(f"    Baseline prediction:   {result['baseline']}")
+    print(f"    Tuned prediction:      {result['tuned']}")
+    print(f"    Tuned+Adapt prediction:{result['tuned_adapt']}")
+    print(f"    Most similar case:     {result['retrieved_features']} → {result['retrieved_solution']}  "
+          f"(sim={result['similarity']:.3f})")
+    print_contributions(result['contributions'])
 
 
-def interactive_energy_query(en_sys):
+def interactive_energy_query(answer):
+    """Prompt for an energy query; answer(features) returns answer_energy_query's dict."""
     print("\n" + "="*60)
     print("ENTER YOUR OWN ENERGY QUERY")
     print("="*60)
@@ -159,30 +241,32 @@ def interactive_energy_query(en_sys):
             except ValueError:
                 print("    ⚠️  Please enter a number (e.g. 0.5 or -1.2)")
 
-    query = Case(features=features, solution=None)
-    ecb = en_sys.case_base.copy()
-
-    en_sys.set_baseline_mode()
-    r1 = en_sys.run_query(ecb, query, tuned=False, adapt_fn=None, learning=False)
-
-    en_sys.set_tuned_mode()
-    def en_adapt(r, q, s): return en_sys.adapt_regression(r, q, use_multiple_rules=True)
-    r2 = en_sys.run_query(ecb, query, tuned=True, adapt_fn=en_adapt, learning=False)
-
-    retrieved, sim = en_sys.retrieve_most_similar(query, use_weights=True)
+    result = answer(features)
 
     print(f"\n  Results:")
-    print(f"    Baseline prediction:    {r1[0]:.2f} kWh")
-    print(f"    Tuned+Adapt prediction: {r2[0]:.2f} kWh")
-    print(f"    Most similar case:      {retrieved.solution:.2f} kWh  (sim={sim:.4f})")
+    print(f"    Baseline prediction:    {result['baseline']:.2f} kWh")
+    print(f"    Tuned+Adapt prediction: {result['tuned_adapt']:.2f} kWh")
+    print(f"    Most similar case:      {result['retrieved_solution']:.2f} kWh  (sim={result['similarity']:.4f})")
+    print_contributions(result['contributions'])
 
 
 def main():
-    print("\nLoading datasets...")
-    car_train, car_test = load_car_system_data(random_seed=42)
-    energy_train, energy_test = load_energy_system_data(random_seed=42)
-
-    car_sys, en_sys = run_full_evaluation(car_train, car_test, energy_train, energy_test)
+    from session import SessionClient
+
+    client = SessionClient.connect()
+    if client is not None:
+        print(f"\nAttached to warm session at {client.address[0]}:{client.address[1]}")
+        print_evaluation(client.evaluation())
+        car_answer = lambda features: client.car_query(features, state='evaluated')
+        energy_answer = lambda features: client.energy_query(features, state='evaluated')
+    else:
+        print("\nLoading datasets...")
+        car_train, car_test = load_car_system_data(random_seed=42)
+        energy_train, energy_test = load_energy_system_data(random_seed=42)
+
+        car_sys, en_sys = run_full_evaluation(car_train, car_test, energy_train, energy_test)
+        car_answer = lambda features: answer_car_query(car_sys, features)
+        energy_answer = lambda features: answer_energy_query(en_sys, features)
 
     while True:
         print("\n" + "="*60)
@@ -194,9 +278,9 @@ def main():
         choice = input("\nYour choice: ").strip().lower()
 
         if choice == '1':
-            interactive_car_query(car_sys)
+            interactive_car_query(car_answer)
         elif choice == '2':
-            interactive_energy_query(en_sys)
+            interactive_energy_query(energy_answer)
         elif choice == 'q':
             print("Bye!")
             break
@@ -0,0 +1,247 @@
+"""
+Inverted Index Module
+Posting-list retrieval over a categorical CaseIndex (the car domain):
+- Cases with the same feature values score the same, so each distinct
+  combination of values is scored once and keeps the positions of its cases
+- One posting list per (feature, value) holds the combinations with that
+  value; a query accumulates weight x similarity(query value, value) into
+  the combinations of each list, term at a time, and skips lists that
+  contribute nothing
+- Max-score pruning: features are accumulated in descending weight order;
+  once a combination's partial score plus the weight of the features still
+  to come is below the k-th best partial score, it is dropped
+- The survivors are rescored exactly, so results (and tie order) match a
+  full scan; cost depends on the distinct combinations, not the case count
+- Forks share the lists, which only grow: a version corrects the counts
+  for the cases past its own size, and only the version that added last
+  appends in place (others copy first), so extending a fork costs O(1)
+  per case
+"""
+
+from typing import List, Dict, Optional, Tuple
+import threading
+import numpy as np
+from data_loader import Case
+from case_index import CaseIndex
+from case_store import AppendArray
+
+
+# Slack of the pruning bounds, in units of rounding error per feature:
+# partial scores are summed in weight order, final scores in query order
+# (and in float32 for float32 storage), so they may differ in the last bits
+BOUND_SLACK_ULPS = 8
+
+
+def _kth_best(scores: np.ndarray, counts: np.ndarray, k: int) -> Optional[float]:
+    """k-th highest score when score i occurs counts[i] times (None: fewer than k)."""
+    order = np.argsort(-scores, kind='stable')
+    reached = np.searchsorted(np.cumsum(counts[order]), k)
+    if reached >= len(order):
+        return None
+    return scores[order[reached]]
+
+
+class InvertedIndex:
+    """
+    Posting lists over the distinct feature combinations of a CaseIndex.
+
+    Positions are those of the index (live cases); each combination keeps
+    its cases' positions in increasing order, and labels holds the
+    combination of each position. The lists are shared by forks: _tail[0]
+    counts the positions added to them, and _lock keeps readers from seeing
+    counts, labels and postings of different sizes.
+    """
+
+    def __init__(self, index: CaseIndex):
+        """
+        Build posting lists for the cases of an index.
+
+        Args:
+            index: Index with categorical features only (not registered in
+                index.views here)
+        """
+        if any(index.numerical.values()):
+            raise ValueError("Posting lists need categorical features only")
+        self.index = index
+        self._own({}, AppendArray(width=len(index.feature_names)), [], AppendArray(),
+                  {name: {} for name in index.feature_names})
+        self.extend(0, len(index))
+
+    def _own(self, combos: Dict[tuple, int], codes: AppendArray, members: List[AppendArray],
+             labels: AppendArray, postings: Dict[str, Dict[int, AppendArray]]):
+        """Switch to unshared lists (counts follow from labels)."""
+        self.combos = combos
+        self.codes = codes
+        self.members = members
+        self.labels = labels
+        self.counts = AppendArray(np.bincount(labels.values, minlength=len(members)))
+        self.postings = postings
+        self._tail = [len(labels)]
+        self._lock = threading.Lock()
+
+    def fork(self, index: CaseIndex) -> 'InvertedIndex':
+        """Posting lists for a fork of the index (shares the lists, O(1))."""
+        forked = InvertedIndex.__new__(InvertedIndex)
+        forked.__dict__.update(self.__dict__)
+        forked.index = index
+        return forked
+
+    def _own_labels(self, labels: np.ndarray):
+        """Switch to unshared lists holding the cases with these labels."""
+        with self._lock:
+            combos = dict(self.combos)
+            codes = self.codes.copy()
+            postings = {name: {value: ids.copy() for value, ids in lists.items()}
+                        for name, lists in self.postings.items()}
+        counts = np.bincount(labels, minlength=len(combos))
+        groups = np.split(np.argsort(labels, kind='stable'), np.cumsum(counts)[:-1])
+        self._own(combos, codes, [AppendArray(group) for group in groups], AppendArray(labels), postings)
+
+    @property
+    def n_combinations(self) -> int:
+        """Distinct feature combinations seen (including ones whose cases were removed)."""
+        return len(self.members)
+
+    def extend(self, start: int, end: int):
+        """
+        Add the cases at positions start..end-1 of the index.
+
+        Called by CaseIndex.extend after the cases are encoded.
+        """
+        if end <= start:
+            return
+        if self._tail[0] != start:
+            # Another version added past our cases: stop sharing
+            self._own_labels(self.labels.values[:start])
+        index = self.index
+        positions = np.arange(start, end)
+        rows = index._physical(positions)
+        codes = np.column_stack([index.columns[name][rows].astype(np.int64)
+                                 for name in index.feature_names])
+        unique, inverse = np.unique(codes, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        order = np.argsort(inverse, kind='stable')
+        groups = np.split(positions[order], np.searchsorted(inverse[order], np.arange(1, len(unique))))
+        with self._lock:
+            first = len(self.members)
+            ids = np.zeros(len(unique), dtype=np.int64)
+            for i, (values, group) in enumerate(zip(map(tuple, unique.tolist()), groups)):
+                combo = self.combos.get(values)
+                if combo is None:
+                    combo = self.combos[values] = len(self.members)
+                    self.members.append(AppendArray(group))
+                else:
+                    self.members[combo].append(group)
+                ids[i] = combo
+            if len(self.members) > first:
+                new = ids >= first
+                self.codes.append(unique[new][np.argsort(ids[new])])
+                self.counts.append(np.zeros(len(self.members) - first, dtype=np.int64))
+                added_ids = np.arange(first, len(self.members))
+                for column, name in enumerate(index.feature_names):
+                    values = self.codes.values[first:, column]
+                    lists = self.postings[name]
+                    for value in np.unique(values).tolist():
+                        added = added_ids[values == value]
+                        known = lists.get(value)
+                        if known is None:
+                            lists[value] = AppendArray(added)
+                        else:
+                            known.append(added)
+            self.counts.values[ids] += np.array([len(group) for group in groups], dtype=np.int64)
+            self.labels.append(ids[inverse])
+            self._tail[0] = end
+
+    def delete(self, positions: np.ndarray):
+        """
+        Drop removed cases and renumber the rest (positions: sorted, unique).
+
+        Called by CaseIndex.delete (after the cases are removed). Emptied
+        combinations keep their posting entries (with a count of 0) so that
+        their cases can come back cheaply.
+        """
+        labels = self.labels.values[:len(self.index) + len(positions)]
+        self._own_labels(labels[~np.isin(np.arange(len(labels)), positions)])
+
+    def top_k(self, query: Case, weights: Optional[Dict[str, float]],
+              k: int) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        k most similar cases, best first (ties in position order).
+
+        Args:
+            query: Query case
+            weights: Feature weights, or None for equal weights
+            k: Number of cases
+
+        Returns:
+            (positions, scores, number of similarity terms evaluated)
+        """
+        index = self.index
+        feature_names = [name for name in query.features if name in index.columns]
+        if k <= 0 or not len(index):
+            return np.zeros(0, dtype=np.int64), np.zeros(0), 0
+        query_codes = {name: index._encode_column(name, [query.features[name]])[0]
+                       for name in feature_names}
+        weight_of = {name: weights.get(name, 1.0) if weights else 1.0 for name in feature_names}
+
+        # This version's counts and lists (shared ones may have grown past it)
+        n = len(index)
+        with self._lock:
+            counts = self.counts.values.copy()
+            labels = self.labels.values
+            codes = self.codes.values
+            postings = {name: [(value, combos.values) for value, combos in self.postings[name].items()]
+                        for name in feature_names}
+        if len(labels) > n:
+            counts -= np.bincount(labels[n:], minlength=len(counts))
+
+        # Accumulate the heaviest features first; drop combinations that can
+        # no longer reach the k-th best partial score
+        alive = counts > 0
+        partial = np.zeros(len(counts))
+        remaining = float(sum(weight_of.values()))
+        slack = BOUND_SLACK_ULPS * len(feature_names) * np.finfo(index._score_dtype).eps * remaining
+        evaluated = 0
+        for name in sorted(feature_names, key=lambda name: -weight_of[name]):
+            weight = weight_of[name]
+            remaining -= weight
+            row = index._table(name)[query_codes[name]]
+            for value, combos in postings[name]:
+                gain = row[value] * weight
+                if gain == 0:
+                    continue
+                combos = combos[alive[combos]]
+                partial[combos] += gain
+                evaluated += len(combos)
+            live = np.flatnonzero(alive)
+            kth = _kth_best(partial[live], counts[live], k)
+            if kth is not None:
+                alive[live[partial[live] + remaining < kth - slack]] = False
+
+        # Exact scores of the survivors, summed as CaseIndex.score does
+        candidates = np.flatnonzero(alive)
+        weighted_sum = np.zeros(len(candidates), dtype=index._score_dtype)
+        total_weight = 0.0
+        for name in feature_names:
+            column = index.feature_names.index(name)
+            sims = index._table(name)[query_codes[name], codes[candidates, column]]
+            if weights:
+                weight = weights.get(name, 1.0)
+                weighted_sum += sims * weight
+            else:
+                weight = 1.0
+                weighted_sum += sims
+            total_weight += weight
+        evaluated += len(candidates) * len(feature_names)
+        scores = weighted_sum / total_weight if total_weight else np.zeros(len(candidates))
+
+        # Expand the best combinations into their cases
+        cutoff = _kth_best(scores, counts[candidates], k)
+        chosen = candidates if cutoff is None else candidates[scores >= cutoff]
+        chosen_scores = scores if cutoff is None else scores[scores >= cutoff]
+        groups = [self.members[c].values for c in chosen.tolist()]
+        groups = [group[group < n] for group in groups]
+        positions = np.concatenate(groups or [np.zeros(0, dtype=np.int64)])
+        case_scores = np.repeat(chosen_scores, [len(group) for group in groups])
+        best = np.lexsort((positions, -case_scores))[:k]
+        return positions[best], case_scores[best], evaluated
@@ -0,0 +1,364 @@
+"""
+Load Test Module
+Replays a query stream against a CBR system and records how latency
+develops as the case base grows and under concurrency:
+- Closed loop (--concurrency N): N workers each send their next query as
+  soon as the previous one is answered
+- Open loop (--rate R): queries are issued on a fixed schedule of R per
+  second by up to --concurrency workers; latency is measured from the
+  scheduled time, so queueing delay counts (no coordinated omission)
+- Targets: an in-process CarCBRSystem/EnergyCBRSystem (run_query, optionally
+  with learning) or the warm session server (session.py)
+
+Completed queries are grouped into time windows; each window reports
+p50/p95/p99/max latency, throughput, failed queries (errors) and the case
+base size, so the O(n)
+growth under learning shows up as a curve. Results go to CSV (one row per
+window) and/or JSON (windows, overall summary with a latency histogram,
+settings and environment).
+
+Usage:
+    python load_test.py energy --learning --concurrency 1 --queries 5000 --csv energy_load.csv
+    python load_test.py car --rate 200 --concurrency 4 --duration 10 --json car_load.json
+    python load_test.py car --target session --concurrency 8 --queries 2000
+"""
+
+from typing import List, Dict, Optional, Callable, Tuple, Any
+import argparse
+import csv
+import itertools
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from data_loader import Case
+from benchmark import environment_info
+from car_cbr import CarCBRSystem
+from energy_cbr import EnergyCBRSystem
+from synthetic_data import generate_cases, generate_queries
+
+
+WINDOW_FIELDS = ['window', 'start_s', 'end_s', 'partial', 'queries', 'errors', 'throughput_qps', 'mean_ms',
+                 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'case_base_size']
+# Upper edges (ms) of the latency histogram buckets in the JSON summary
+HISTOGRAM_EDGES_MS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+def _adapt_function(domain: str, adapt: str) -> Optional[Callable]:
+    """adapt_fn for run_query: 'none', 'rules' or 'knn'."""
+    if adapt == 'none':
+        return None
+    if adapt == 'knn':
+        return lambda retrieved, query, s: s.adapt_knn(retrieved, query)
+    if domain == 'car':
+        return lambda retrieved, query, s: s.adapt_classification(retrieved, query, use_voting=True)
+    return lambda retrieved, query, s: s.adapt_regression(retrieved, query, use_multiple_rules=True)
+
+
+def local_target(domain: str, size: int = 0, tuned: bool = True, adapt: str = 'rules',
+                 learning: bool = False, seed: int = 42) -> Tuple[Callable, Callable]:
+    """
+    In-process system answering queries with run_query (safe from several threads).
+
+    Args:
+        domain: 'car' or 'energy'
+        size: Synthetic case base size, or 0 for the default training split
+        tuned: Tuned (True) or baseline weights
+        adapt: 'none', 'rules' or 'knn'
+        learning: Retain every solved query
+        seed: Seed of the synthetic case base
+
+    Returns:
+        (query_fn(query) -> case base size after the query, close_fn)
+    """
+    if size:
+        cases = list(generate_cases(domain, size, seed))
+    elif domain == 'car':
+        from data_loader import load_car_system_data
+        cases, _ = load_car_system_data(random_seed=seed)
+    else:
+        from data_loader import load_energy_system_data
+        cases, _ = load_energy_system_data(random_seed=seed)
+    system = CarCBRSystem() if domain == 'car' else EnergyCBRSystem()
+    system.set_case_base(cases, verbose=False)
+    adapt_fn = _adapt_function(domain, adapt)
+
+    def query_fn(query: Case) -> int:
+        _, cb = system.run_query(system.case_base, query, tuned=tuned,
+                                 adapt_fn=adapt_fn, learning=learning)
+        return len(cb)
+
+    return query_fn, lambda: None
+
+
+def session_target(domain: str, learning: bool = False) -> Tuple[Callable, Callable]:
+    """
+    Warm session server (session.py) answering queries; one connection per worker thread.
+
+    Each query is one car_query/energy_query request (all conditions); with
+    learning, the tuned + adaptation answer is retained with a second request.
+
+    Returns:
+        (query_fn(query) -> case base size or None, close_fn)
+    """
+    from session import SessionClient
+
+    probe = SessionClient.connect()
+    if probe is None:
+        raise RuntimeError("No warm session running (start one with: python session.py start)")
+    size = [probe.status()['case_base_sizes']['fresh'][domain]]
+    probe.close()
+    local = threading.local()
+    clients = []
+    lock = threading.Lock()
+
+    def query_fn(query: Case) -> Optional[int]:
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = SessionClient()
+            with lock:
+                clients.append(client)
+        features = dict(query.features)
+        if domain == 'car':
+            result = client.car_query(features)
+        else:
+            result = client.energy_query({name: float(value) for name, value in features.items()})
+        if learning:
+            size[0] = client.retain(domain, features, result['tuned_adapt'])
+        return size[0]
+
+    def close_fn():
+        for client in clients:
+            client.close()
+
+    return query_fn, close_fn
+
+
+def run_load(query_fn: Callable, queries: List[Case], concurrency: int = 1,
+             rate: Optional[float] = None, n_queries: Optional[int] = None,
+             duration: Optional[float] = None) -> List[Tuple[float, float, Any, Optional[str]]]:
+    """
+    Replay the query list (cycling) until n_queries are sent or duration passes.
+
+    Args:
+        query_fn: Callable answering one query, returning the case base size
+        queries: Query stream
+        concurrency: Worker threads
+        rate: Queries per second (open loop), or None for closed loop
+        n_queries: Number of queries to send
+        duration: Seconds to keep sending
+
+    Returns:
+        One (completion time, latency seconds, case base size, error) per
+        query, times relative to the start of the run; error is None, or
+        "Type: message" of the exception query_fn raised (size is then None)
+    """
+    if n_queries is None and duration is None:
+        n_queries = len(queries)
+    records = []
+    stream = itertools.cycle(queries)
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def stopped(sent: int, now: float) -> bool:
+        return ((n_queries is not None and sent >= n_queries) or
+                (duration is not None and now - start >= duration))
+
+    def timed(query: Case, scheduled: float):
+        try:
+            size, error = query_fn(query), None
+        except Exception as exc:
+            size, error = None, f"{type(exc).__name__}: {exc}"
+        done = time.perf_counter()
+        with lock:
+            records.append((done - start, done - scheduled, size, error))
+
+    if rate is None:
+        sent = itertools.count()
+
+        def worker():
+            while True:
+                with lock:
+                    i = next(sent)
+                    query = next(stream)
+                now = time.perf_counter()
+                if stopped(i, now):
+                    return
+                timed(query, now)
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        interval = 1.0 / rate
+        futures = []
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for i in itertools.count():
+                scheduled = start + i * interval
+                if stopped(i, scheduled):
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(timed, next(stream), scheduled))
+        for future in futures:
+            future.result()  # query errors are recorded; re-raise anything else
+    records.sort(key=lambda record: record[0])
+    return records
+
+
+def summarize_window(latencies: np.ndarray, start_s: float, end_s: float,
+                     size: Any, window: int, partial: bool = False, errors: int = 0) -> Dict[str, Any]:
+    """
+    Latency percentiles (ms) and throughput (queries over end_s - start_s) of one window.
+
+    latencies are those of the successful queries (NaN statistics if there
+    are none); errors counts the failed ones.
+    """
+    ms = latencies * 1000
+    if len(ms):
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        mean, peak = float(ms.mean()), float(ms.max())
+    else:
+        p50 = p95 = p99 = mean = peak = float('nan')
+    span = end_s - start_s
+    return {'window': window, 'start_s': round(start_s, 3), 'end_s': round(end_s, 3),
+            'partial': partial, 'queries': len(ms), 'errors': errors,
+            'throughput_qps': len(ms) / span if span > 0 else float('nan'),
+            'mean_ms': mean, 'p50_ms': float(p50), 'p95_ms': float(p95),
+            'p99_ms': float(p99), 'max_ms': peak, 'case_base_size': size}
+
+
+def summarize_records(records: List[Tuple[float, float, Any, Optional[str]]], start_s: float,
+                      end_s: float, window: Any, partial: bool = False) -> Dict[str, Any]:
+    """summarize_window over run_load records (failed queries counted as errors)."""
+    done = [record for record in records if record[3] is None]
+    return summarize_window(np.array([latency for _, latency, _, _ in done]), start_s, end_s,
+                            done[-1][2] if done else None, window, partial,
+                            errors=len(records) - len(done))
+
+
+def windows_of(records: List[Tuple[float, float, Any, Optional[str]]],
+               window_s: float) -> List[Dict[str, Any]]:
+    """
+    Group completed queries into fixed time windows.
+
+    Throughput is taken over the full window length, except for the last
+    window, which is clipped to the end of the run and flagged as partial.
+    A last window shorter than half a window is merged into the one before,
+    so a few stragglers do not show up as a throughput spike.
+
+    Returns:
+        One summary per non-empty window, with the case base size at its
+        last successful query
+    """
+    end = records[-1][0]
+    groups = [(window, list(group)) for window, group
+              in itertools.groupby(records, key=lambda record: int(record[0] // window_s))]
+    last, tail = groups[-1]
+    if len(groups) > 1 and end - last * window_s < window_s / 2:
+        groups.pop()
+        window, group = groups.pop()
+        groups.append((window, group + tail))
+    summaries = []
+    for i, (window, group) in enumerate(groups):
+        start_s = window * window_s
+        clipped = i == len(groups) - 1 and end < start_s + window_s
+        end_s = end if i == len(groups) - 1 else start_s + window_s
+        summaries.append(summarize_records(group, start_s, end_s, window, partial=clipped))
+    return summaries
+
+
+def histogram(latencies: np.ndarray) -> List[Dict[str, Any]]:
+    """Counts of latencies per bucket (upper edges in HISTOGRAM_EDGES_MS, plus overflow)."""
+    counts = np.bincount(np.searchsorted(HISTOGRAM_EDGES_MS, latencies * 1000),
+                         minlength=len(HISTOGRAM_EDGES_MS) + 1)
+    edges = HISTOGRAM_EDGES_MS + [None]
+    return [{'le_ms': edge, 'count': int(count)} for edge, count in zip(edges, counts)]
+
+
+def print_report(windows: List[Dict[str, Any]], overall: Dict[str, Any]):
+    """Print one line per window and the overall summary."""
+    print(f"\n{'window':>6} {'queries':>8} {'errors':>7} {'qps':>9} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'max ms':>9} {'cb size':>8}")
+    for w in windows:
+        print(f"{w['window']:>6} {w['queries']:>8} {w['errors']:>7} {w['throughput_qps']:>9.1f} "
+              f"{w['p50_ms']:>9.3f} {w['p95_ms']:>9.3f} {w['p99_ms']:>9.3f} {w['max_ms']:>9.3f} "
+              f"{str(w['case_base_size']):>8}" + ("  (partial)" if w['partial'] else ""))
+    print(f"\nOverall: {overall['queries']} queries in {overall['end_s']:.2f}s "
+          f"({overall['throughput_qps']:.1f}/s), p50={overall['p50_ms']:.3f} ms  "
+          f"p95={overall['p95_ms']:.3f} ms  p99={overall['p99_ms']:.3f} ms  max={overall['max_ms']:.3f} ms")
+    if overall['errors']:
+        print(f"Errors: {overall['errors']} failed queries (first: {overall['first_error']})")
+
+
+def write_csv(windows: List[Dict[str, Any]], filepath: str):
+    with open(filepath, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=WINDOW_FIELDS)
+        writer.writeheader()
+        writer.writerows(windows)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test run_query latency")
+    parser.add_argument('domain', choices=['car', 'energy'])
+    parser.add_argument('--target', choices=['local', 'session'], default='local')
+    parser.add_argument('--concurrency', type=int, default=1, help="Worker threads")
+    parser.add_argument('--rate', type=float, help="Queries per second (open loop)")
+    parser.add_argument('--queries', type=int, help="Queries to send (default: one pass)")
+    parser.add_argument('--duration', type=float, help="Seconds to keep sending")
+    parser.add_argument('--stream', type=int, default=1000, help="Distinct synthetic queries")
+    parser.add_argument('--size', type=int, default=0,
+                        help="Synthetic case base size (default: training split; local only)")
+    parser.add_argument('--baseline', action='store_true', help="Baseline instead of tuned weights")
+    parser.add_argument('--adapt', choices=['none', 'rules', 'knn'], default='rules')
+    parser.add_argument('--learning', action='store_true', help="Retain every solved query")
+    parser.add_argument('--window', type=float, default=1.0, help="Seconds per report window")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--csv', help="Write per-window rows to this CSV file")
+    parser.add_argument('--json', help="Write windows and summary to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.target == 'session':
+        query_fn, close_fn = session_target(args.domain, args.learning)
+    else:
+        query_fn, close_fn = local_target(args.domain, args.size, not args.baseline,
+                                          args.adapt, args.learning, args.seed)
+    queries = list(generate_queries(args.domain, args.stream, args.seed))
+    mode = f"rate={args.rate}/s" if args.rate else "closed loop"
+    print(f"Load test: {args.domain} via {args.target}, {mode}, concurrency={args.concurrency}, "
+          f"learning={args.learning}")
+    try:
+        records = run_load(query_fn, queries, args.concurrency, args.rate,
+                           args.queries, args.duration)
+    finally:
+        close_fn()
+    if not records:
+        print("No queries completed")
+        return 1
+
+    windows = windows_of(records, args.window)
+    latencies = np.array([latency for _, latency, _, error in records if error is None])
+    overall = summarize_records(records, 0.0, records[-1][0], 'all')
+    overall['first_error'] = next((error for *_, error in records if error is not None), None)
+    print_report(windows, overall)
+
+    if args.csv:
+        write_csv(windows, args.csv)
+        print(f"Windows written to {args.csv}")
+    if args.json:
+        settings = {key: value for key, value in vars(args).items() if key not in ('csv', 'json')}
+        with open(args.json, 'w') as f:
+            json.dump({'settings': settings, 'environment': environment_info(),
+                       'overall': {**overall, 'histogram': histogram(latencies)},
+                       'windows': windows}, f, indent=2)
+        print(f"Results written to {args.json}")
+    return 0 if overall['queries'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
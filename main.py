@@ -5,15 +5,18 @@ Executes the complete evaluation of both CBR systems:
 - 3 conditions for classification (car evaluation)
 """
 
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 import sys
+import argparse
 from data_loader import load_car_system_data, load_energy_system_data, Case
 from car_cbr import CarCBRSystem
 from energy_cbr import EnergyCBRSystem
-from evaluation import Evaluator
+from evaluation import (Evaluator, SharedScores, run_cross_validation,
+                        run_multi_seed, print_multi_seed_report)
 
 
-def run_car_tests(train_cases: List[Case], test_cases: List[Case]) -> Dict[str, Dict]:
+def run_car_tests(train_cases: List[Case], test_cases: List[Case],
+                  shared_scores: Optional[SharedScores] = None) -> Dict[str, Dict]:
     """
     Run 3 car classification test conditions.
     
@@ -21,14 +24,19 @@ def run_car_tests(train_cases: List[Case], test_cases: List[Case]) -> Dict[str,
     Condition 2: Tuned similarity, no adaptation
     Condition 3: Tuned similarity, with adaptation
     
+    Similarities are computed once per (query, weights) and shared across
+    conditions through shared_scores.
+    
     Args:
         train_cases: Training case base
         test_cases: Test cases
+        shared_scores: Similarity cache shared by the conditions (default: new)
         
     Returns:
         Dictionary with results for each condition
     """
     results = {}
+    shared_scores = shared_scores or SharedScores()
     
     print("\n" + "="*70)
     print("CAR CLASSIFICATION - 3 Test Conditions")
@@ -41,6 +49,7 @@ def run_car_tests(train_cases: List[Case], test_cases: List[Case]) -> Dict[str,
     system1 = CarCBRSystem()
     system1.set_case_base(train_cases)
     system1.set_baseline_mode()
+    shared_scores.attach(system1)
 
     predictions1 = []
     cb1 = system1.case_base.copy()   # start with a copy — run_query will manage updates
@@ -65,6 +74,7 @@ def run_car_tests(train_cases: List[Case], test_cases: List[Case]) -> Dict[str,
     system2 = CarCBRSystem()
     system2.set_case_base(train_cases)
     system2.set_tuned_mode()
+    shared_scores.attach(system2)
     
     predictions2 = []
     cb2 = system2.case_base.copy()
@@ -90,6 +100,7 @@ def run_car_tests(train_cases: List[Case], test_cases: List[Case]) -> Dict[str,
     system3 = CarCBRSystem()
     system3.set_case_base(train_cases)
     system3.set_tuned_mode()
+    shared_scores.attach(system3)
 
     def car_adapt_fn(retrieved, query, system):
         """Adaptation wrapper compatible with run_query adapt_fn interface."""
@@ -115,7 +126,8 @@ def run_car_tests(train_cases: List[Case], test_cases: List[Case]) -> Dict[str,
     return results
 
 
-def run_energy_tests(train_cases: List[Case], test_cases: List[Case]) -> Dict[str, Dict]:
+def run_energy_tests(train_cases: List[Case], test_cases: List[Case],
+                     shared_scores: Optional[SharedScores] = None) -> Dict[str, Dict]:
     """
     Run 3 energy regression test conditions.
     
@@ -123,14 +135,20 @@ def run_energy_tests(train_cases: List[Case], test_cases: List[Case]) -> Dict[st
     Condition 2: Tuned + adaptation (with learning)
     Condition 3: Tuned + adaptation (WITHOUT learning)
     
+    Similarities are computed once per (query, weights) and shared across
+    conditions through shared_scores; cases retained under learning are
+    scored incrementally.
+    
     Args:
         train_cases: Training case base
         test_cases: Test cases
+        shared_scores: Similarity cache shared by the conditions (default: new)
         
     Returns:
         Dictionary with results for each condition
     """
     results = {}
+    shared_scores = shared_scores or SharedScores()
     
     print("\n" + "="*70)
     print("ENERGY REGRESSION - 3 Test Conditions")
@@ -143,6 +161,7 @@ def run_energy_tests(train_cases: List[Case], test_cases: List[Case]) -> Dict[st
     system1 = EnergyCBRSystem()
     system1.set_case_base(train_cases)
     system1.set_baseline_mode()
+    shared_scores.attach(system1)
     
     predictions1 = []
     case_base_size_before = len(system1.case_base)
@@ -179,6 +198,7 @@ def run_energy_tests(train_cases: List[Case], test_cases: List[Case]) -> Dict[st
     system2 = EnergyCBRSystem()
     system2.set_case_base(train_cases)
     system2.set_tuned_mode()
+    shared_scores.attach(system2)
 
     def energy_adapt_fn(retrieved, query, system):
         """Adaptation wrapper compatible with run_query adapt_fn interface."""
@@ -219,6 +239,7 @@ def run_energy_tests(train_cases: List[Case], test_cases: List[Case]) -> Dict[st
     system3 = EnergyCBRSystem()
     system3.set_case_base(train_cases)
     system3.set_tuned_mode()
+    shared_scores.attach(system3)
 
     def energy_adapt_fn3(retrieved, query, system):
         return system3.adapt_regression(retrieved, query, use_multiple_rules=True)
@@ -333,4 +354,24 @@ def main():
 
 
 if __name__ == '__main__':
-    car_results, energy_results = main()
+    parser = argparse.ArgumentParser(description="Run the 6 CBR test conditions")
+    parser.add_argument('--cv', type=int, metavar='K',
+                        help="Run K-fold cross-validation instead of the single 80/20 split")
+    parser.add_argument('--loo', action='store_true',
+                        help="Run exact leave-one-out cross-validation")
+    parser.add_argument('--seed', type=int, default=42,
+                        help="Seed for the k-fold shuffle, or first seed for --seeds")
+    parser.add_argument('--seeds', type=int, metavar='N',
+                        help="Repeat the 80/20 evaluation over N random splits in parallel")
+    parser.add_argument('--workers', type=int, help="Worker processes for --seeds (default: all cores)")
+    args = parser.parse_args()
+    
+    if args.seeds:
+        results = run_multi_seed(list(range(args.seed, args.seed + args.seeds)), workers=args.workers)
+        print_multi_seed_report(results)
+    elif args.loo:
+        car_results, energy_results = run_cross_validation(n_folds=None)
+    elif args.cv:
+        car_results, energy_results = run_cross_validation(n_folds=args.cv, random_seed=args.seed)
+    else:
+        car_results, energy_results = main()
@@ -3,6 +3,9 @@ Interactive Query Tester
 ========================
 Edit the queries below and run:  python query_test.py
 
+If a warm session is running (python session.py start), the queries are
+answered by it instead of loading the data and fitting the systems here.
+
 CAR feature options:
   buying   : vhigh | high | med | low
   maint    : vhigh | high | med | low
@@ -28,6 +31,8 @@ ENERGY features are normalized (z-score). Use values roughly in [-2, 2].
 from data_loader import load_car_system_data, load_energy_system_data, Case
 from car_cbr import CarCBRSystem
 from energy_cbr import EnergyCBRSystem
+from interactive import answer_car_query, answer_energy_query
+from session import SessionClient
 
 # ================================================================
 #  ✏️  EDIT YOUR CAR QUERY HERE
@@ -61,7 +66,7 @@ my_energy_query = Case(features={
 #  RUN — no need to edit below this line
 # ================================================================
 
-def test_car(query):
+def test_car(query, client=None):
     print("=" * 60)
     print("CAR CLASSIFICATION QUERY")
     print("=" * 60)
@@ -69,36 +74,28 @@ def test_car(query):
     for k, v in query.features.items():
         print(f"    {k}: {v}")
 
-    train, _ = load_car_system_data(random_seed=42)
-    sys = CarCBRSystem()
-    sys.set_case_base(train)
-    cb = sys.case_base.copy()
-
-    # Baseline
-    sys.set_baseline_mode()
-    r_base = sys.run_query(cb, query, tuned=False, adapt_fn=None, learning=False)
-    print(f"\n  [Baseline]       Prediction: {r_base[0]}")
+    if client is not None:
+        result = client.car_query(query.features)
+    else:
+        train, _ = load_car_system_data(random_seed=42)
+        sys = CarCBRSystem()
+        sys.set_case_base(train)
+        result = answer_car_query(sys, query.features)
 
-    # Tuned
-    sys.set_tuned_mode()
-    r_tuned = sys.run_query(cb, query, tuned=True, adapt_fn=None, learning=False)
-    print(f"  [Tuned]          Prediction: {r_tuned[0]}")
-
-    # Tuned + Adaptation
-    def adapt_fn(retrieved, q, s):
-        return sys.adapt_classification(retrieved, q, use_voting=True)
-    r_adapt = sys.run_query(cb, query, tuned=True, adapt_fn=adapt_fn, learning=False)
-    print(f"  [Tuned+Adapt]    Prediction: {r_adapt[0]}")
+    print(f"\n  [Baseline]       Prediction: {result['baseline']}")
+    print(f"  [Tuned]          Prediction: {result['tuned']}")
+    print(f"  [Tuned+Adapt]    Prediction: {result['tuned_adapt']}")
 
     # Show most similar case
-    retrieved, sim = sys.retrieve_most_similar(query, use_weights=True)
     print(f"\n  Most similar case in CB:")
-    for k, v in retrieved.features.items():
+    for k, v in result['retrieved_features'].items():
         print(f"    {k}: {v}")
-    print(f"  -> Solution: {retrieved.solution}  (similarity: {sim:.3f})")
+    print(f"  -> Solution: {result['retrieved_solution']}  (similarity: {result['similarity']:.3f})")
+    if client is not None:
+        print(f"  (answered by warm session in {client.last_server_ms:.3f} ms)")
 
 
-def test_energy(query):
+def test_energy(query, client=None):
     print("\n" + "=" * 60)
     print("ENERGY REGRESSION QUERY")
     print("=" * 60)
@@ -106,29 +103,25 @@ def test_energy(query):
     for k, v in query.features.items():
         print(f"    {k}: {v:.2f}")
 
-    train, _ = load_energy_system_data(random_seed=42)
-    sys = EnergyCBRSystem()
-    sys.set_case_base(train)
-    ecb = sys.case_base.copy()
-
-    # Baseline
-    sys.set_baseline_mode()
-    r_base = sys.run_query(ecb, query, tuned=False, adapt_fn=None, learning=False)
-    print(f"\n  [Baseline]       Predicted heating load: {r_base[0]:.2f} kWh")
+    if client is not None:
+        result = client.energy_query(query.features)
+    else:
+        train, _ = load_energy_system_data(random_seed=42)
+        sys = EnergyCBRSystem()
+        sys.set_case_base(train)
+        result = answer_energy_query(sys, query.features)
 
-    # Tuned + Adaptation
-    sys.set_tuned_mode()
-    def adapt_fn(retrieved, q, s):
-        return sys.adapt_regression(retrieved, q, use_multiple_rules=True)
-    r_adapt = sys.run_query(ecb, query, tuned=True, adapt_fn=adapt_fn, learning=False)
-    print(f"  [Tuned+Adapt]    Predicted heating load: {r_adapt[0]:.2f} kWh")
+    print(f"\n  [Baseline]       Predicted heating load: {result['baseline']:.2f} kWh")
+    print(f"  [Tuned+Adapt]    Predicted heating load: {result['tuned_adapt']:.2f} kWh")
 
     # Show most similar case
-    retrieved, sim = sys.retrieve_most_similar(query, use_weights=True)
     print(f"\n  Most similar case in CB:")
-    print(f"  -> Heating load: {retrieved.solution:.2f} kWh  (similarity: {sim:.4f})")
+    print(f"  -> Heating load: {result['retrieved_solution']:.2f} kWh  (similarity: {result['similarity']:.4f})")
+    if client is not None:
+        print(f"  (answered by warm session in {client.last_server_ms:.3f} ms)")
 
 
 if __name__ == '__main__':
-    test_car(my_car_query)
-    test_energy(my_energy_query)
+    session = SessionClient.connect()
+    test_car(my_car_query, session)
+    test_energy(my_energy_query, session)
@@ -0,0 +1,395 @@
+"""
+Warm Session Module
+Keeps fitted CBR systems alive in a background process so that
+interactive.py and query_test.py answer queries without reloading data:
+- CBRSession: loads the data once, fits both systems and runs the 6
+  conditions once; keeps the systems, their caches and retained cases
+- SessionServer: serves a CBRSession over a local TCP socket (127.0.0.1),
+  one JSON request/response per line; clients may stay connected, and
+  requests from all clients are executed one at a time
+- SessionClient: attaches to a running server
+- Each connection first presents a shared secret: $CBR_SESSION_TOKEN, or
+  the token file (~/.cbr_session_token, mode 0600) that the server creates
+  on first start, so other local users cannot drive the session
+
+Two system states are kept per domain:
+- 'fresh': fitted on the training split only (what query_test.py uses)
+- 'evaluated': after the 6 conditions ran (what interactive.py uses)
+
+Usage:
+    python session.py start     # launch in the background, wait until ready
+    python session.py status
+    python session.py stop
+    python session.py serve     # run in the foreground
+"""
+
+from typing import Dict, Optional, Any, Tuple
+import argparse
+import hmac
+import json
+import os
+import secrets
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from data_loader import Case, load_car_system_data, load_energy_system_data
+from car_cbr import CarCBRSystem
+from energy_cbr import EnergyCBRSystem
+from interactive import evaluate_conditions, answer_car_query, answer_energy_query
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = int(os.environ.get('CBR_SESSION_PORT', 47911))
+TOKEN_ENV = 'CBR_SESSION_TOKEN'
+TOKEN_FILE = os.environ.get('CBR_SESSION_TOKEN_FILE',
+                            os.path.join(os.path.expanduser('~'), '.cbr_session_token'))
+STATES = ('fresh', 'evaluated')
+
+
+def session_token(create: bool = False) -> Optional[str]:
+    """
+    Shared secret of the session: $CBR_SESSION_TOKEN, else the token file.
+
+    Args:
+        create: Write a new random token file (mode 0600) if there is none
+
+    Returns:
+        Token, or None if there is none and create is False
+
+    Raises:
+        PermissionError: If the token file is readable by other users
+    """
+    token = os.environ.get(TOKEN_ENV)
+    if token:
+        return token
+    if create and not os.path.exists(TOKEN_FILE):
+        try:
+            fd = os.open(TOKEN_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass  # created by a concurrent start
+        else:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+    try:
+        if os.name == 'posix' and os.stat(TOKEN_FILE).st_mode & 0o077:
+            raise PermissionError(f"{TOKEN_FILE} must only be readable by its owner (chmod 600)")
+        with open(TOKEN_FILE) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class CBRSession:
+    """Fitted systems and cached evaluation results for both domains."""
+
+    def __init__(self, random_seed: int = 42):
+        """
+        Load both datasets, fit the systems and run the 6 conditions.
+
+        Args:
+            random_seed: Train/test split seed
+        """
+        car_train, car_test = load_car_system_data(random_seed=random_seed)
+        energy_train, energy_test = load_energy_system_data(random_seed=random_seed)
+
+        car_sys = CarCBRSystem()
+        car_sys.set_case_base(car_train, verbose=False)
+        en_sys = EnergyCBRSystem()
+        en_sys.set_case_base(energy_train, verbose=False)
+        car_sys.keep_contributions = en_sys.keep_contributions = True
+
+        self.metrics, evaluated_car, evaluated_energy = evaluate_conditions(
+            car_train, car_test, energy_train, energy_test)
+        self.systems = {
+            'fresh': {'car': car_sys, 'energy': en_sys},
+            'evaluated': {'car': evaluated_car, 'energy': evaluated_energy},
+        }
+        self.started = time.time()
+        self.queries = 0
+
+    def _system(self, domain: str, state: str):
+        if state not in STATES:
+            raise ValueError(f"Unknown state '{state}' (choose from {STATES})")
+        if domain not in ('car', 'energy'):
+            raise ValueError(f"Unknown domain '{domain}'")
+        return self.systems[state][domain]
+
+    def car_query(self, features: Dict[str, str], state: str = 'fresh') -> Dict[str, Any]:
+        self.queries += 1
+        return answer_car_query(self._system('car', state), features)
+
+    def energy_query(self, features: Dict[str, float], state: str = 'fresh') -> Dict[str, Any]:
+        self.queries += 1
+        return answer_energy_query(self._system('energy', state),
+                                   {name: float(value) for name, value in features.items()})
+
+    def retain(self, domain: str, features: Dict[str, Any], solution: Any,
+               state: str = 'fresh') -> int:
+        """
+        Add a solved case to a session system (kept until the session stops).
+
+        Returns:
+            New case base size
+        """
+        system = self._system(domain, state)
+        if domain == 'energy':
+            features = {name: float(value) for name, value in features.items()}
+            solution = float(solution)
+        system.add_case(Case(features=features, solution=solution))
+        return len(system.case_base)
+
+    def evaluation(self) -> Dict[str, Any]:
+        return self.metrics
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'uptime_s': time.time() - self.started,
+            'queries': self.queries,
+            'case_base_sizes': {state: {domain: len(system.case_base)
+                                        for domain, system in systems.items()}
+                                for state, systems in self.systems.items()},
+        }
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Handles newline-delimited JSON requests on one connection."""
+
+    def _respond(self, response: Dict[str, Any]):
+        self.wfile.write((json.dumps(response) + '\n').encode())
+        self.wfile.flush()
+
+    def _authenticate(self) -> bool:
+        """The first request must be {'op': 'auth', 'token': <session token>}."""
+        try:
+            request = json.loads(self.rfile.readline())
+            token = request.get('token') if request.get('op') == 'auth' else None
+        except (ValueError, AttributeError):
+            token = None
+        if not isinstance(token, str) or not hmac.compare_digest(token.encode(),
+                                                                 self.server.token.encode()):
+            self._respond({'ok': False, 'error': "PermissionError: invalid session token"})
+            return False
+        self._respond({'ok': True, 'result': 'authenticated', 'server_ms': 0.0})
+        return True
+
+    def handle(self):
+        session = self.server.session
+        if not self._authenticate():
+            return
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                op = request.pop('op')
+                start = time.perf_counter()
+                if op == 'ping':
+                    result = 'pong'
+                elif op == 'shutdown':
+                    result = 'bye'
+                    self.server.stopping = True
+                elif op in ('car_query', 'energy_query', 'retain', 'evaluation', 'status'):
+                    with self.server.lock:
+                        result = getattr(session, op)(**request)
+                else:
+                    raise ValueError(f"Unknown op '{op}'")
+                response = {'ok': True, 'result': result,
+                            'server_ms': (time.perf_counter() - start) * 1000}
+            except Exception as e:  # report errors to the client, keep serving
+                response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            self._respond(response)
+            if self.server.stopping:
+                self.server.shutdown()
+                return
+
+
+class SessionServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """Local server around one CBRSession (one thread per client, one request at a time)."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, session: CBRSession, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 token: Optional[str] = None):
+        """
+        Args:
+            session: Session to serve
+            host: Interface to listen on
+            port: TCP port
+            token: Secret clients must present (default: session_token(create=True))
+        """
+        self.token = token or session_token(create=True)
+        if not self.token:
+            raise PermissionError(f"No session token (set {TOKEN_ENV} or create {TOKEN_FILE})")
+        self.session = session
+        self.lock = threading.Lock()
+        self.stopping = False
+        super().__init__((host, port), _RequestHandler)
+
+    def serve(self):
+        """Serve until a shutdown request arrives."""
+        self.serve_forever()
+        self.server_close()
+
+
+class SessionClient:
+    """Connection to a running SessionServer."""
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = 30.0,
+                 token: Optional[str] = None):
+        """
+        Connect and authenticate.
+
+        Raises:
+            PermissionError: If there is no token or the server rejects it
+        """
+        token = token or session_token()
+        if not token:
+            raise PermissionError(f"No session token (set {TOKEN_ENV} or create {TOKEN_FILE})")
+        self.address = (host, port)
+        self._socket = socket.create_connection(self.address, timeout=timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._socket.makefile('rwb')
+        self.last_server_ms = 0.0
+        try:
+            self.request('auth', token=token)
+        except RuntimeError as e:
+            self.close()
+            raise PermissionError(str(e)) from None
+
+    @classmethod
+    def connect(cls, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> Optional['SessionClient']:
+        """
+        Attach to a running session, or return None if none is listening.
+
+        Raises:
+            PermissionError: If a session is listening but the token does not match
+        """
+        try:
+            client = cls(host, port)
+            client.request('ping')
+            return client
+        except PermissionError:
+            if session_token() is None:
+                return None  # no token yet: no session has been started
+            raise
+        except OSError:
+            return None
+
+    def request(self, op: str, **payload) -> Any:
+        """
+        Send one request and return its result.
+
+        Raises:
+            RuntimeError: If the server reports an error
+            ConnectionError: If the server closed the connection
+        """
+        self._file.write((json.dumps({'op': op, **payload}) + '\n').encode())
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Session server closed the connection")
+        response = json.loads(line)
+        if not response['ok']:
+            raise RuntimeError(response['error'])
+        self.last_server_ms = response['server_ms']
+        return response['result']
+
+    def car_query(self, features: Dict[str, str], state: str = 'fresh') -> Dict[str, Any]:
+        return self.request('car_query', features=features, state=state)
+
+    def energy_query(self, features: Dict[str, float], state: str = 'fresh') -> Dict[str, Any]:
+        return self.request('energy_query', features=features, state=state)
+
+    def retain(self, domain: str, features: Dict[str, Any], solution: Any,
+               state: str = 'fresh') -> int:
+        return self.request('retain', domain=domain, features=features,
+                            solution=solution, state=state)
+
+    def evaluation(self) -> Dict[str, Any]:
+        """Metrics of the 6 conditions (lists come back for (MAE, RMSE) pairs)."""
+        return {key: tuple(value) if isinstance(value, list) else value
+                for key, value in self.request('evaluation').items()}
+
+    def status(self) -> Dict[str, Any]:
+        return self.request('status')
+
+    def shutdown(self):
+        self.request('shutdown')
+        self.close()
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+
+def start_background(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                     timeout: float = 120.0) -> Tuple[bool, float]:
+    """
+    Launch 'session.py serve' as a detached process and wait until it answers.
+
+    Returns:
+        Tuple of (ready, seconds waited)
+    """
+    start = time.perf_counter()
+    session_token(create=True)  # the server and this process share the token file
+    kwargs = {'start_new_session': True} if os.name == 'posix' else \
+        {'creationflags': subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP}
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), 'serve',
+                      '--host', host, '--port', str(port)],
+                     cwd=os.path.dirname(os.path.abspath(__file__)),
+                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     stdin=subprocess.DEVNULL, **kwargs)
+    while time.perf_counter() - start < timeout:
+        client = SessionClient.connect(host, port)
+        if client is not None:
+            client.close()
+            return True, time.perf_counter() - start
+        time.sleep(0.1)
+    return False, time.perf_counter() - start
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Warm CBR session server")
+    parser.add_argument('command', choices=['start', 'stop', 'status', 'serve'])
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+
+    try:
+        client = SessionClient.connect(args.host, args.port)
+    except PermissionError as e:
+        print(f"Cannot attach to the session: {e}")
+        return 1
+    if args.command == 'serve':
+        if client is not None:
+            print(f"A session is already running on {args.host}:{args.port}")
+            return 1
+        server = SessionServer(CBRSession(), args.host, args.port)
+        print(f"Session ready on {args.host}:{args.port}")
+        server.serve()
+    elif args.command == 'start':
+        if client is not None:
+            print(f"Session already running on {args.host}:{args.port}")
+            return 0
+        ready, waited = start_background(args.host, args.port)
+        print(f"Session {'ready' if ready else 'did not start'} on {args.host}:{args.port} "
+              f"({waited:.1f}s)")
+        return 0 if ready else 1
+    elif args.command == 'status':
+        if client is None:
+            print("No session running")
+            return 1
+        print(json.dumps(client.status(), indent=2))
+    elif args.command == 'stop':
+        if client is None:
+            print("No session running")
+            return 1
+        client.shutdown()
+        print("Session stopped")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,405 @@
+"""
+Sharded Retrieval Module
+Spreads a case base over worker processes and merges their answers:
+- Each worker owns a shard of the cases and answers top-k queries for it
+- ShardCoordinator fans queries out to all workers and merges the top-k
+  lists; retained cases go to the shard chosen by a hash of their features
+- Workers run as local processes (multiprocessing pipes) or as standalone
+  servers reachable over TCP (python sharding.py worker), e.g. on other hosts
+
+Every case carries a global sequence number (its position in the unsharded
+case base), and ties are merged in that order, so results are identical to
+a single system scanning the whole case base.
+
+Usage:
+    python sharding.py demo --domain energy --shards 4
+    CBR_SHARD_AUTHKEY=secret python sharding.py worker --port 47920
+"""
+
+from typing import List, Tuple, Any, Optional, Callable
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import zlib
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener, Connection
+import numpy as np
+from data_loader import Case
+from cbr_system import CBRSystem, top_k_indices
+
+
+DEFAULT_WORKER_PORT = 47920
+# Environment variable holding the shared secret of TCP workers
+AUTHKEY_ENV = 'CBR_SHARD_AUTHKEY'
+
+
+def shard_for(case: Case, n_shards: int) -> int:
+    """Shard of a case: a stable hash of its features (same in every process)."""
+    key = repr(sorted((name, repr(value)) for name, value in case.features.items()))
+    return zlib.crc32(key.encode()) % n_shards
+
+
+def _serve_shard(conn: Connection):
+    """
+    Answer coordinator requests on one connection until 'stop'.
+
+    Requests are tuples (op, *args):
+        ('load', system_class, feature_types, precision, ids, cases)
+        ('add', ids, cases)
+        ('top_k', queries, k, weights)   -> [(scores, ids, cases)] per query
+        ('size',)                        -> number of cases
+        ('stop',)
+    """
+    system: Optional[CBRSystem] = None
+    ids = np.zeros(0, dtype=np.int64)
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        op = request[0]
+        try:
+            if op == 'load':
+                system_class, feature_types, precision, ids, cases = request[1:]
+                system = system_class()
+                system.feature_types = feature_types
+                system.set_index_precision(precision)
+                system.set_case_base(cases, verbose=False)
+                ids = np.asarray(ids, dtype=np.int64)
+                result = len(cases)
+            elif op == 'add':
+                new_ids, cases = request[1:]
+                system.add_cases(cases)
+                ids = np.concatenate([ids, np.asarray(new_ids, dtype=np.int64)])
+                result = len(ids)
+            elif op == 'top_k':
+                queries, k, weights = request[1:]
+                result = []
+                if len(ids):
+                    system.feature_weights = weights or {}
+                    block = system.score_case_base_batch(queries, use_weights=weights is not None)
+                    cases = system.case_base
+                    for scores in block:
+                        order = top_k_indices(scores, k)
+                        result.append((scores[order], ids[order], [cases[i] for i in order.tolist()]))
+                else:
+                    result = [(np.zeros(0), ids, []) for _ in queries]
+            elif op == 'size':
+                result = len(ids)
+            elif op == 'stop':
+                conn.send(('ok', None))
+                return
+            else:
+                raise ValueError(f"Unknown op '{op}'")
+            conn.send(('ok', result))
+        except Exception as e:  # report to the coordinator, keep serving
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+
+
+def _check_authkey(authkey: bytes) -> bytes:
+    """Reject a missing or empty secret (connections exchange pickles)."""
+    if not isinstance(authkey, bytes) or not authkey:
+        raise ValueError("Shard workers need a non-empty authkey (bytes)")
+    return authkey
+
+
+def serve_worker(authkey: bytes, host: str = '127.0.0.1', port: int = DEFAULT_WORKER_PORT):
+    """
+    Run a standalone shard worker: accept coordinators one after another over TCP.
+
+    Requests are pickles, so only coordinators holding the shared secret
+    are served; there is no default secret.
+
+    Args:
+        authkey: Shared secret the coordinator must present
+        host: Interface to listen on
+        port: TCP port
+    """
+    authkey = _check_authkey(authkey)
+    with Listener((host, port), authkey=authkey) as listener:
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, OSError):
+                continue  # wrong secret or dropped handshake: keep serving
+            with conn:
+                _serve_shard(conn)
+
+
+class ShardCoordinator:
+    """
+    Retrieval over a case base split across shard workers.
+
+    A template system (fitted as usual, e.g. with set_tuned_mode) provides
+    the system class, feature types and weights; its case base is what gets
+    distributed. Workers only score their shard, so adaptation that needs
+    the whole case base (the rule-based adapt_* methods) is not available;
+    knn_predict and adapt_knn are.
+    """
+
+    def __init__(self, system: CBRSystem, connections: List[Connection],
+                 processes: Optional[List[multiprocessing.Process]] = None):
+        """
+        Load the template system's case base onto already connected workers.
+
+        Prefer start_local or connect.
+
+        Args:
+            system: Template system (class, feature types, weights, case base)
+            connections: One connection per worker
+            processes: Local worker processes to stop on close
+        """
+        if not connections:
+            raise ValueError("At least one shard is required")
+        self.system = system
+        self.connections = connections
+        self.processes = processes or []
+        self._next_id = 0
+        # (query, use_weights) of solve's last retrieval (see adapt_knn)
+        self._last_retrieval = None
+        cases = list(system.case_base)
+        routed = self._route(cases, range(len(cases)))
+        self._broadcast([('load', type(system), system.feature_types, system.index_precision,
+                          ids, shard_cases) for ids, shard_cases in routed])
+        self._next_id = len(cases)
+
+    @classmethod
+    def start_local(cls, system: CBRSystem, n_shards: int = 4) -> 'ShardCoordinator':
+        """
+        Start n_shards worker processes on this machine and distribute the case base.
+
+        Args:
+            system: Template system
+            n_shards: Number of worker processes
+
+        Returns:
+            Coordinator (close() it to stop the workers)
+        """
+        connections, processes = [], []
+        for _ in range(n_shards):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve_shard, args=(child,), daemon=True)
+            process.start()
+            child.close()
+            connections.append(parent)
+            processes.append(process)
+        return cls(system, connections, processes)
+
+    @classmethod
+    def connect(cls, system: CBRSystem, addresses: List[Tuple[str, int]],
+                authkey: bytes) -> 'ShardCoordinator':
+        """
+        Attach to standalone workers (serve_worker) and distribute the case base.
+
+        Args:
+            system: Template system
+            addresses: (host, port) of each worker
+            authkey: Shared secret of the workers
+        """
+        authkey = _check_authkey(authkey)
+        return cls(system, [Client(address, authkey=authkey) for address in addresses])
+
+    def _route(self, cases: List[Case], ids) -> List[Tuple[List[int], List[Case]]]:
+        """Split cases (with their ids) by shard, keeping their order."""
+        routed = [([], []) for _ in self.connections]
+        for case_id, case in zip(ids, cases):
+            shard_ids, shard_cases = routed[shard_for(case, len(self.connections))]
+            shard_ids.append(case_id)
+            shard_cases.append(case)
+        return routed
+
+    def _broadcast(self, requests: List[tuple]) -> List[Any]:
+        """Send one request per shard, then collect the replies (shards work in parallel)."""
+        for conn, request in zip(self.connections, requests):
+            conn.send(request)
+        replies = [conn.recv() for conn in self.connections]
+        for status, result in replies:
+            if status != 'ok':
+                raise RuntimeError(f"Shard worker failed: {result}")
+        return [result for _, result in replies]
+
+    def __len__(self) -> int:
+        return self._next_id
+
+    def shard_sizes(self) -> List[int]:
+        """Number of cases held by each shard."""
+        return self._broadcast([('size',)] * len(self.connections))
+
+    def add_case(self, case: Case):
+        """Retain a case on its hash-routed shard."""
+        self.add_cases([case])
+
+    def add_cases(self, cases: List[Case]):
+        """Retain several cases (one message per shard)."""
+        ids = range(self._next_id, self._next_id + len(cases))
+        routed = self._route(cases, ids)
+        for conn, (shard_ids, shard_cases) in zip(self.connections, routed):
+            conn.send(('add', shard_ids, shard_cases))
+        for conn in self.connections:
+            status, result = conn.recv()
+            if status != 'ok':
+                raise RuntimeError(f"Shard worker failed: {result}")
+        self._next_id += len(cases)
+
+    def retrieve_top_k_batch(self, queries: List[Case], k: int = 3,
+                             use_weights: bool = True) -> List[List[Tuple[Case, float]]]:
+        """
+        Top-k cases of each query across all shards.
+
+        Args:
+            queries: Query cases (same feature order)
+            k: Number of cases per query
+            use_weights: Whether to use the template's weights
+
+        Returns:
+            Per query, (case, similarity) tuples sorted by similarity, ties in
+            case base order (as CBRSystem.retrieve_top_k)
+        """
+        weights = (self.system.feature_weights or {}) if use_weights else None
+        per_shard = self._broadcast([('top_k', queries, k, weights)] * len(self.connections))
+        merged = []
+        for q in range(len(queries)):
+            scores = np.concatenate([shard[q][0] for shard in per_shard])
+            ids = np.concatenate([shard[q][1] for shard in per_shard])
+            cases = [case for shard in per_shard for case in shard[q][2]]
+            order = np.lexsort((ids, -scores))[:k]
+            merged.append([(cases[i], float(scores[i])) for i in order.tolist()])
+        return merged
+
+    def retrieve_top_k(self, query: Case, k: int = 3,
+                       use_weights: bool = True) -> List[Tuple[Case, float]]:
+        """Top-k cases of one query across all shards."""
+        return self.retrieve_top_k_batch([query], k, use_weights)[0]
+
+    def retrieve_most_similar(self, query: Case, use_weights: bool = True) -> Tuple[Case, float]:
+        """Most similar case across all shards (ties: earliest in case base order)."""
+        top = self.retrieve_top_k(query, 1, use_weights)
+        if not top:
+            raise ValueError("Case base is empty")
+        return top[0]
+
+    def knn_predict(self, query: Case, k: Optional[int] = None,
+                    use_weights: bool = True) -> Any:
+        """k-NN prediction (as CBRSystem.knn_predict) from the merged neighbours."""
+        k = self.system.knn_k if k is None else k
+        neighbours = self.retrieve_top_k(query, k, use_weights)
+        return self.system._combine_neighbours([case.solution for case, _ in neighbours],
+                                               np.array([sim for _, sim in neighbours]))
+
+    def adapt_knn(self, retrieved_case: Case, query: Case,
+                  coordinator: Optional['ShardCoordinator'] = None, *, k: Optional[int] = None,
+                  use_weights: Optional[bool] = None) -> Any:
+        """
+        k-NN prediction as an adapt_fn(retrieved_case, query, coordinator) step (first and third unused).
+
+        use_weights defaults to the weighting of solve's retrieval of this
+        query (its tuned), else True.
+        """
+        if use_weights is None:
+            last = self._last_retrieval
+            use_weights = last[1] if last is not None and last[0] is query else True
+        return self.knn_predict(query, k=k, use_weights=use_weights)
+
+    def solve(self, query: Case, tuned: bool = False,
+              adapt_fn: Optional[Callable] = None, learning: bool = True) -> Any:
+        """
+        Run the CBR cycle for a query against the sharded case base.
+
+        Same steps as CBRSystem.run_query: retrieve, adapt with
+        adapt_fn(retrieved_case, query, coordinator) if given, and retain
+        the solved query on its shard when learning is enabled.
+
+        Returns:
+            Solution
+        """
+        self._last_retrieval = (query, tuned)
+        retrieved_case, _ = self.retrieve_most_similar(query, use_weights=tuned)
+        solution = adapt_fn(retrieved_case, query, self) if adapt_fn else retrieved_case.solution
+        if learning:
+            self.add_case(Case(features=query.features, solution=solution))
+        return solution
+
+    def close(self):
+        """Stop local workers and close all connections."""
+        for conn in self.connections:
+            try:
+                conn.send(('stop',))
+                conn.recv()
+            except (OSError, EOFError):
+                pass
+            conn.close()
+        for process in self.processes:
+            process.join(timeout=5)
+        self.connections = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_demo(domain: str, n_shards: int):
+    """Compare sharded retrieval with a single system on the default split."""
+    from data_loader import load_car_system_data, load_energy_system_data
+    from car_cbr import CarCBRSystem
+    from energy_cbr import EnergyCBRSystem
+
+    if domain == 'car':
+        train, test = load_car_system_data(random_seed=42)
+        make = CarCBRSystem
+    else:
+        train, test = load_energy_system_data(random_seed=42)
+        make = EnergyCBRSystem
+    single, template = make(), make()
+    for system in (single, template):
+        system.set_case_base(train, verbose=False)
+        system.set_tuned_mode()
+
+    with ShardCoordinator.start_local(template, n_shards) as coordinator:
+        print(f"{domain}: {len(coordinator)} cases on {n_shards} shards {coordinator.shard_sizes()}")
+        start = time.perf_counter()
+        cb = single.case_base
+        expected = []
+        for query in test:
+            solution, cb = single.run_query(cb, query, tuned=True,
+                                            adapt_fn=lambda r, q, s: s.adapt_knn(r, q))
+            expected.append(solution)
+        single_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        sharded = [coordinator.solve(query, tuned=True, adapt_fn=lambda r, q, s: s.adapt_knn(r, q))
+                   for query in test]
+        sharded_s = time.perf_counter() - start
+
+        same = sum(a == b for a, b in zip(expected, sharded))
+        print(f"  k-NN + learning over {len(test)} queries: {same}/{len(test)} identical predictions")
+        print(f"  single system {single_s * 1000:.1f} ms, sharded {sharded_s * 1000:.1f} ms "
+              f"({len(coordinator)} cases after retention, shards {coordinator.shard_sizes()})")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Sharded CBR retrieval")
+    parser.add_argument('command', choices=['demo', 'worker'])
+    parser.add_argument('--domain', choices=['car', 'energy'], default='energy')
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_WORKER_PORT)
+    parser.add_argument('--authkey', default=os.environ.get(AUTHKEY_ENV),
+                        help=f"Worker secret (default: ${AUTHKEY_ENV}; required for worker)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'worker':
+        if not args.authkey:
+            parser.error(f"worker needs --authkey or ${AUTHKEY_ENV}")
+        print(f"Shard worker listening on {args.host}:{args.port}")
+        serve_worker(args.authkey.encode(), args.host, args.port)
+    else:
+        run_demo(args.domain, args.shards)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
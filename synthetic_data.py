@@ -0,0 +1,265 @@
+"""
+Synthetic Data Module
+Generates arbitrarily large, reproducible (seeded) case bases and query
+streams matching the car.names and ENB2012 schemas:
+- Car: feature combinations are sampled uniformly over the attribute space
+  (as in car.data) and labelled by the original concept table, so the class
+  distribution matches car.names; optional label noise moves a class by one level
+- Energy: building designs are sampled from the ENB2012 factorial design and
+  targets (Y1, Y2) are the design's real loads with multiplicative noise
+
+Everything is generated in fixed-size chunks, so writing 10M cases to disk
+needs constant memory.
+
+Usage:
+    python synthetic_data.py car --cases 10000000 --output car_10M.data
+    python synthetic_data.py energy --cases 1000000 --output enb_1M.csv --queries 10000 --query-output enb_queries.csv
+"""
+
+from typing import List, Dict, Iterator, Optional
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+from data_loader import Case, DataLoader
+
+
+CAR_FEATURES = ['buying', 'maint', 'doors', 'persons', 'lug_boot', 'safety']
+CAR_VALUES = {
+    'buying': ['vhigh', 'high', 'med', 'low'],
+    'maint': ['vhigh', 'high', 'med', 'low'],
+    'doors': ['2', '3', '4', '5more'],
+    'persons': ['2', '4', 'more'],
+    'lug_boot': ['small', 'med', 'big'],
+    'safety': ['low', 'med', 'high'],
+}
+CAR_CLASSES = ['unacc', 'acc', 'good', 'vgood']
+
+ENERGY_COLUMNS = ['X1', 'X2', 'X3', 'X4', 'X5', 'X6', 'X7', 'X8']
+ENERGY_TARGETS = ['Y1', 'Y2']
+
+# Rows per generated chunk (bounds memory when streaming to disk)
+CHUNK_SIZE = 100_000
+
+# Seed offset so a query stream never repeats its case base's draws
+QUERY_SEED_OFFSET = 1_000_003
+
+
+class CarGenerator:
+    """Samples car cases from the car.data concept table."""
+
+    def __init__(self, filepath: str = 'car.data', label_noise: float = 0.0):
+        """
+        Args:
+            filepath: car.data file used as the concept table
+            label_noise: Probability of moving a label one class up or down
+        """
+        data = pd.read_csv(filepath, header=None, names=CAR_FEATURES + ['class'], dtype=str)
+        self.label_noise = label_noise
+
+        # Every attribute combination, with its class from the table
+        sizes = [len(CAR_VALUES[name]) for name in CAR_FEATURES]
+        self.n_combinations = int(np.prod(sizes))
+        self.classes = np.zeros(self.n_combinations, dtype=np.int64)
+        self.prefixes = np.empty(self.n_combinations, dtype=object)
+        self.features: List[Dict[str, str]] = [None] * self.n_combinations
+        for row in data.itertuples(index=False):
+            values = [getattr(row, name) for name in CAR_FEATURES]
+            code = 0
+            for name, value in zip(CAR_FEATURES, values):
+                code = code * len(CAR_VALUES[name]) + CAR_VALUES[name].index(value)
+            self.classes[code] = CAR_CLASSES.index(row[-1])
+            self.prefixes[code] = ','.join(values)
+            self.features[code] = dict(zip(CAR_FEATURES, values))
+        if any(f is None for f in self.features):
+            raise ValueError(f"{filepath} does not cover the full attribute space")
+
+    def sample(self, rng: np.random.Generator, n: int):
+        """Draw n (combination, class) index pairs."""
+        combos = rng.integers(0, self.n_combinations, size=n)
+        labels = self.classes[combos].copy()
+        if self.label_noise > 0:
+            flip = rng.random(n) < self.label_noise
+            step = rng.choice([-1, 1], size=n)
+            labels = np.where(flip, np.clip(labels + step, 0, len(CAR_CLASSES) - 1), labels)
+        return combos, labels
+
+    def lines(self, combos: np.ndarray, labels: np.ndarray) -> str:
+        """Render a chunk in car.data layout."""
+        class_names = np.array(CAR_CLASSES, dtype=object)
+        return '\n'.join(self.prefixes[combos] + ',' + class_names[labels]) + '\n'
+
+    def cases(self, combos: np.ndarray, labels: np.ndarray) -> Iterator[Case]:
+        """Build Case objects (feature dicts are shared per combination)."""
+        for combo, label in zip(combos.tolist(), labels.tolist()):
+            yield Case(features=self.features[combo], solution=CAR_CLASSES[label])
+
+
+class EnergyGenerator:
+    """Samples buildings from the ENB2012 factorial design."""
+
+    def __init__(self, filepath: str = 'ENB2012_data.xlsx', noise: float = 0.02):
+        """
+        Args:
+            filepath: ENB2012 file providing designs and real loads
+            noise: Relative standard deviation of the multiplicative target noise
+        """
+        data = DataLoader.read_energy_table(filepath)
+        self.designs = data[ENERGY_COLUMNS].to_numpy(dtype=float)
+        self.targets = data[ENERGY_TARGETS].to_numpy(dtype=float)
+        self.noise = noise
+
+        # Normalized feature dicts, using the same z-score as load_energy_cases
+        real_cases = DataLoader.energy_cases_from_table(data)
+        names = list(real_cases[0].features.keys())
+        normalized, _ = DataLoader.normalize_features(real_cases, names, method='zscore')
+        self.features = [case.features for case in normalized]
+
+    def sample(self, rng: np.random.Generator, n: int):
+        """Draw n (design index, targets) pairs."""
+        designs = rng.integers(0, len(self.designs), size=n)
+        targets = self.targets[designs]
+        if self.noise > 0:
+            targets = targets * (1.0 + self.noise * rng.standard_normal(targets.shape))
+        return designs, np.maximum(targets, 0.0)
+
+    def lines(self, designs: np.ndarray, targets: np.ndarray) -> str:
+        """Render a chunk in ENB2012 column layout (CSV, no header)."""
+        rows = np.column_stack([self.designs[designs], np.round(targets, 2)])
+        return '\n'.join(','.join(f'{v:g}' for v in row) for row in rows.tolist()) + '\n'
+
+    def cases(self, designs: np.ndarray, targets: np.ndarray) -> Iterator[Case]:
+        """Build Case objects with normalized features and Y1 as solution."""
+        for design, heating in zip(designs.tolist(), targets[:, 0].tolist()):
+            yield Case(features=self.features[design], solution=heating)
+
+
+def make_generator(domain: str, **kwargs):
+    """Create the generator for 'car' or 'energy'."""
+    if domain == 'car':
+        return CarGenerator(**kwargs)
+    if domain == 'energy':
+        return EnergyGenerator(**kwargs)
+    raise ValueError(f"Unknown domain: {domain}")
+
+
+def _chunks(generator, n: int, seed: int, chunk_size: int):
+    """Yield sampled chunks; the same seed always gives the same stream."""
+    rng = np.random.default_rng(seed)
+    remaining = n
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        yield generator.sample(rng, size)
+        remaining -= size
+
+
+def generate_cases(domain: str, n: int, seed: int = 42, chunk_size: int = CHUNK_SIZE,
+                   generator=None) -> Iterator[Case]:
+    """
+    Stream synthetic cases.
+
+    Args:
+        domain: 'car' or 'energy'
+        n: Number of cases
+        seed: Random seed
+        chunk_size: Cases sampled per chunk
+        generator: Optional pre-built CarGenerator/EnergyGenerator
+
+    Yields:
+        Case objects (energy features are z-score normalized like load_energy_cases)
+    """
+    generator = generator or make_generator(domain)
+    for chunk in _chunks(generator, n, seed, chunk_size):
+        yield from generator.cases(*chunk)
+
+
+def generate_queries(domain: str, n: int, seed: int = 42, chunk_size: int = CHUNK_SIZE,
+                     generator=None) -> Iterator[Case]:
+    """
+    Stream synthetic queries (with ground-truth solutions).
+
+    Uses a stream independent of generate_cases for the same seed.
+    """
+    return generate_cases(domain, n, seed + QUERY_SEED_OFFSET, chunk_size, generator)
+
+
+def write_cases(domain: str, n: int, filepath: str, seed: int = 42,
+                chunk_size: int = CHUNK_SIZE, generator=None) -> int:
+    """
+    Stream synthetic cases to disk in the domain's existing format.
+
+    Car cases use car.data layout. Energy cases use the ENB2012 columns
+    (X1-X8, Y1, Y2) as CSV with a header row, or .xlsx (up to the Excel row limit).
+
+    Returns:
+        Number of rows written
+    """
+    generator = generator or make_generator(domain)
+    if domain == 'energy' and filepath.endswith('.xlsx'):
+        return _write_energy_xlsx(generator, n, filepath, seed, chunk_size)
+
+    with open(filepath, 'w') as f:
+        if domain == 'energy':
+            f.write(','.join(ENERGY_COLUMNS + ENERGY_TARGETS) + '\n')
+        for chunk in _chunks(generator, n, seed, chunk_size):
+            f.write(generator.lines(*chunk))
+    return n
+
+
+def _write_energy_xlsx(generator: EnergyGenerator, n: int, filepath: str,
+                       seed: int, chunk_size: int) -> int:
+    """Stream energy rows into an Excel workbook (write-only mode)."""
+    from openpyxl import Workbook
+
+    if n > 1_048_575:
+        raise ValueError("Excel sheets hold at most 1,048,575 data rows; write .csv instead")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(ENERGY_COLUMNS + ENERGY_TARGETS)
+    for designs, targets in _chunks(generator, n, seed, chunk_size):
+        for design, target in zip(designs.tolist(), np.round(targets, 2).tolist()):
+            sheet.append(generator.designs[design].tolist() + target)
+    workbook.save(filepath)
+    return n
+
+
+def write_queries(domain: str, n: int, filepath: str, seed: int = 42,
+                  chunk_size: int = CHUNK_SIZE, generator=None) -> int:
+    """Stream a synthetic query file (same layout as write_cases)."""
+    return write_cases(domain, n, filepath, seed + QUERY_SEED_OFFSET, chunk_size, generator)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate synthetic car/energy case bases")
+    parser.add_argument('domain', choices=['car', 'energy'])
+    parser.add_argument('--cases', type=int, required=True, help="Number of cases to write")
+    parser.add_argument('--output', required=True,
+                        help="Case base file (car.data layout, or ENB2012 .csv/.xlsx)")
+    parser.add_argument('--queries', type=int, default=0, help="Number of queries to write")
+    parser.add_argument('--query-output', help="Query stream file")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--label-noise', type=float, default=0.0,
+                        help="Car: probability of moving a label one class")
+    parser.add_argument('--noise', type=float, default=0.02,
+                        help="Energy: relative target noise")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.domain == 'car':
+        generator = CarGenerator(label_noise=args.label_noise)
+    else:
+        generator = EnergyGenerator(noise=args.noise)
+
+    write_cases(args.domain, args.cases, args.output, args.seed, args.chunk_size, generator)
+    print(f"Wrote {args.cases} {args.domain} cases to {args.output}")
+    if args.queries:
+        if not args.query_output:
+            parser.error("--queries requires --query-output")
+        write_queries(args.domain, args.queries, args.query_output, args.seed,
+                      args.chunk_size, generator)
+        print(f"Wrote {args.queries} {args.domain} queries to {args.query_output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
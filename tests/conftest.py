@@ -0,0 +1,35 @@
+"""
+Shared fixtures: the repository modules are flat and read their data files
+(car.data, ENB2012_data.xlsx) relative to the working directory, so tests
+run from the repository root.
+"""
+
+import os
+import sys
+from pathlib import Path
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from data_loader import load_car_system_data, load_energy_system_data  # noqa: E402
+
+
+@pytest.fixture(scope='session', autouse=True)
+def repo_root():
+    previous = os.getcwd()
+    os.chdir(ROOT)
+    yield ROOT
+    os.chdir(previous)
+
+
+@pytest.fixture(scope='session')
+def car_data(repo_root):
+    """(train, test) split of the car data."""
+    return load_car_system_data(random_seed=42)
+
+
+@pytest.fixture(scope='session')
+def energy_data(repo_root):
+    """(train, test) split of the normalized energy data."""
+    return load_energy_system_data(random_seed=42)
@@ -0,0 +1,51 @@
+"""Benchmark records and regression comparison."""
+
+import json
+import pytest
+from benchmark import benchmark_domain, compare_results, main
+
+
+def record(op, median_s, size=1000, weights='tuned', learning=None, domain='car'):
+    return {'domain': domain, 'op': op, 'size': size, 'weights': weights,
+            'learning': learning, 'median_s': median_s}
+
+
+def test_compare_flags_slowdowns_past_the_threshold():
+    baseline = {'results': [record('retrieve_top_k', 1.0), record('run_query', 1.0, learning=True),
+                            record('knn_predict', 0.0)]}
+    current = {'results': [record('retrieve_top_k', 1.05), record('run_query', 1.2, learning=True),
+                           record('run_query', 9.0, learning=False), record('knn_predict', 1.0)]}
+    comparisons = compare_results(current, baseline, threshold=0.10)
+    # Unmatched keys and zero baselines are skipped
+    assert [(c['key'][1], c['regression']) for c in comparisons] == \
+        [('retrieve_top_k', False), ('run_query', True)]
+    assert comparisons[1]['ratio'] == pytest.approx(1.2)
+
+
+@pytest.mark.parametrize('domain', ['car', 'energy'])
+def test_benchmark_domain_covers_every_op(domain, repo_root):
+    records = benchmark_domain(domain, [300], n_queries=3, repeats=1, max_seconds=1.0)
+    ops = {(r['op'], r['weights'], r['learning']) for r in records}
+    for weights in ('baseline', 'tuned'):
+        assert ('run_query', weights, False) in ops and ('run_query', weights, True) in ops
+        assert ('knn_predict_batch', weights, None) in ops
+    if domain == 'car':
+        assert ('retrieve_top_k_inverted', 'tuned', None) in ops
+    quality = 'accuracy' if domain == 'car' else 'mae'
+    assert all(quality in r for r in records if r['op'] == 'knn_predict')
+    assert all(r['size'] == 300 and r['calls'] >= 1 and r['min_s'] <= r['median_s'] <= r['max_s']
+               for r in records)
+
+
+def test_main_exits_non_zero_on_a_regression(tmp_path, repo_root):
+    output = tmp_path / 'bench.json'
+    args = ['--domains', 'car', '--sizes', '200', '--queries', '2', '--repeats', '1',
+            '--max-seconds', '0.5']
+    assert main(args + ['--output', str(output)]) == 0
+    saved = json.loads(output.read_text())
+    assert saved['environment']['python'] and saved['results']
+    for result in saved['results']:
+        result['median_s'] /= 1000.0
+    faster = tmp_path / 'faster.json'
+    faster.write_text(json.dumps(saved))
+    assert main(args + ['--compare', str(faster)]) == 1
@@ -0,0 +1,78 @@
+"""Streamed bulk scoring equals solve_batch over the same case base."""
+
+import csv
+import json
+import pytest
+from bulk_score import (CAR_FEATURES, ENERGY_FEATURES, adapt_function, load_case_base,
+                        make_system, normalize_query, score_file)
+from data_loader import DataLoader
+
+
+def expected_results(domain, queries, adapt, k, explain=False):
+    cases, params = load_case_base(domain)
+    system, use_weights = make_system(domain, cases, 'tuned', k)
+    if params is not None:
+        queries = [normalize_query(query, params) for query in queries]
+    return system.solve_batch(queries, adapt_fn=adapt_function(domain, adapt), k=k,
+                              use_weights=use_weights, with_contributions=explain)
+
+
+@pytest.mark.parametrize('adapt', ['rules', 'knn'])
+def test_car_csv_output_matches_solve_batch(tmp_path, car_data, adapt):
+    _, test = car_data
+    queries = test[:50]
+    query_file = tmp_path / 'queries.data'
+    query_file.write_text(''.join(','.join([*(q.features[name] for name in CAR_FEATURES),
+                                            q.solution]) + '\n' for q in queries))
+    output = tmp_path / 'predictions.csv'
+    report = score_file('car', str(query_file), str(output), adapt=adapt, k=4, chunk_size=7)
+
+    expected = expected_results('car', queries, adapt, 4)
+    with open(output, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == report['queries'] == len(queries)
+    for number, (row, (solution, neighbours, similarities)) in enumerate(zip(rows, expected)):
+        assert int(row['query']) == number
+        assert row['prediction'] == solution
+        assert row['actual'] == queries[number].solution
+        assert [int(i) for i in row['neighbours'].split(';')] == neighbours.tolist()
+        assert [float(s) for s in row['similarities'].split(';')] == \
+            pytest.approx(similarities.tolist(), abs=1e-6)
+    correct = sum(solution == q.solution for (solution, *_), q in zip(expected, queries))
+    assert report['accuracy'] == pytest.approx(correct / len(queries) * 100)
+
+
+def test_energy_raw_csv_and_normalized_jsonl_match_solve_batch(tmp_path):
+    raw = DataLoader.energy_cases_from_table(DataLoader.read_energy_table('ENB2012_data.xlsx'))[:40]
+    query_file = tmp_path / 'queries.csv'
+    with open(query_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(ENERGY_FEATURES) + ['Y1'])
+        for case in raw:
+            writer.writerow([case.features[name] for name in ENERGY_FEATURES.values()] + [case.solution])
+    output = tmp_path / 'predictions.jsonl'
+    report = score_file('energy', str(query_file), str(output), k=3, chunk_size=9, explain=True)
+
+    expected = expected_results('energy', raw, 'rules', 3, explain=True)
+    with open(output) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == len(raw)
+    for record, (solution, neighbours, similarities, contributions) in zip(records, expected):
+        assert record['prediction'] == pytest.approx(solution)
+        assert record['neighbours'] == neighbours.tolist()
+        assert record['similarities'] == pytest.approx(similarities.tolist())
+        assert record['contributions'] == [pytest.approx(parts) for parts in contributions]
+    errors = [abs(r['prediction'] - case.solution) for r, case in zip(records, raw)]
+    assert report['mae'] == pytest.approx(sum(errors) / len(errors))
+
+    # Already z-scored queries in JSONL give the same predictions
+    _, params = load_case_base('energy')
+    normalized = tmp_path / 'normalized.jsonl'
+    normalized.write_text(''.join(json.dumps({'features': normalize_query(case, params).features})
+                                  + '\n' for case in raw))
+    again = tmp_path / 'again.jsonl'
+    report = score_file('energy', str(normalized), str(again), k=3, normalized=True)
+    with open(again) as f:
+        assert [json.loads(line)['prediction'] for line in f] == \
+            pytest.approx([r['prediction'] for r in records])
+    assert report['labelled'] == 0 and 'mae' not in report
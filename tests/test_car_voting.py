@@ -0,0 +1,56 @@
+"""Fused car retrieval and voting agree with top-k retrieval plus a Counter vote."""
+
+from collections import Counter
+import pytest
+from car_cbr import CarCBRSystem
+
+
+def baseline_adapt(system, retrieved, query):
+    """Voting rule as a separate top-3 retrieval and a Counter over its classes."""
+    adapted_class = system._feature_refinement(retrieved, query)
+    top_3 = system.retrieve_top_k(query, k=3, use_weights=True)
+    voted_classes = [case.solution for case, _ in top_3]
+    if len(set(voted_classes)) == 1 and top_3[0][1] > 0.75:
+        return voted_classes[0]
+    elif voted_classes.count(voted_classes[0]) >= 2:
+        return Counter(voted_classes).most_common(1)[0][0]
+    return adapted_class
+
+
+@pytest.fixture(params=['scan', 'inverted'])
+def system(request, car_data):
+    train, _ = car_data
+    system = CarCBRSystem()
+    system.set_case_base(train, verbose=False)
+    system.set_tuned_mode()
+    if request.param == 'inverted':
+        system.enable_inverted_index()
+    return system
+
+
+def test_vote_tallies_the_top_k(system, car_data):
+    _, test = car_data
+    for query in test[:60]:
+        vote = system.retrieve_and_vote(query, k=5)
+        top_k = system.retrieve_top_k(query, k=5, use_weights=True)
+        assert [case for case, _ in vote.neighbours] == [case for case, _ in top_k]
+        assert [s for _, s in vote.neighbours] == pytest.approx([s for _, s in top_k])
+        assert vote.best[0] is system.retrieve_most_similar(query, use_weights=True)[0]
+        labels = [case.solution for case, _ in top_k]
+        assert {label: count for label, (count, _) in vote.votes.items()} == Counter(labels)
+        for label, (_, similarity) in vote.votes.items():
+            assert similarity == pytest.approx(sum(s for case, s in top_k if case.solution == label))
+        assert vote.majority_class == Counter(labels).most_common(1)[0][0]
+
+
+def test_fused_adaptation_matches_baseline_vote(system, car_data):
+    _, test = car_data
+    adapt = lambda retrieved, query, system: system.adapt_classification(retrieved, query)
+    cb = system.case_base
+    for query in test[:80]:
+        retrieved, _ = system.retrieve_most_similar(query, use_weights=True)
+        expected = baseline_adapt(system, retrieved, query)
+        assert system.adapt_classification(retrieved, query) == expected
+        solution, cb = system.run_query(cb, query, tuned=True, adapt_fn=adapt, learning=True)
+        assert solution == expected
+    assert cb is system.case_base
@@ -0,0 +1,121 @@
+"""Retrieval and statistics over a changing case base follow the version in use."""
+
+import random
+import pytest
+from data_loader import Case
+from cbr_system import top_k_indices
+from car_cbr import CarCBRSystem
+from energy_cbr import EnergyCBRSystem
+
+
+def linear_scan(system, query, cases, k):
+    """Positions of the k most similar cases, ties in case base order."""
+    if system.index_precision != 'float64':
+        # Reduced precision: the stored (quantized) values of a full index scan
+        return top_k_indices(system.score_case_base(query, case_base=cases), k).tolist()
+    scores = [round(system.calculate_similarity(query, case), 9) for case in cases]
+    return sorted(range(len(cases)), key=lambda i: (-scores[i], i))[:k]
+
+
+def retrieved(system, query, cases, k):
+    positions = {id(case): i for i, case in enumerate(cases)}
+    return [positions[id(case)] for case, _ in system.retrieve_top_k(query, k, case_base=cases)]
+
+
+def fresh(case):
+    return Case(features=dict(case.features), solution=case.solution)
+
+
+MODES = {
+    'full': lambda system: None,
+    'early': lambda system: system.set_scan_mode('early'),
+    'clusters': lambda system: system.enable_clustering(n_probe=2),
+    'clusters_probe1': lambda system: system.enable_clustering(n_probe=1),
+    'inverted': lambda system: system.enable_inverted_index(),
+}
+ENERGY_MODES = ('full', 'early', 'clusters', 'clusters_probe1')
+
+
+@pytest.mark.parametrize('domain,mode,precision',
+                         [('car', mode, 'float64') for mode in MODES] +
+                         [('car', 'inverted', 'int8')] +
+                         [('energy', mode, precision) for mode in ENERGY_MODES
+                          for precision in ('float64', 'float32', 'int16', 'int8')])
+def test_retrieval_equals_linear_scan_after_each_mutation(domain, mode, precision, car_data, energy_data):
+    train, test = car_data if domain == 'car' else energy_data
+    system = CarCBRSystem() if domain == 'car' else EnergyCBRSystem()
+    system.set_case_base(train[:300], verbose=False)
+    system.set_index_precision(precision)
+    MODES[mode](system)
+    rng = random.Random(7)
+    pool = train[300:] + test
+    queries = test[:5]
+    versions = [system.case_base]
+    handle = system.case_base_handle(train[:120])
+    for step in range(24):
+        action = rng.choice(['add', 'add_many', 'remove', 'branch', 'handle'])
+        if action == 'add':
+            system.add_case(fresh(rng.choice(pool)))
+        elif action == 'add_many':
+            system.add_cases([fresh(rng.choice(pool)) for _ in range(rng.randint(2, 30))])
+        elif action == 'remove':
+            system.remove_cases(rng.sample(range(len(system.case_base)), 5))
+        elif action == 'branch':
+            # Retain into an older version, as run_query does for a caller's snapshot
+            base = rng.choice(versions)
+            versions.append(system.add_case(fresh(rng.choice(pool)), case_base=base))
+        else:
+            handle = system.add_cases([fresh(rng.choice(pool)) for _ in range(3)], case_base=handle)
+            versions.append(handle)
+        versions.append(system.case_base)
+        for cases in (system.case_base, versions[rng.randrange(len(versions))], handle):
+            snapshot = list(cases)
+            for query in queries:
+                assert retrieved(system, query, cases, 5) == linear_scan(system, query, snapshot, 5), \
+                    (step, action)
+
+
+def test_versions_share_storage_and_stay_unchanged(car_data):
+    train, test = car_data
+    system = CarCBRSystem()
+    system.set_case_base(train, verbose=False)
+    old = system.add_case(fresh(test[0]))
+    contents = list(old)
+    new = system.add_case(fresh(test[1]))
+    assert new._items is old._items
+    branch = system.add_case(fresh(test[2]), case_base=old)
+    assert branch._items is not old._items
+    assert list(old) == contents
+    assert list(new) == contents + [new[-1]]
+    assert list(branch) == contents + [branch[-1]]
+
+
+def test_segment_statistics_follow_the_case_base_in_use(energy_data):
+    train, test = energy_data
+    system = EnergyCBRSystem()
+    system.set_case_base(train, verbose=False)
+    old = system.case_base
+    system.add_cases([Case(features=dict(test[0].features), solution=10.0 * max(c.solution for c in train))])
+    handle = system.case_base_handle(sorted(train, key=lambda c: c.solution)[:50])
+    handle = system.add_case(fresh(test[1]), case_base=handle)
+    for cases in (old, handle, system.case_base, list(handle)):
+        stats = system.solution_stats_for_case_base(case_base=cases)
+        solutions = [case.solution for case in cases]
+        assert (stats.count, stats.min, stats.max) == (len(solutions), min(solutions), max(solutions))
+        assert stats.mean == pytest.approx(sum(solutions) / len(solutions))
+    # Rule 4 on the pinned version scales by that version's segments: the
+    # highest old load is in its top segment, but below q1 of the new range
+    top = max(old, key=lambda case: case.solution)
+    segment = lambda retrieved, query, system: system._segment_based_adaptation(top, query)
+    for cases, scale in ((old, 1.04), (system.case_base, 0.98)):
+        solution, _ = system.run_query(cases, test[2], tuned=True, adapt_fn=segment, learning=False)
+        assert solution == pytest.approx(top.solution * scale)
+    # Retaining into a caller's case base publishes it: the statistics (and
+    # so the segments) are those of that case base, not of the previous one
+    small = sorted(train, key=lambda case: case.solution)[:50]
+    _, cb = system.run_query(small, test[3], tuned=True, learning=True)
+    stats = system.solution_stats_for_case_base(case_base=cb)
+    solutions = [case.solution for case in cb]
+    assert (stats.count, stats.max) == (51, max(solutions))
+    solution, _ = system.run_query(cb, test[2], tuned=True, adapt_fn=segment, learning=False)
+    assert solution == pytest.approx(top.solution * 1.04)
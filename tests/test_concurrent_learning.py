@@ -0,0 +1,76 @@
+"""Concurrent run_query calls with learning keep every retained case."""
+
+import threading
+import numpy as np
+import pytest
+from car_cbr import CarCBRSystem
+from energy_cbr import EnergyCBRSystem
+
+N_THREADS = 6
+PER_THREAD = 15
+
+
+def energy_rules(retrieved, query, system):
+    return system.adapt_regression(retrieved, query, use_multiple_rules=True)
+
+
+def car_voting(retrieved, query, system):
+    return system.adapt_classification(retrieved, query, use_voting=True)
+
+
+@pytest.mark.parametrize('domain', ['car', 'energy'])
+def test_concurrent_retention_loses_no_case(domain, car_data, energy_data):
+    train, test = car_data if domain == 'car' else energy_data
+    if domain == 'car':
+        system, adapt_fn = CarCBRSystem(), car_voting
+        system.enable_inverted_index()
+    else:
+        system, adapt_fn = EnergyCBRSystem(), energy_rules
+    system.set_case_base(train, verbose=False)
+    system.set_tuned_mode()
+    queries = test[:N_THREADS * PER_THREAD]
+    barrier = threading.Barrier(N_THREADS + 1)
+    errors, retained, stop = [], {}, threading.Event()
+
+    def learner(part):
+        try:
+            barrier.wait()
+            cb = system.case_base
+            for query in queries[part::N_THREADS]:
+                solution, cb = system.run_query(cb, query, tuned=True, adapt_fn=adapt_fn, learning=True)
+                assert cb[-1].features is query.features
+                retained[id(query.features)] = solution
+        except Exception as e:
+            errors.append(e)
+
+    def reader():
+        barrier.wait()
+        while not stop.is_set():
+            cb = system.case_base
+            scores = system.score_case_base(test[-1], case_base=cb)
+            if len(scores) != len(cb):
+                errors.append(AssertionError("scores do not match the pinned case base"))
+
+    threads = [threading.Thread(target=learner, args=(part,)) for part in range(N_THREADS)]
+    watcher = threading.Thread(target=reader)
+    for thread in threads + [watcher]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    watcher.join()
+    assert errors == []
+
+    final = system.case_base
+    assert len(final) == len(train) + len(queries)
+    assert list(final[:len(train)]) == list(train)
+    new = {id(case.features): case.solution for case in final[len(train):]}
+    assert new == retained and len(retained) == len(queries)
+
+    # The index built up by concurrent versions scores like the scalar path
+    probe = test[-1]
+    expected = [system.calculate_similarity(probe, case, use_weights=True) for case in final]
+    np.testing.assert_allclose(system.score_case_base(probe), expected, rtol=1e-12)
+    if domain == 'energy':
+        assert system.solution_stats.count == len(final)
+        assert system.solution_stats.max == max(case.solution for case in final)
@@ -0,0 +1,44 @@
+"""Per-feature similarity contributions sum to the score and match the scalar path."""
+
+import pytest
+from car_cbr import CarCBRSystem
+from energy_cbr import EnergyCBRSystem
+
+
+@pytest.fixture(params=[('car', True), ('car', False), ('energy', True), ('energy', False)],
+                ids=lambda p: f"{p[0]}-{'tuned' if p[1] else 'baseline'}")
+def setup(request, car_data, energy_data):
+    domain, tuned = request.param
+    train, test = car_data if domain == 'car' else energy_data
+    system = CarCBRSystem() if domain == 'car' else EnergyCBRSystem()
+    system.set_case_base(train, verbose=False)
+    system.set_tuned_mode() if tuned else system.set_baseline_mode()
+    return system, tuned, test[:20]
+
+
+def test_top_k_contributions_sum_to_the_similarity(setup):
+    system, tuned, queries = setup
+    for query in queries:
+        explained = system.retrieve_top_k(query, k=5, use_weights=tuned, with_contributions=True)
+        plain = system.retrieve_top_k(query, k=5, use_weights=tuned)
+        assert [case for case, _, _ in explained] == [case for case, _ in plain]
+        for case, similarity, parts in explained:
+            assert set(parts) == set(query.features)
+            assert sum(parts.values()) == pytest.approx(similarity, abs=1e-12)
+            # Same shares as the case-by-case similarity
+            scalar = {}
+            assert system.calculate_similarity(query, case, tuned, scalar) == pytest.approx(similarity)
+            assert parts == pytest.approx(scalar)
+        best, similarity, parts = system.retrieve_most_similar(query, tuned, with_contributions=True)
+        assert best is explained[0][0] and parts == explained[0][2]
+
+
+def test_solve_batch_contributions_match_retrieval(setup):
+    system, tuned, queries = setup
+    results = system.solve_batch(queries, k=3, use_weights=tuned, with_contributions=True)
+    for query, (_, neighbours, similarities, contributions) in zip(queries, results):
+        explained = system.retrieve_top_k(query, k=3, use_weights=tuned, with_contributions=True)
+        assert [system.case_base[i] for i in neighbours.tolist()] == [case for case, _, _ in explained]
+        for similarity, parts, (_, _, expected) in zip(similarities.tolist(), contributions, explained):
+            assert sum(parts.values()) == pytest.approx(similarity, abs=1e-12)
+            assert parts == pytest.approx(expected)
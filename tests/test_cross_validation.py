@@ -0,0 +1,72 @@
+"""Cross-validation folds, self-exclusion and leave-one-out equivalence."""
+
+import numpy as np
+import pytest
+from evaluation import car_cross_validator, energy_cross_validator, domain_spec
+
+
+@pytest.fixture(scope='module')
+def energy_cv(energy_data):
+    train, _ = energy_data
+    return energy_cross_validator(train[:40])
+
+
+def test_folds_partition_the_rows(energy_cv):
+    n = len(energy_cv.cases)
+    folds = energy_cv.make_folds(7, random_seed=3)
+    assert len(folds) == 7
+    assert sorted(np.concatenate(folds).tolist()) == list(range(n))
+    assert max(map(len, folds)) - min(map(len, folds)) <= 1
+    assert [f.tolist() for f in energy_cv.make_folds(7, 3)] == [f.tolist() for f in folds]
+    assert [f.tolist() for f in energy_cv.make_folds(None)] == [[i] for i in range(n)]
+    with pytest.raises(ValueError):
+        energy_cv.make_folds(1)
+    with pytest.raises(ValueError):
+        energy_cv.make_folds(n + 1)
+
+
+@pytest.mark.parametrize('domain', ['car', 'energy'])
+def test_fold_equals_a_system_without_the_test_rows(domain, car_data, energy_data):
+    train, _ = car_data if domain == 'car' else energy_data
+    cases = train[:60]
+    cv = (car_cross_validator if domain == 'car' else energy_cross_validator)(cases)
+    cv._precompute()
+    factory, _, adapt, conditions = domain_spec(domain)
+    test_rows = np.array([3, 17, 42])
+    for condition in conditions:
+        predictions = cv.run_fold(condition, test_rows)
+
+        # Same condition on a plain system over the other rows (no precomputed scores)
+        system = factory()
+        system.set_case_base([case for i, case in enumerate(cases) if i not in set(test_rows.tolist())],
+                             verbose=False)
+        system.set_tuned_mode() if condition['tuned'] else system.set_baseline_mode()
+        if condition['adapt'] == 'knn':
+            adapt_fn = system.adapt_knn
+        elif condition['adapt']:
+            adapt_fn = lambda r, q, s: adapt(s, r, q)
+        else:
+            adapt_fn = None
+        cb = system.case_base.copy()
+        expected = []
+        for row in test_rows:
+            solution, updated = system.run_query(cb, cases[row], tuned=condition['tuned'],
+                                                 adapt_fn=adapt_fn, learning=condition['learning'])
+            expected.append(solution)
+            if condition['learning']:
+                cb = updated
+        if domain == 'energy':
+            assert predictions == pytest.approx(expected)
+        else:
+            assert predictions == expected
+
+
+def test_leave_one_out_equals_n_folds(energy_cv):
+    loo = energy_cv.run(None)
+    k_fold = energy_cv.run(len(energy_cv.cases), random_seed=5)
+    for key, result in loo.items():
+        assert result['n_folds'] == k_fold[key]['n_folds'] == len(energy_cv.cases)
+        for metric, value in result['pooled'].items():
+            assert k_fold[key]['pooled'][metric] == pytest.approx(value), (key, metric)
+        # One query per fold: the fold MAE is the absolute error, averaged = pooled MAE
+        assert result['mean']['mae'] == pytest.approx(result['pooled']['mae'])
@@ -0,0 +1,65 @@
+"""Energy solution and correlation statistics follow the system's published case base."""
+
+import numpy as np
+import pytest
+from data_loader import Case
+from energy_cbr import EnergyCBRSystem, SolutionStats
+
+
+def assert_stats_of(stats, cases):
+    solutions = [case.solution for case in cases]
+    assert (stats.count, stats.min, stats.max) == (len(solutions), min(solutions), max(solutions))
+    assert stats.mean == pytest.approx(sum(solutions) / len(solutions))
+    assert stats.variance == pytest.approx(SolutionStats(solutions).variance)
+
+
+def test_solution_stats_follow_retention_and_eviction(energy_data):
+    train, test = energy_data
+    system = EnergyCBRSystem()
+    system.set_case_base(train, verbose=False)
+    cb = system.case_base.copy()
+    for query in test[:5]:
+        _, cb = system.run_query(cb, query, tuned=True, learning=True)
+    system.add_cases([Case(features=dict(q.features), solution=q.solution) for q in test[5:10]])
+    assert_stats_of(system.solution_stats, system.case_base)
+    system.remove_cases(list(range(0, 40, 3)))
+    assert_stats_of(system.solution_stats, system.case_base)
+
+
+def test_solution_stats_rebuilt_when_retaining_into_other_cases(energy_data):
+    train, test = energy_data
+    system = EnergyCBRSystem()
+    system.set_case_base(train, verbose=False)
+    small = sorted(train, key=lambda case: case.solution)[:50]
+    _, cb = system.run_query(small, test[0], tuned=True, learning=True)
+    assert cb is system.case_base and len(cb) == 51
+    assert_stats_of(system.solution_stats, cb)
+    # Further retention extends the rebuilt statistics
+    _, cb = system.run_query(cb, test[1], tuned=True, learning=True)
+    assert_stats_of(system.solution_stats, cb)
+
+
+def correlation_weights(cases):
+    """Absolute feature/solution correlations normalized to sum to 1 (0 for constant features)."""
+    names = list(cases[0].features)
+    X = np.array([[case.features[name] for name in names] for case in cases], dtype=float)
+    y = np.array([case.solution for case in cases], dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = np.array([np.corrcoef(X[:, j], y)[0, 1] for j in range(len(names))])
+    corr = np.abs(np.nan_to_num(corr))
+    return dict(zip(names, corr / corr.sum()))
+
+
+@pytest.mark.parametrize('foreign', [False, True])
+def test_refreshed_weights_match_published_case_base(energy_data, foreign):
+    train, test = energy_data
+    system = EnergyCBRSystem(weight_refresh_interval=1)
+    system.set_case_base(train, verbose=False)
+    system.set_tuned_mode()
+    cb = sorted(train, key=lambda case: case.solution)[:50] if foreign else system.case_base
+    for query in test[:3]:
+        _, cb = system.run_query(cb, query, tuned=True, learning=True)
+    assert cb is system.case_base
+    expected = correlation_weights(cb)
+    assert system.feature_weights == pytest.approx(expected)
+    assert system.correlation_stats.count == len(cb)
@@ -0,0 +1,89 @@
+"""Experiment result cache: hits, invalidation by config and code, and forced reruns."""
+
+import os
+import shutil
+import pytest
+import experiment_runner
+from experiment_runner import ExperimentRunner, normalize_condition, run_condition
+from data_loader import load_energy_system_data
+
+CONDITIONS = [
+    {"name": "energy_tuned", "domain": "energy", "weights": "tuned", "adaptation": "rules"},
+    {"name": "energy_untuned", "domain": "energy", "weights": "baseline", "learning": True},
+]
+
+
+def runner_for(conditions, cache_dir):
+    return ExperimentRunner({'conditions': conditions}, cache_dir=str(cache_dir))
+
+
+def fail_if_computed(*args, **kwargs):
+    raise AssertionError("condition recomputed despite a cached result")
+
+
+def test_second_run_loads_the_cached_results(tmp_path, monkeypatch):
+    first = runner_for(CONDITIONS, tmp_path).run()
+    assert [r['cached'] for r in first.values()] == [False, False]
+    assert len(list(tmp_path.glob('*.json'))) == 2
+
+    # The cached results equal a direct run of the condition
+    train, test = load_energy_system_data(random_seed=42)
+    direct = run_condition(normalize_condition(CONDITIONS[0]), train, test)
+    assert first['energy_tuned']['predictions'] == pytest.approx(direct['predictions'])
+
+    monkeypatch.setattr(experiment_runner, 'run_condition', fail_if_computed)
+    second = runner_for(CONDITIONS, tmp_path).run()
+    for name, result in second.items():
+        assert result['cached']
+        assert result['predictions'] == pytest.approx(first[name]['predictions'])
+        assert result['metrics'] == pytest.approx(first[name]['metrics'])
+    # Renaming a condition keeps its key
+    renamed = [dict(CONDITIONS[0], name='renamed')]
+    assert runner_for(renamed, tmp_path).run()['renamed']['cached']
+
+
+def test_changed_config_recomputes_only_that_condition(tmp_path):
+    runner_for(CONDITIONS, tmp_path).run()
+    changed = [CONDITIONS[0], dict(CONDITIONS[1], learning=False)]
+    results = runner_for(changed, tmp_path).run()
+    assert results['energy_tuned']['cached']
+    assert not results['energy_untuned']['cached']
+    assert not results['energy_untuned']['condition']['learning']
+    assert len(list(tmp_path.glob('*.json'))) == 3
+
+    forced = runner_for(changed, tmp_path).run(only=['energy_tuned'], force=True)
+    assert list(forced) == ['energy_tuned'] and not forced['energy_tuned']['cached']
+    with pytest.raises(ValueError):
+        runner_for(changed, tmp_path).run(only=['missing'])
+
+
+def test_code_changes_invalidate_the_cache(tmp_path, monkeypatch):
+    code_dir = tmp_path / 'code'
+    code_dir.mkdir()
+    for name in experiment_runner.code_files():
+        shutil.copy(os.path.join(experiment_runner._BASE_DIR, name), code_dir / name)
+    monkeypatch.setattr(experiment_runner, '_BASE_DIR', str(code_dir))
+    condition = normalize_condition(CONDITIONS[0])
+    key = runner_for(CONDITIONS, tmp_path).key(condition)
+    assert runner_for(CONDITIONS, tmp_path).key(condition) == key
+
+    # A new module (e.g. an index the systems import) changes the key
+    (code_dir / 'new_index.py').write_text('"""New index."""\n')
+    assert 'new_index.py' in experiment_runner.code_files()
+    added = runner_for(CONDITIONS, tmp_path).key(condition)
+    assert added != key
+
+    # So does an edit to an existing module
+    with open(code_dir / 'cbr_system.py', 'a') as f:
+        f.write('\n# changed\n')
+    assert runner_for(CONDITIONS, tmp_path).key(condition) not in (key, added)
+
+
+def test_invalid_conditions_are_rejected():
+    for condition in ({'domain': 'car'}, {'name': 'x', 'domain': 'boats'},
+                      {'name': 'x', 'domain': 'car', 'weights': 'heavy'},
+                      {'name': 'x', 'domain': 'car', 'seed': 1}):
+        with pytest.raises(ValueError):
+            normalize_condition(condition)
+    with pytest.raises(ValueError):
+        ExperimentRunner({'conditions': [CONDITIONS[0], CONDITIONS[0]]})
@@ -0,0 +1,60 @@
+"""Reduced storage precisions stay within their error bounds of float64."""
+
+import numpy as np
+import pytest
+from data_loader import Case
+from energy_cbr import EnergyCBRSystem
+from evaluation import compare_index_precisions
+
+
+@pytest.fixture(scope='module')
+def energy_report():
+    return compare_index_precisions('energy', k=3)
+
+
+def test_code_tables_are_exact_on_enb2012(energy_report):
+    reference = energy_report['float64']
+    for precision, shrink in (('int16', 4), ('int8', 8)):
+        result = energy_report[precision]
+        assert result['max_score_error'] == 0.0
+        assert result['top_k_agreement'] == 1.0
+        assert result['metrics'] == reference['metrics']
+        assert result['nbytes'] * shrink == reference['nbytes']
+    float32 = energy_report['float32']
+    assert 0.0 < float32['max_score_error'] < 1e-6
+    assert float32['nbytes'] * 2 == reference['nbytes']
+    assert float32['metrics']['mae'] == pytest.approx(reference['metrics']['mae'], rel=1e-6)
+
+
+def test_linear_grid_error_is_within_half_a_step(energy_data):
+    train, test = energy_data
+    rng = np.random.default_rng(0)
+    # Jitter a feature so it has more distinct values than int8 codes
+    cases = [Case(features=dict(case.features,
+                                surface_area=case.features['surface_area'] + rng.uniform(0, 5)),
+                  solution=case.solution) for case in train]
+    values = [case.features['surface_area'] for case in cases]
+    assert len(set(values)) > 256
+    span = max(values) - min(values)
+
+    system = EnergyCBRSystem()
+    system.set_case_base(cases, verbose=False)
+    system.set_tuned_mode()
+    queries = test[:40]
+    exact = system.score_case_base_batch(queries, use_weights=True)
+    exact_top = [set(np.argsort(-row, kind='stable')[:5].tolist()) for row in exact]
+    for precision, levels in (('int16', 65536), ('int8', 256)):
+        system.set_index_precision(precision)
+        scores = system.score_case_base_batch(queries, use_weights=True)
+        # 1 / (1 + |d|) moves by at most |d| error; a weighted mean keeps the bound
+        assert np.max(np.abs(scores - exact)) <= span / (levels - 1) / 2 + 1e-12
+        decoded = system.case_index().decode('surface_area')
+        assert np.max(np.abs(decoded - values)) <= span / (levels - 1) / 2 + 1e-9
+        top = [set(np.argsort(-row, kind='stable')[:5].tolist()) for row in scores]
+        agreement = np.mean([a == b for a, b in zip(top, exact_top)])
+        assert agreement >= (1.0 if precision == 'int16' else 0.8), precision
+
+
+def test_unknown_precision_is_rejected():
+    with pytest.raises(ValueError):
+        EnergyCBRSystem().set_index_precision('float16')
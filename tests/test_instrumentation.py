@@ -0,0 +1,97 @@
+"""Per-query instrumentation records, counters and profiling."""
+
+import sys
+import threading
+import pytest
+from energy_cbr import EnergyCBRSystem
+from instrumentation import InMemoryStats, ProfilerSink
+
+
+@pytest.fixture
+def system(energy_data):
+    train, _ = energy_data
+    system = EnergyCBRSystem()
+    system.set_case_base(train, verbose=False)
+    system.set_tuned_mode()
+    yield system
+    system.disable_instrumentation()
+
+
+def rules(retrieved, query, system):
+    return system.adapt_regression(retrieved, query, use_multiple_rules=True)
+
+
+def test_counters_and_phases_per_query(system, energy_data):
+    _, test = energy_data
+    inst = system.enable_instrumentation()
+    system.run_query(system.case_base, test[0], tuned=True, learning=False)
+    record = inst.stats.last_record
+    assert record['counters'] == {'scans': 1, 'similarity_evaluations': len(system.case_base)}
+    assert set(record['phases']) == {'retrieve', 'adapt', 'retain'}
+    assert (record['case_base_size'], record['tuned'], record['learning']) == (len(system.case_base), True, False)
+
+    # The rules reuse the retrieval's scores: still one scan per query
+    _, cb = system.run_query(system.case_base, test[1], tuned=True, adapt_fn=rules, learning=True)
+    record = inst.stats.last_record
+    assert record['counters']['scans'] == 1
+    assert {'adapt.difference_scaling', 'adapt.linear_extrapolation',
+            'adapt.multi_case_averaging', 'adapt.segment_based'} <= set(record['phases'])
+    assert record['case_base_size'] == len(cb)
+
+    summary = inst.stats.summary()
+    assert summary['queries'] == 2 == inst.query_count
+    assert summary['counters']['scans'] == 2
+    assert summary['phases']['retrieve']['count'] == 2
+
+
+def test_failed_query_is_recorded_and_stops_profiling(system, energy_data):
+    _, test = energy_data
+    profiler = ProfilerSink()
+    inst = system.enable_instrumentation(InMemoryStats(), profiler)
+
+    def failing(retrieved, query, system):
+        raise RuntimeError("adaptation failed")
+
+    with pytest.raises(RuntimeError):
+        system.run_query(system.case_base, test[0], tuned=True, adapt_fn=failing, learning=False)
+    assert sys.getprofile() is None
+    assert inst.stats.last_record['error'] == 'RuntimeError'
+    assert 'retain' not in inst.stats.last_record['phases']
+
+    system.run_query(system.case_base, test[1], tuned=True, learning=False)
+    assert 'error' not in inst.stats.last_record
+    assert '_retrieve_for_query' in profiler.stats(limit=200)
+
+
+def test_overlapping_queries_keep_their_own_profiling(system, energy_data):
+    _, test = energy_data
+    profiler = ProfilerSink()
+    system.enable_instrumentation(InMemoryStats(), profiler)
+    first_done = threading.Event()
+    second_started = threading.Event()
+    profiled = {}
+
+    def first(retrieved, query, system):
+        second_started.wait(5)
+        return retrieved.solution
+
+    def second(retrieved, query, system):
+        second_started.set()
+        first_done.wait(5)
+        # The other thread's query ended meanwhile; this one is still profiled
+        profiled['second'] = sys.getprofile() is not None
+        return retrieved.solution
+
+    def run(adapt_fn, query, done=None):
+        system.run_query(system.case_base, query, tuned=True, adapt_fn=adapt_fn, learning=False)
+        if done is not None:
+            done.set()
+
+    threads = [threading.Thread(target=run, args=(first, test[0], first_done)),
+               threading.Thread(target=run, args=(second, test[1]))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert profiled == {'second': True} or profiler.skipped == 1
+    assert profiler.stats()
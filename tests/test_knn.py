@@ -0,0 +1,53 @@
+"""k-NN prediction used directly as run_query's adapt_fn."""
+
+import pytest
+from car_cbr import CarCBRSystem
+from energy_cbr import EnergyCBRSystem
+
+
+def test_adapt_knn_as_adapt_fn_car(car_data):
+    train, test = car_data
+    system = CarCBRSystem()
+    system.set_case_base(train, verbose=False)
+    for query in test[:25]:
+        solution, _ = system.run_query(system.case_base, query, tuned=True,
+                                       adapt_fn=system.adapt_knn, learning=False)
+        assert solution == system.knn_predict(query)
+
+
+def test_adapt_knn_as_adapt_fn_energy(energy_data):
+    train, test = energy_data
+    system = EnergyCBRSystem()
+    system.set_case_base(train, verbose=False)
+    for query in test[:25]:
+        solution, _ = system.run_query(system.case_base, query, tuned=True,
+                                       adapt_fn=system.adapt_knn, learning=False)
+        assert solution == pytest.approx(system.knn_predict(query))
+
+
+def test_adapt_knn_keyword_k_with_learning(energy_data):
+    train, test = energy_data
+    system = EnergyCBRSystem()
+    system.set_case_base(train, verbose=False)
+    cb = system.case_base
+    for query in test[:10]:
+        solution, cb = system.run_query(cb, query, tuned=True,
+                                        adapt_fn=lambda r, q, s: s.adapt_knn(r, q, s, k=3),
+                                        learning=True)
+        assert cb[-1].solution == solution
+    assert len(cb) == len(train) + 10
+
+
+@pytest.mark.parametrize('tuned', [False, True])
+def test_adapt_knn_follows_run_query_weighting_with_one_scan(energy_data, tuned):
+    train, test = energy_data
+    system = EnergyCBRSystem()
+    system.set_case_base(train, verbose=False)
+    system.set_tuned_mode()
+    inst = system.enable_instrumentation()
+    for query in test[:10]:
+        solution, _ = system.run_query(system.case_base, query, tuned=tuned,
+                                       adapt_fn=system.adapt_knn, learning=False)
+        assert inst.stats.last_record['counters']['scans'] == 1
+        assert solution == pytest.approx(system.knn_predict(query, use_weights=tuned))
+    system.disable_instrumentation()
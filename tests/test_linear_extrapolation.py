@@ -0,0 +1,63 @@
+"""Batched linear extrapolation agrees with the per-query, per-feature rule."""
+
+import numpy as np
+import pytest
+from energy_cbr import EnergyCBRSystem
+
+
+@pytest.fixture(scope='module')
+def system(energy_data):
+    train, _ = energy_data
+    system = EnergyCBRSystem()
+    system.set_case_base(train, verbose=False)
+    system.set_tuned_mode()
+    return system
+
+
+def reference_extrapolation(system, retrieved, query, k=10):
+    """The rule one feature at a time, with np.corrcoef over the query's neighbours."""
+    neighbours = system.retrieve_top_k(query, k=min(k, len(system.case_base)))
+    adjustment = 0.0
+    for name in retrieved.features:
+        x = np.array([case.features[name] for case, _ in neighbours], dtype=float)
+        y = np.array([case.solution for case, _ in neighbours], dtype=float)
+        if x.std() == 0 or y.std() == 0:
+            continue
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.corrcoef((x - x.mean()) / x.std(),
+                                (y - y.mean()) / y.std())[0, 1]
+        if not np.isnan(slope):
+            adjustment += (query.features[name] - retrieved.features[name]) * slope * 0.1
+    return retrieved.solution + adjustment
+
+
+def test_batch_matches_per_query_rule(system, energy_data):
+    _, test = energy_data
+    queries = test[:25]
+    retrieved = [system.retrieve_top_k(query, k=1)[0][0] for query in queries]
+    batch = system.linear_extrapolation_batch(retrieved, queries)
+    assert batch.shape == (len(queries),)
+    single = [system._linear_extrapolation(r, q) for r, q in zip(retrieved, queries)]
+    expected = [reference_extrapolation(system, r, q) for r, q in zip(retrieved, queries)]
+    assert batch.tolist() == pytest.approx(single, rel=1e-12)
+    assert batch.tolist() == pytest.approx(expected, rel=1e-9)
+    # A constant feature (Orientation among the neighbours) or k <= 2 must not produce NaN
+    assert np.isfinite(batch).all()
+    assert system.linear_extrapolation_batch(retrieved, queries, k=2).tolist() == \
+        [case.solution for case in retrieved]
+    assert system.linear_extrapolation_batch([], []).shape == (0,)
+
+
+def test_batch_uses_the_given_case_base(system, energy_data):
+    train, test = energy_data
+    subset = train[::3]
+    other = EnergyCBRSystem()
+    other.set_case_base(subset, verbose=False)
+    other.set_tuned_mode()
+    other.feature_weights = dict(system.feature_weights)
+    queries = test[:10]
+    retrieved = [other.retrieve_top_k(query, k=1)[0][0] for query in queries]
+    pinned = system.linear_extrapolation_batch(retrieved, queries, case_base=subset)
+    assert pinned.tolist() == pytest.approx(
+        other.linear_extrapolation_batch(retrieved, queries).tolist(), rel=1e-12)
+    assert len(system.case_base) == len(train)
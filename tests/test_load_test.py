@@ -0,0 +1,52 @@
+"""Load-test windows and error accounting."""
+
+import pytest
+from load_test import run_load, windows_of
+
+
+def records_every(step, end, latency=0.001):
+    times = [step * (i + 1) for i in range(int(round(end / step)))]
+    return [(t, latency, i, None) for i, t in enumerate(times)]
+
+
+@pytest.mark.parametrize('window_s', [0.1, 0.2, 0.3, 1.0])
+def test_only_a_clipped_last_window_is_partial(window_s):
+    records = records_every(0.01, 9.7 * window_s)
+    windows = windows_of(records, window_s)
+    assert [w['partial'] for w in windows[:-1]] == [False] * (len(windows) - 1)
+    assert windows[-1]['partial']
+    for w in windows[1:-1]:
+        assert w['end_s'] - w['start_s'] == pytest.approx(window_s, abs=1e-3)
+    assert sum(w['queries'] for w in windows) == len(records)
+
+
+def test_short_last_window_is_merged_and_not_partial():
+    records = records_every(0.01, 2.2)
+    windows = windows_of(records, 1.0)
+    assert len(windows) == 2
+    assert not windows[-1]['partial']
+    assert windows[-1]['end_s'] == pytest.approx(2.2)
+
+
+@pytest.mark.parametrize('rate', [None, 500.0])
+def test_query_errors_are_counted_per_window(rate):
+    def query_fn(query):
+        if query % 4 == 0:
+            raise ValueError(f"bad query {query}")
+        return query
+
+    records = run_load(query_fn, list(range(40)), concurrency=3, rate=rate, n_queries=40)
+    assert len(records) == 40
+    failed = [record for record in records if record[3] is not None]
+    assert len(failed) == 10
+    assert all(error.startswith('ValueError: bad query') and size is None
+               for _, _, size, error in failed)
+    windows = windows_of(records, 0.01)
+    assert sum(w['errors'] for w in windows) == 10
+    assert sum(w['queries'] for w in windows) == 30
+
+
+def test_window_of_only_errors_has_no_latency():
+    windows = windows_of([(0.5, 0.001, None, 'ValueError: x')], 1.0)
+    assert windows[0]['errors'] == 1 and windows[0]['queries'] == 0
+    assert windows[0]['case_base_size'] is None
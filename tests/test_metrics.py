@@ -0,0 +1,78 @@
+"""Streaming metric accumulators agree with the batch Evaluator metrics."""
+
+import numpy as np
+import pytest
+from evaluation import (Evaluator, RegressionAccumulator, ClassificationAccumulator,
+                        make_accumulator)
+
+
+def regression_data(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    actuals = rng.uniform(5, 45, n)
+    return (actuals + rng.normal(0, 2, n)).tolist(), actuals.tolist()
+
+
+def classification_data(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    labels = ['unacc', 'acc', 'good', 'vgood']
+    actuals = rng.choice(labels, n, p=[0.7, 0.2, 0.05, 0.05])
+    predictions = np.where(rng.random(n) < 0.8, actuals, rng.choice(labels, n))
+    return predictions.tolist(), actuals.tolist()
+
+
+def test_regression_accumulator_matches_batch_metrics():
+    predictions, actuals = regression_data()
+    expected = Evaluator.calculate_metrics_summary(predictions, actuals, task_type='regression')
+    one_by_one = RegressionAccumulator()
+    for p, a in zip(predictions, actuals):
+        one_by_one.update(p, a)
+    batched = RegressionAccumulator()
+    for start in range(0, len(predictions), 64):
+        batched.update_batch(predictions[start:start + 64], actuals[start:start + 64])
+    for accumulator in (one_by_one, batched):
+        summary = accumulator.summary()
+        assert summary.keys() == expected.keys()
+        for key, value in expected.items():
+            assert summary[key] == pytest.approx(value, rel=1e-12), key
+    assert Evaluator.calculate_mae(predictions, actuals) == pytest.approx(expected['mae'])
+    assert Evaluator.calculate_rmse(predictions, actuals) == pytest.approx(expected['rmse'])
+
+
+def test_classification_accumulator_matches_batch_metrics():
+    predictions, actuals = classification_data()
+    expected = Evaluator.calculate_metrics_summary(predictions, actuals, task_type='classification')
+    one_by_one = ClassificationAccumulator()
+    for p, a in zip(predictions, actuals):
+        one_by_one.update(p, a)
+    batched = make_accumulator('classification')
+    batched.update_batch(predictions[:100], actuals[:100])
+    batched.update_batch(predictions[100:], actuals[100:])
+    for accumulator in (one_by_one, batched):
+        summary = accumulator.summary()
+        for key, value in expected.items():
+            assert summary[key] == pytest.approx(value), key
+        assert accumulator.count == len(actuals)
+    assert Evaluator.calculate_accuracy(predictions, actuals) == pytest.approx(expected['accuracy'])
+
+    # Precision/recall agree with the confusion matrix, whatever the label order
+    matrix, labels = Evaluator.confusion_matrix(predictions, actuals)
+    recall = batched.recall()
+    precision = batched.precision()
+    for i, label in enumerate(labels):
+        assert recall[label] == pytest.approx(100 * matrix[i, i] / matrix[i].sum())
+        assert precision[label] == pytest.approx(100 * matrix[i, i] / matrix[:, i].sum())
+
+
+def test_confusion_matrix_counts_pairs():
+    matrix, labels = Evaluator.confusion_matrix(['a', 'b', 'b', 'a'], ['a', 'a', 'b', 'c'])
+    assert labels == ['a', 'b', 'c']
+    assert matrix.tolist() == [[1, 1, 0], [0, 1, 0], [1, 0, 0]]
+
+
+def test_empty_accumulators_and_unknown_task():
+    assert RegressionAccumulator().summary() == {}
+    assert ClassificationAccumulator().summary() == {}
+    with pytest.raises(ValueError):
+        make_accumulator('ranking')
+    with pytest.raises(ValueError):
+        Evaluator.calculate_accuracy(['a'], ['a', 'b'])
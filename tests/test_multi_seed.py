@@ -0,0 +1,41 @@
+"""Bootstrap intervals and multi-seed evaluation are deterministic and consistent."""
+
+import numpy as np
+import pytest
+from evaluation import bootstrap_ci, evaluate_split, run_multi_seed
+
+
+def test_bootstrap_ci_is_seeded_and_brackets_the_mean():
+    values = np.random.default_rng(1).normal(10, 2, 12).tolist()
+    low, high = bootstrap_ci(values, random_seed=3)
+    assert (low, high) == bootstrap_ci(values, random_seed=3)
+    assert min(values) <= low < np.mean(values) < high <= max(values)
+    narrow = bootstrap_ci(values, confidence=0.5, random_seed=3)
+    assert low <= narrow[0] <= narrow[1] <= high
+    assert bootstrap_ci([4.0] * 5) == (4.0, 4.0)
+
+
+@pytest.fixture(scope='module')
+def multi_seed():
+    return run_multi_seed([42, 7], workers=1, domains=('energy',), n_bootstrap=500)
+
+
+def test_seed_42_reproduces_the_main_split(multi_seed, energy_data):
+    train, test = energy_data
+    expected = evaluate_split('energy', train, test)
+    result = multi_seed['per_seed'][0]['energy']
+    assert result.keys() == expected.keys()
+    for key, metrics in expected.items():
+        assert result[key] == pytest.approx(metrics), key
+
+
+def test_results_do_not_depend_on_workers(multi_seed):
+    parallel = run_multi_seed([42, 7], workers=2, domains=('energy',), n_bootstrap=500)
+    assert parallel['workers'] == 2
+    assert parallel['per_seed'] == multi_seed['per_seed']
+    assert parallel['summary'] == multi_seed['summary']
+    for key, metrics in multi_seed['summary']['energy'].items():
+        values = [result['energy'][key]['mae'] for result in multi_seed['per_seed']]
+        assert metrics['mae']['mean'] == pytest.approx(np.mean(values))
+        assert metrics['mae']['std'] == pytest.approx(np.std(values, ddof=1))
+        assert min(values) <= metrics['mae']['ci_low'] <= metrics['mae']['ci_high'] <= max(values)
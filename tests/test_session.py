@@ -0,0 +1,93 @@
+"""Session server round trips and token checks."""
+
+import json
+import os
+import socket
+import threading
+import pytest
+import session
+from session import CBRSession, SessionClient, SessionServer, session_token
+
+TOKEN = 'test-token-' + 'f' * 16
+CAR_QUERY = {'buying': 'low', 'maint': 'low', 'doors': '4', 'persons': '4',
+             'lug_boot': 'big', 'safety': 'high'}
+
+
+@pytest.fixture
+def token_env(tmp_path, monkeypatch):
+    """No token in the environment; the token file lives in tmp_path."""
+    monkeypatch.delenv(session.TOKEN_ENV, raising=False)
+    monkeypatch.setattr(session, 'TOKEN_FILE', str(tmp_path / 'token'))
+    return tmp_path / 'token'
+
+
+@pytest.fixture(scope='module')
+def server(repo_root):
+    server = SessionServer(CBRSession(), port=0, token=TOKEN)
+    thread = threading.Thread(target=server.serve, daemon=True)
+    thread.start()
+    yield server
+    SessionClient(port=server.server_address[1], token=TOKEN).shutdown()
+    thread.join(5)
+
+
+def test_token_from_environment_or_private_file(token_env, monkeypatch):
+    assert session_token() is None
+    token = session_token(create=True)
+    assert token and len(token) == 64
+    assert os.stat(token_env).st_mode & 0o777 == 0o600
+    assert session_token(create=True) == token
+    monkeypatch.setenv(session.TOKEN_ENV, 'from-env')
+    assert session_token() == 'from-env'
+    monkeypatch.delenv(session.TOKEN_ENV)
+    os.chmod(token_env, 0o644)
+    with pytest.raises(PermissionError):
+        session_token()
+
+
+def test_round_trip_matches_the_session(server, energy_data):
+    _, test = energy_data
+    client = SessionClient(port=server.server_address[1], token=TOKEN)
+    try:
+        assert client.request('ping') == 'pong'
+        local = server.session
+        # JSON turns tuples into lists
+        assert client.car_query(CAR_QUERY) == json.loads(json.dumps(local.car_query(CAR_QUERY)))
+        features = dict(test[0].features)
+        assert client.energy_query(features, state='evaluated') == \
+            json.loads(json.dumps(local.energy_query(features, state='evaluated')))
+        size = len(local.systems['fresh']['car'].case_base)
+        assert client.retain('car', CAR_QUERY, 'vgood') == size + 1
+        assert client.status()['case_base_sizes']['fresh']['car'] == size + 1
+        assert client.evaluation().keys() == local.evaluation().keys()
+        with pytest.raises(RuntimeError, match='Unknown state'):
+            client.car_query(CAR_QUERY, state='stale')
+        with pytest.raises(RuntimeError, match="Unknown op"):
+            client.request('reload')
+        assert client.request('ping') == 'pong'  # errors do not end the connection
+    finally:
+        client.close()
+
+
+def test_bad_or_missing_token_is_rejected(server, token_env):
+    port = server.server_address[1]
+    with pytest.raises(PermissionError):
+        SessionClient(port=port, token='wrong')
+    # No token anywhere: the client refuses before connecting, connect() finds no session
+    with pytest.raises(PermissionError):
+        SessionClient(port=port)
+    assert SessionClient.connect(port=port) is None
+    # A token file that does not match is an error, not "no session"
+    token_env.write_text('other')
+    os.chmod(token_env, 0o600)
+    with pytest.raises(PermissionError):
+        SessionClient.connect(port=port)
+
+    # Requests before authenticating are refused and the connection is closed
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as raw:
+        stream = raw.makefile('rwb')
+        stream.write(b'{"op": "status"}\n')
+        stream.flush()
+        assert json.loads(stream.readline()) == {
+            'ok': False, 'error': "PermissionError: invalid session token"}
+        assert stream.readline() == b''
@@ -0,0 +1,78 @@
+"""Sharded retrieval merges to the same answers as one system over the whole case base."""
+
+import multiprocessing
+import socket
+import time
+from multiprocessing import AuthenticationError
+import pytest
+from car_cbr import CarCBRSystem
+from energy_cbr import EnergyCBRSystem
+from sharding import ShardCoordinator, serve_worker
+
+
+def fitted(domain, train):
+    system = CarCBRSystem() if domain == 'car' else EnergyCBRSystem()
+    system.set_case_base(train, verbose=False)
+    system.set_tuned_mode()
+    return system
+
+
+def knn(retrieved, query, system):
+    return system.adapt_knn(retrieved, query)
+
+
+@pytest.mark.parametrize('domain', ['car', 'energy'])
+def test_merged_top_k_equals_single_system(domain, car_data, energy_data):
+    train, test = car_data if domain == 'car' else energy_data
+    single = fitted(domain, train)
+    with ShardCoordinator.start_local(fitted(domain, train), n_shards=3) as coordinator:
+        sizes = coordinator.shard_sizes()
+        assert sum(sizes) == len(coordinator) == len(train) and min(sizes) > 0
+        for use_weights in (True, False):
+            merged = coordinator.retrieve_top_k_batch(test[:40], k=7, use_weights=use_weights)
+            for query, neighbours in zip(test[:40], merged):
+                expected = single.retrieve_top_k(query, k=7, use_weights=use_weights)
+                # Ties (frequent for car) are merged in case base order
+                assert [case for case, _ in neighbours] == [case for case, _ in expected]
+                assert [s for _, s in neighbours] == pytest.approx([s for _, s in expected])
+
+        # k-NN with learning: retained cases are routed to shards and found again
+        cb = single.case_base
+        for query in test[40:70]:
+            solution, cb = single.run_query(cb, query, tuned=True, adapt_fn=knn, learning=True)
+            assert coordinator.solve(query, tuned=True, adapt_fn=coordinator.adapt_knn) == \
+                pytest.approx(solution)
+        assert len(coordinator) == sum(coordinator.shard_sizes()) == len(cb)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_tcp_workers_require_the_shared_secret(energy_data):
+    train, test = energy_data
+    with pytest.raises(ValueError):
+        serve_worker(b'')
+    port = free_port()
+    worker = multiprocessing.Process(target=serve_worker, args=(b'secret', '127.0.0.1', port),
+                                     daemon=True)
+    worker.start()
+    try:
+        system = fitted('energy', train[:200])
+        for _ in range(50):
+            try:
+                coordinator = ShardCoordinator.connect(system, [('127.0.0.1', port)], b'secret')
+                break
+            except ConnectionRefusedError:
+                time.sleep(0.1)
+        with coordinator:
+            assert coordinator.retrieve_top_k(test[0], k=3) == system.retrieve_top_k(test[0], k=3)
+        with pytest.raises(AuthenticationError):
+            ShardCoordinator.connect(system, [('127.0.0.1', port)], b'wrong')
+        with pytest.raises(ValueError):
+            ShardCoordinator.connect(system, [('127.0.0.1', port)], b'')
+    finally:
+        worker.terminate()
+        worker.join(5)
@@ -0,0 +1,48 @@
+"""SharedScores rows equal fresh scoring, and sharing leaves results unchanged."""
+
+import numpy as np
+import pytest
+from car_cbr import CarCBRSystem
+from energy_cbr import EnergyCBRSystem
+from evaluation import SharedScores, evaluate_split
+
+
+def make_system(factory, train, tuned):
+    system = factory()
+    system.set_case_base(train, verbose=False)
+    system.set_tuned_mode() if tuned else system.set_baseline_mode()
+    return system
+
+
+@pytest.mark.parametrize('domain', ['car', 'energy'])
+def test_shared_rows_equal_fresh_scores(domain, car_data, energy_data):
+    factory = CarCBRSystem if domain == 'car' else EnergyCBRSystem
+    train, test = car_data if domain == 'car' else energy_data
+    shared = SharedScores()
+    for tuned in (False, True, True):
+        system = make_system(factory, train, tuned)
+        fresh = make_system(factory, train, tuned)
+        shared.attach(system)
+        cb = system.case_base.copy()
+        for query in test[:30]:
+            expected = fresh.score_case_base(query, use_weights=tuned, case_base=cb)
+            scores = system.score_case_base(query, use_weights=tuned, case_base=cb)
+            np.testing.assert_allclose(scores, expected, rtol=1e-12, atol=0)
+            _, cb = system.run_query(cb, query, tuned=tuned, learning=True)
+        assert len(cb) == len(train) + 30
+    # The second tuned condition reused every row, scoring only retained cases anew
+    n_queries, n_cases = 30, len(train) + 30
+    assert shared.similarities_computed <= 2 * n_queries * n_cases
+    assert shared.similarities_served > shared.similarities_computed
+
+
+@pytest.mark.parametrize('domain', ['car', 'energy'])
+def test_evaluate_split_is_unchanged_by_sharing(domain, car_data, energy_data, monkeypatch):
+    train, test = car_data if domain == 'car' else energy_data
+    test = test[:40]
+    shared = evaluate_split(domain, train, test)
+    monkeypatch.setattr(SharedScores, 'attach', lambda self, system: None)
+    plain = evaluate_split(domain, train, test)
+    assert shared.keys() == plain.keys()
+    for key, metrics in plain.items():
+        assert shared[key] == pytest.approx(metrics), key
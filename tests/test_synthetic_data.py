@@ -0,0 +1,64 @@
+"""Synthetic cases are seeded, follow the source concepts and round-trip through files."""
+
+from collections import Counter
+import numpy as np
+import pytest
+from data_loader import DataLoader
+from synthetic_data import (CarGenerator, EnergyGenerator, generate_cases, generate_queries,
+                            write_cases)
+
+
+@pytest.fixture(scope='module')
+def car_generator(repo_root):
+    return CarGenerator()
+
+
+@pytest.fixture(scope='module')
+def energy_generator(repo_root):
+    return EnergyGenerator(noise=0.0)
+
+
+def test_streams_are_seeded(car_generator):
+    first = list(generate_cases('car', 500, seed=3, chunk_size=64, generator=car_generator))
+    assert first == list(generate_cases('car', 500, seed=3, chunk_size=64, generator=car_generator))
+    assert first != list(generate_cases('car', 500, seed=4, chunk_size=64, generator=car_generator))
+    assert first != list(generate_queries('car', 500, seed=3, chunk_size=64, generator=car_generator))
+
+
+def test_car_cases_follow_the_concept_table(car_generator):
+    concepts = {tuple(case.features.values()): case.solution
+                for case in DataLoader.load_car_data('car.data')}
+    cases = list(generate_cases('car', 20000, seed=1, generator=car_generator))
+    assert all(concepts[tuple(case.features.values())] == case.solution for case in cases)
+    # Uniform over the attribute space, so the class shares match car.data
+    expected = Counter(concepts.values())
+    observed = Counter(case.solution for case in cases)
+    for label, count in expected.items():
+        assert observed[label] / len(cases) == pytest.approx(count / len(concepts), abs=0.02)
+
+
+def test_energy_cases_are_real_designs(energy_generator, energy_data):
+    train, test = energy_data
+    real = {tuple(case.features.values()) for case in train + test}
+    heating = dict(zip(map(id, energy_generator.features), energy_generator.targets[:, 0]))
+    for case in generate_cases('energy', 300, seed=2, generator=energy_generator):
+        assert tuple(case.features.values()) in real
+        assert case.solution == heating[id(case.features)]
+
+
+@pytest.mark.parametrize('domain', ['car', 'energy'])
+def test_written_files_load_as_the_generated_cases(domain, tmp_path, car_generator, energy_generator):
+    generator = car_generator if domain == 'car' else energy_generator
+    path = str(tmp_path / ('cases.data' if domain == 'car' else 'cases.csv'))
+    assert write_cases(domain, 250, path, seed=5, chunk_size=100, generator=generator) == 250
+    generated = list(generate_cases(domain, 250, seed=5, chunk_size=100, generator=generator))
+    if domain == 'car':
+        assert [(case.features, case.solution) for case in DataLoader.load_car_data(path)] == \
+            [(case.features, case.solution) for case in generated]
+    else:
+        loaded = DataLoader.energy_cases_from_table(DataLoader.read_energy_table(path))
+        designs = {tuple(f.values()): design for design, f in enumerate(generator.features)}
+        assert [case.solution for case in loaded] == \
+            pytest.approx([case.solution for case in generated], abs=0.005)
+        assert [tuple(case.features.values()) for case in loaded] == \
+            [tuple(generator.designs[designs[tuple(case.features.values())]]) for case in generated]